@@ -0,0 +1,2 @@
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: долгие проверки на больших моделях (пропуск: -m "not slow")')
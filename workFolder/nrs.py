@@ -2,9 +2,42 @@
 import logging
 from enum import IntEnum
 import warnings
+import os
+import sys
+import time
+import pstats
+import io
+import gc
+import hashlib
+import array
+import json
+import csv
+import struct
+import zipfile
+import shutil
+import itertools
+from collections import Counter, OrderedDict, deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+try:
+    import scipy.sparse as sparse
+    import scipy.sparse.linalg as sparse_linalg
+    import scipy.sparse.csgraph
+except ImportError:
+    sparse = None
 
 logger = logging.getLogger('NRS')
 
+# Счетчик изменений связей элементов НРС.
+# Используется для проверки актуальности скомпилированного порядка расчета (NRS_Plan)
+_topology_version = 0
+
+def _topology_changed():
+    '''Отмечает изменение связей между элементами НРС'''
+    global _topology_version
+    _topology_version += 1
+
 
 
 #======================Перечисление возможных типов элементов======================
@@ -55,16 +88,17 @@ class NRS_Revision(object):
                     Список параметров которые следует распечатать. Если не указан, печатаются все.
         '''
         if e_keys is None:
-            e_keys = list(elmnt.__dict__.keys())
+            # Параметры, которые еще не были рассчитаны (например, L), не печатаются
+            e_keys = [k for k in elmnt.fields if hasattr(elmnt, k)]
 
         for i in e_keys:
             try:
-                v = elmnt.__dict__[i]
+                v = getattr(elmnt, i)
                 try:
                     print(i + ": " + str(v))
                 except:
                     print(i + ": не строчный тип")
-            except KeyError:
+            except AttributeError:
                 print(f'Параметр {i} не существует.')
 
     @staticmethod
@@ -72,14 +106,18 @@ class NRS_Revision(object):
         '''
         Функция возвращает проводимость насадка:
             Вход:
-                q - производительность ствола\n
-                H - напор при котором ствол имеет производительность q\n
+                q - производительность ствола (число или массив)\n
+                H - напор при котором ствол имеет производительность q (число или массив)\n
             Пример:
                 ```
                 calc_p(3.7, 40)
                 >>>0.5850213671311502
+                calc_p([3.7, 7.4], 40)
+                >>>array([0.58502137, 1.17004273])
                 ```
         '''
+        if np.ndim(q) or np.ndim(H):
+            return np.asarray(q, dtype=float)/np.sqrt(np.asarray(H, dtype=float))
         return q/pow(H, 0.5)
     
     @staticmethod
@@ -91,16 +129,24 @@ class NRS_Revision(object):
 
         n - количество рукавов
 
-        s - гидравлическое сопротивление 1 пожарного рукава
+        s - гидравлическое сопротивление 1 пожарного рукава или ключ каталога рукавов (см. NRS_Data.hose_s)
 
         q - Расход воды через сечение рукава
 
+        Аргументы могут быть массивами (вычисление поэлементно с приведением размерностей)
+
         # Пример
             ```
             calc_h(6, 0.13, 7.4)
             >>>42.71280000000001
+            calc_h([6, 4], ['51', '77'], 7.4)
+            >>>array([42.7128,  3.2856])
             ```
         '''
+        if isinstance(s, str) or np.asarray(s).dtype.kind in 'US':
+            s = NRS_Data.hose_s(s)
+        if np.ndim(n) or np.ndim(s) or np.ndim(q):
+            n, s, q = (np.asarray(v, dtype=float) for v in (n, s, q))
         return n*s*(q**2)
 
 
@@ -128,11 +174,16 @@ class NRS_Revision(object):
         # Вход
 
         `elements_list`
-            Список элементов
+            Список элементов или модель НРС (NRS_Model). Для модели поиск выполняется по индексу имен
 
         `name`
             Имя элемента
         '''
+        if isinstance(elements_list, NRS_Model):
+            elmnt = elements_list.getElement(name)
+            if elmnt is None or not return_id_in_list:
+                return elmnt
+            return elements_list.elmnts.index(elmnt)
         for i, elmnt in enumerate(elements_list):
             if elmnt.name == name:
                 if return_id_in_list:
@@ -190,7 +241,7 @@ class NRS_Observer_E(object):
                 NRS_Observer_E. Ссылка на текущий экземпляр наблюдателя
         '''
         for i in self.par_list:
-            self.par_dict[i].append(self.elmnt.__dict__[i])
+            self.par_dict[i].append(getattr(self.elmnt, i))
         return self
 
     def history(self):
@@ -201,6 +252,103 @@ class NRS_Observer_E(object):
         '''
         return self.par_dict
 
+    def fix_final(self):
+        '''
+        Фиксирует итоговое состояние параметров элемента по окончании расчета.\n
+        Обычный наблюдатель фиксирует состояние на каждой итерации, поэтому ничего не делает.
+            Выход:
+                NRS_Observer_E. Ссылка на текущий экземпляр наблюдателя
+        '''
+        return self
+
+
+class NRS_Observer_Ring(NRS_Observer_E):
+    '''
+    Класс наблюдателя с ограниченной историей изменений.\n
+    История хранится в заранее выделенном кольцевом буфере NumPy, поэтому
+    объем памяти не растет при длительных расчетах: сохраняются только
+    последние maxlen зафиксированных состояний.
+    '''
+    def __init__(self, elmnt, par_list, maxlen=1000, stride=1, final_only=False):
+        '''
+        При инициации экземпляра класса передаем ему элемент за которым он 
+        будет наблюдать и список параметров за которыми он будет наблюдать
+            Вход:
+                elmnt: Element. Элемент за которым будет осуществляться наблюдение \n
+                par_list: List. Список параметров за изменением которых будет следить наблюдатель \n
+                maxlen: int. Максимальное количество хранимых состояний \n
+                stride: int. Фиксировать каждое stride-е состояние \n
+                final_only: bool. Фиксировать только итоговое состояние по окончании расчета
+        '''
+        if maxlen<1:
+            raise ValueError("Длина истории должна быть не менее 1")
+        if stride<1:
+            raise ValueError("Шаг фиксации должен быть не менее 1")
+        self.maxlen = maxlen
+        self.stride = stride
+        self.final_only = final_only
+        super().__init__(elmnt, par_list)
+
+    def par_dict_init(self):
+        '''
+        Выделяет буфер истории изменений параметров элемента.\n
+        Может использоваться в том числе для очищения истории изменений
+
+            Выход:
+                NRS_Observer_Ring. Ссылка на текущий экземпляр наблюдателя
+        '''
+        # Каждое состояние пишется в буфер дважды (в позиции k и k+maxlen),
+        # поэтому последние maxlen состояний всегда лежат в буфере непрерывно
+        self.buffer = np.zeros((len(self.par_list), 2*self.maxlen))
+        self.count = 0      # количество зафиксированных состояний
+        self.calls = 0      # количество вызовов fix
+        return self
+
+    def _write(self):
+        '''
+        Запись текущего состояния параметров в буфер
+        '''
+        k = self.count % self.maxlen
+        for j, par in enumerate(self.par_list):
+            self.buffer[j, k] = self.buffer[j, k+self.maxlen] = getattr(self.elmnt, par)
+        self.count += 1
+
+    def fix(self):
+        '''
+        Фиксирует текущее состояние параметров элемента с учетом шага фиксации\n
+            Выход:
+                NRS_Observer_Ring. Ссылка на текущий экземпляр наблюдателя
+        '''
+        if not self.final_only:
+            if self.calls % self.stride == 0:
+                self._write()
+            self.calls += 1
+        return self
+
+    def fix_final(self):
+        '''
+        Фиксирует итоговое состояние параметров элемента по окончании расчета
+        (только для наблюдателя с final_only=True)
+            Выход:
+                NRS_Observer_Ring. Ссылка на текущий экземпляр наблюдателя
+        '''
+        if self.final_only:
+            self._write()
+        return self
+
+    def history(self):
+        '''
+        Возвращает историю изменений параметров элемента за которым наблюдает обозреватель.\n
+        Массивы являются представлениями буфера (без копирования) и упорядочены 
+        от более ранних состояний к более поздним. При последующей фиксации состояний 
+        содержимое представлений может измениться.
+            Выход:
+                Dictionary. Словарь массивов (историй изменений)
+        '''
+        size = min(self.count, self.maxlen)
+        end = self.count % self.maxlen + self.maxlen if self.count>self.maxlen else size
+        return {par: self.buffer[j, end-size:end] for j, par in enumerate(self.par_list)}
+
         
 #=======================Функции расчета расходов================================
 def q_out_simple(elmnt):
@@ -231,11 +379,212 @@ def q_out_nozzle_by_s(elmnt):
     return pow(elmnt.H_in / elmnt.s, 0.5)
 
 
+# Функции расчета расходов по именам - для сохранения и загрузки моделей (см. NRS_Model.save)
+Q_OUT_FUNCS = {}
+
+def register_q_out(func, name=None):
+    '''
+    Регистрация функции расчета расхода под именем, с которым она сохраняется в файлы моделей.
+    Может использоваться как декоратор.
+        Вход:
+            func=callable: функция расчета расхода (принимает элемент, возвращает расход, л/с)
+            name=str: имя функции в файлах моделей (по умолчанию - func.__name__)
+        Выход:
+            func
+    '''
+    Q_OUT_FUNCS[name or func.__name__] = func
+    return func
+
+for _func in (q_out_simple, q_out_nozzle, q_out_nozzle_by_s):
+    register_q_out(_func)
+
+
+#=======================Функции обхода графа НРС================================
+def order_heads(roots):
+    '''
+    Нерекурсивный порядок расчета напоров от элементов roots ко всем следующим за ними элементам.
+    Итог совпадает с распространением напоров в глубину от каждого из roots, при котором напор
+    элемента, достижимого несколькими путями, задается последним проходом. Для этого обход
+    выполняется в обратном порядке (и источников, и потомков), а итоговый порядок - обратный
+    порядку завершения обхода. Каждый элемент посещается один раз.
+        Выход:
+            list(Element) - элементы в порядке расчета\n
+            dict - {id(элемент): ведущий предыдущий элемент}. Для элементов, достигнутых непосредственно из roots - None
+    '''
+    postorder = []
+    parent    = {}
+    for root in reversed(roots):
+        if id(root) in parent:
+            continue
+        parent[id(root)] = None
+        stack = [(root, iter(reversed(root.elements_next)))]
+        while stack:
+            elmnt, children = stack[-1]
+            for child in children:
+                if not id(child) in parent:
+                    parent[id(child)] = elmnt
+                    stack.append((child, iter(reversed(child.elements_next))))
+                    break
+            else:
+                stack.pop()
+                postorder.append(elmnt)
+    postorder.reverse()
+    return postorder, parent
+
+def order_flows(leaves):
+    '''
+    Нерекурсивный порядок расчета расходов от элементов leaves ко всем предшествующим им элементам.
+    Каждый элемент в порядке расположен раньше всех своих предыдущих элементов и посещается один раз.
+        Выход:
+            list(Element) - элементы в порядке расчета
+    '''
+    postorder = []
+    visited   = set()
+    for leaf in leaves:
+        if id(leaf) in visited:
+            continue
+        visited.add(id(leaf))
+        stack = [(leaf, iter(leaf.elements_previous))]
+        while stack:
+            elmnt, parents = stack[-1]
+            for ep in parents:
+                if not id(ep) in visited:
+                    visited.add(id(ep))
+                    stack.append((ep, iter(ep.elements_previous)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(elmnt)
+    postorder.reverse()
+    return postorder
+
+
+#=======================Хранилище параметров элементов===============================
+class ElementStore(object):
+    '''
+    Хранилище параметров элементов НРС в виде столбцов (массивов NumPy).
+    Каждому элементу выделяется строка (слот) хранилища, элемент (Element) лишь ссылается на нее.
+    Модель владеет собственным хранилищем, элементы вне моделей размещаются в общем хранилище.
+    Расчетные методы работают непосредственно со столбцами хранилища.
+    '''
+    # Столбцы хранилища
+    columns = ('s', 'n', 'p', 'z', 'H_in', 'H_add', 'h', 'q', 'l', 'H_out')
+
+    def __init__(self, capacity=64):
+        '''
+        Вход:
+            capacity=int: начальная емкость хранилища (количество слотов)
+        '''
+        self.capacity = capacity
+        self.size     = 0       # количество использованных слотов (включая освобожденные)
+        self.free     = []      # освобожденные слоты
+        self.version  = 0       # счетчик освобождения слотов (для проверки актуальности NRS_Plan)
+        self.dirty    = set()   # слоты элементов, параметры которых изменены после последнего расчета
+        self.data     = {c: np.zeros(capacity) for c in self.columns}
+
+    def alloc(self):
+        '''
+        Выделение слота
+            Выход:
+                int: номер слота
+        '''
+        if self.free:
+            return self.free.pop()
+        if self.size==self.capacity:
+            self.capacity += self.capacity//2
+            for c, col in self.data.items():
+                new_col = np.zeros(self.capacity)
+                new_col[:self.size] = col
+                self.data[c] = new_col
+        self.size += 1
+        return self.size-1
+
+    def release(self, i):
+        '''Освобождение слота. Опустевшее хранилище сжимается до начальной емкости'''
+        self.free.append(i)
+        self.dirty.discard(i)
+        self.version += 1
+        if len(self.free)==self.size:
+            self.size = 0
+            self.free = []
+            if self.capacity>64:
+                self.capacity = 64
+                self.data = {c: np.zeros(self.capacity) for c in self.columns}
+
+    def trim(self):
+        '''Сокращение емкости хранилища до количества использованных слотов'''
+        if self.capacity>max(self.size, 64):
+            self.capacity = max(self.size, 64)
+            self.data = {c: col[:self.capacity].copy() for c, col in self.data.items()}
+
+    def adopt(self, elmnt):
+        '''
+        Перенос параметров элемента в текущее хранилище
+            Вход:
+                elmnt=Element: переносимый элемент
+        '''
+        old, j = elmnt._store, elmnt._i
+        if old is self:
+            return
+        i = self.alloc()
+        for c, col in self.data.items():
+            col[i] = old.data[c][j]
+        old.release(j)
+        elmnt._store, elmnt._i = self, i
+
+    def __len__(self):
+        return self.size-len(self.free)
+
+
+# Общее хранилище элементов, не включенных в модели
+_detached = ElementStore()
+# Признак элемента стороннего класса без ссылки на модель (см. NRS_Model._contains)
+_NO_OWNER = object()
+
+
+def _column(name, doc, integer=False, track=False):
+    '''
+    Свойство элемента, хранящееся в столбце хранилища
+        Вход:
+            integer=False: возвращать целое значение, если оно целое
+            track=False: отмечать элемент как измененный при записи (True - всегда,
+                'root' - только для элементов без предыдущих, у которых параметр задается извне)
+    '''
+    def fget(self):
+        v = self._store.data[name].item(self._i)
+        if integer and v.is_integer():
+            return int(v)
+        return v
+    def fset(self, value):
+        self._store.data[name][self._i] = value
+        if track and (track is True or not self.elements_previous):
+            self._store.dirty.add(self._i)
+    return property(fget, fset, doc=doc)
+
+
 #=======================Класс элемента НРС (узла)===============================
 class Element(object):
     '''
     Класс элемента НРС.
+    Числовые параметры элемента хранятся в хранилище (ElementStore) модели, сам элемент - лишь ссылка на них.
     '''
+    __slots__ = ('_store', '_i', '_name', '_owner', 'elements_next', 'elements_previous',
+                 'type', '_q_out', 'observer', 'ri', 'ro', 'L')
+
+    # Перечень параметров элемента (для печати и наблюдения)
+    fields = ('elements_next', 'elements_previous', 'type', 'name', 'q', 's', 'H_in', 'h', 'z', 'p', 'n',
+              'q_out', 'H_add', 'observer', 'l', 'ri', 'ro', 'H_out', 'L')
+
+    q     = _column('q',     'Расход через элемент, л/с')
+    s     = _column('s',     'Гидравлическое сопротивление элемента', track=True)
+    H_in  = _column('H_in',  'Напор на входе в элемент, м', track='root')
+    h     = _column('h',     'Потери напора на элементе, м')
+    z     = _column('z',     'Перепад высот на элементе, м', track=True)
+    p     = _column('p',     'Проводимость элемента', track=True)
+    n     = _column('n',     'Количество единиц элемента', integer=True, track=True)
+    H_add = _column('H_add', 'Дополнительный напор на элементе, м', track=True)
+    l     = _column('l',     'Длина единицы элемента, м')
+    H_out = _column('H_out', 'Напор на выходе из элемента, м')
 
     def __init__(self,
                  name:   str,
@@ -281,8 +630,12 @@ class Element(object):
 
             `q_out` = q_out_simple: функция расчета расхода на выходе из элемента
         '''
+        self._store = _detached
+        self._i = _detached.alloc()
+        self._q_out = None
         self.elements_next=[]
         self.elements_previous=[]
+        self._owner=None            # Модель, в которую включен элемент (список - если моделей несколько), см. _models
 
         self.type = e_type
         self.name = name
@@ -303,6 +656,97 @@ class Element(object):
         self.ro = ro
         # self.h=0
 
+    @property
+    def q_out(self):
+        '''Функция расчета расхода на выходе из элемента'''
+        return self._q_out
+
+    @q_out.setter
+    def q_out(self, func):
+        self._q_out = func
+        self._store.dirty.add(self._i)
+
+    @property
+    def name(self):
+        '''Имя элемента'''
+        return self._name
+
+    @name.setter
+    def name(self, new_name):
+        '''Переименование элемента с обновлением индексов имен моделей, в которые он включен'''
+        old_name = getattr(self, '_name', None)
+        self._name = new_name
+        for model in self._models():
+            model._renameElement(self, old_name, new_name)
+
+    def _models(self):
+        '''Модели, в которые включен элемент (для обновления их индексов имен)'''
+        owner = self._owner
+        if owner is None:
+            return ()
+        return owner if isinstance(owner, list) else (owner,)
+
+    def _addModel(self, model):
+        '''Отметка о включении элемента в модель. Обычно модель одна, и список моделей не создается'''
+        owner = self._owner
+        if owner is None:
+            self._owner = model
+        elif isinstance(owner, list):
+            owner.append(model)
+        else:
+            self._owner = [owner, model]
+
+    def _dropModel(self, model):
+        '''Отметка об исключении элемента из модели'''
+        owner = self._owner
+        if owner is model:
+            self._owner = None
+        elif isinstance(owner, list) and model in owner:
+            owner.remove(model)
+            if len(owner)==1:
+                self._owner = owner[0]
+
+    def __del__(self):
+        # Слот хранилища освобождается вместе с элементом
+        store = getattr(self, '_store', None)
+        if store is not None:
+            store.release(self._i)
+
+    def __copy__(self):
+        '''
+        Поверхностная копия элемента: параметры копируются в новый слот общего хранилища
+        (иначе копия и оригинал изменяли бы параметры друг друга, а освобождение слота копии -
+        параметры нового элемента), списки связей и функции - общие, копия не включена в модели
+        '''
+        elmnt = Element.__new__(type(self))
+        elmnt._store = _detached
+        elmnt._i = _detached.alloc()
+        for c, col in _detached.data.items():
+            col[elmnt._i] = self._store.data[c][self._i]
+        for attr in Element.__slots__:
+            if attr not in ('_store', '_i', '_owner') and hasattr(self, attr):
+                object.__setattr__(elmnt, attr, getattr(self, attr))
+        elmnt._owner = None
+        return elmnt
+
+    @classmethod
+    def _attach(cls, model, i, name, e_type, ri, ro, q_out):
+        '''
+        Создание элемента модели по уже заполненному слоту ее хранилища (без записи параметров, 
+        связей и индексации имен) - для быстрой загрузки моделей (см. NRS_Model.from_arrays)
+        '''
+        elmnt = cls.__new__(cls)
+        elmnt._store  = model.store
+        elmnt._i      = i
+        elmnt._name   = name
+        elmnt._owner  = model
+        elmnt._q_out  = q_out
+        elmnt.type     = e_type
+        elmnt.observer = None
+        elmnt.ri = ri
+        elmnt.ro = ro
+        return elmnt
+
     def append(self, elmnt):
         '''
         Подключает элемент к выходу текущего
@@ -318,10 +762,11 @@ class Element(object):
             if elmnt.ri>len(elmnt.elements_previous):
                 self.elements_next.append(elmnt)
                 elmnt.elements_previous.append(self)
+                _topology_changed()
             else:
-                logger.debug(f'У элемента {elmnt.name} нет дополнительных входов для подключения {self.name}')
+                logger.debug('У элемента %s нет дополнительных входов для подключения %s', elmnt.name, self.name)
         else:
-            logger.debug(f'У элемента {self.name} нет дополнительных выходов для подключения {elmnt.name}')
+            logger.debug('У элемента %s нет дополнительных выходов для подключения %s', self.name, elmnt.name)
         return elmnt
 
     def addToModel(self, model):
@@ -345,6 +790,16 @@ class Element(object):
             self.observer.fix()
         return self
 
+    def fixFinalState(self):
+        '''
+        Фиксирует итоговое состояние параметров элемента по окончании расчета
+            Выход:
+                ссылка на текущий элемент
+        '''
+        if self.observer:
+            self.observer.fix_final()
+        return self
+
     def history(self):
         '''
         Возвращает историю изменений элемента
@@ -384,6 +839,7 @@ class Element(object):
             self.elements_next=[]
             self.elements_previous=[]
 
+        _topology_changed()
         return self
 
     def set_ri(self, new_val):
@@ -398,6 +854,7 @@ class Element(object):
                 pe = self.elements_previous.pop(0)
                 pe.elements_next.remove(self)
                 # self.delElement(pe)
+            _topology_changed()
         return self
 
     def set_ro(self, new_val):
@@ -412,6 +869,7 @@ class Element(object):
                 ne = self.elements_next.pop(0)
                 ne.elements_previous.remove(self)
                 # self.delElement(ne)
+            _topology_changed()
 
         return self
 
@@ -478,399 +936,3847 @@ class Element(object):
         self.L = self.n * self.l
         return self.L
 
-    # Рекурсивная установка значений
+    # Установка значений с распространением по графу (без рекурсии, см. order_heads, order_flows)
     def set_H_in(self, H_in):
         '''
         Устанавливает напор на входе для текущего элемента, 
-        а также далее запускает рекурсивный перерасчет напоров 
+        а также далее запускает перерасчет напоров 
         для всех следующих после текущего элементов
             Вход:
                 H_in=float: напор на входе в элемент, м
         '''
         self.H_in = H_in
-        for elmnt in self.elements_next:
-            elmnt.set_H_in(self.get_H_out())
+        self._store.dirty.add(self._i)
+        elmnts, parent = order_heads([self])
+        H_out = {}
+        for elmnt in elmnts:
+            p = parent[id(elmnt)]
+            if p is not None:
+                elmnt.H_in = H_out[id(p)]
+            if elmnt.elements_next:
+                H_out[id(elmnt)] = elmnt.get_H_out()
 
     def set_q_zero(self):
         '''
         Устанавливает нулевой расход для текущего элемента, 
-        а также далее запускает рекурсивный перерасчет расходов 
+        а также далее запускает перерасчет расходов 
         для всех предыдущих относительно текущего элементов. \n
         Используется для очищения значений расходов при расчете.
         '''
-        self.q=0
-        for elmnt in self.elements_previous:
-            elmnt.set_q_zero()
+        for elmnt in order_flows([self]):
+            elmnt.q=0
 
     def set_q(self, q):
         '''
         Устанавливает расход для текущего элемента,
-        а также далее запускает рекурсивный перерасчет расходов 
+        а также далее запускает перерасчет расходов 
         для всех предыдущих относительно текущего элементов.\n
         Для каждого элемента происходит суммирование в том случае,
         если элемент является водосборником \n
         Если к элементу подключено несколько других элементов на вход
         Расход к ним разделяется поровну (в данной реализации).
         '''
-        self.q+=q
-        for elmnt in self.elements_previous:
-            elmnt.set_q(q/len(self.elements_previous))
+        acc = {id(self): q}
+        for elmnt in order_flows([self]):
+            q = acc.pop(id(elmnt), 0)
+            elmnt.q+=q
+            prev = elmnt.elements_previous
+            for ep in prev:
+                acc[id(ep)] = acc.get(id(ep), 0) + q/len(prev)
             # Тут нужно разобраться
             # if elmnt.type == 0:
             #     elmnt.H_add = self.h + self.H_in
 
-class NRS_Model(object):
+def _exclude(items, elmnts, drop):
     '''
-    Класс модели НРС
+    Исключение элементов elmnts (drop - их множество) из списка items на месте.
+    Немногие элементы удаляются по позициям, иначе список перестраивается за один проход.
     '''
-    # 'name'
-    # elmnts=[]                 # Коллекция всх элементов модели
-    # elmnts_in=[]              # Коллекция элементов с входящим потоком (для которых выполняется расчет) - для промежуточных не выполняется
-    # elmnts_out=[]             # Коллекция элементов с выходящим потоком (для стволов)
+    if len(elmnts)*64<len(items):
+        for elmnt in elmnts:
+            del items[items.index(elmnt)]
+    else:
+        items[:] = [elmnt for elmnt in items if not elmnt in drop]
 
-    def __init__(self, name):
-        '''
-        Инициация класса
-            Вход:
-                name=string: имя модели
-        '''
-        self.name       = name
-        self.elmnts     = []
-        self.elmnts_in  = []
-        self.elmnts_out = []
-        self.counter    = 0
+def _listing(items, limit=10):
+    '''
+    Краткий перечень значений для сообщений об ошибках (не более limit)
+    '''
+    items = [str(item) for item in items]
+    more = f' и еще {len(items)-limit}' if len(items)>limit else ''
+    return ', '.join(items[:limit]) + more
 
+def _table_columns(table, index='name'):
+    '''
+    Приведение таблицы к словарю столбцов {имя столбца: list}.
+        Вход:
+            table: список словарей (строк), словарь столбцов {столбец: список значений},
+                словарь строк {значение index: словарь}, список кортежей
+                или pandas.DataFrame (индекс таблицы без столбца index становится столбцом index)
+            index='name': имя столбца - ключа строк (None - без ключа)
+        Выход:
+            (dict - столбцы, int - количество строк). Отсутствующие в строках значения - None
+    '''
+    if hasattr(table, 'columns') and hasattr(table, 'to_dict'):
+        columns = {str(c): table[c].tolist() for c in table.columns}
+        if index is not None and not index in columns:
+            columns[index] = table.index.tolist()
+        return columns, len(table)
+    if isinstance(table, dict):
+        values = list(table.values())
+        if values and all(isinstance(row, dict) for row in values):
+            rows = [dict(row, **{index: key}) for key, row in table.items()]
+        else:
+            columns = {str(c): list(v) for c, v in table.items()}
+            sizes = set(map(len, columns.values()))
+            if len(sizes)>1:
+                raise ValueError('Столбцы таблицы имеют разную длину')
+            return columns, sizes.pop() if sizes else 0
+    else:
+        rows = list(table)
+    if rows and not isinstance(rows[0], dict):
+        return {k: list(column) for k, column in enumerate(zip(*rows))}, len(rows)
+    keys = dict.fromkeys(key for row in rows for key in row)
+    return {str(key): [row.get(key) for row in rows] for key in keys}, len(rows)
 
-    def appendElement(self, elmnt):
-        '''
-        Добавляет элемент в модель
-            Вход:
-                elmnt=Element: Элемент для добавления в модель НРС
-            Выход:
-                NRS_Model: ссылка на текущую модель
-        '''
-        self.counter+=1
-        if elmnt.name=='':
-            elmnt.name=str(self.counter)
-        logger.info("Новый элемент НРС: " + elmnt.name)
-        
-        # добавление в основной список
-        self.elmnts.append(elmnt)
-        # # Добавление в дополнительные списки
-        # if elmnt.type==0:
-        #     self.elmnts_in.append(elmnt)
-        # elif elmnt.type==2:
-        #     self.elmnts_out.append(elmnt)
 
-        return self
+#=======================Скомпилированный порядок расчета НРС===============================
+class NRS_Plan(object):
+    '''
+    Скомпилированный (плоский) порядок расчета НРС.
+    Граф элементов модели разворачивается в топологически упорядоченный список
+    с целочисленными массивами индексов родителей и потомков, благодаря чему
+    за одну итерацию расчета каждый элемент посещается ровно один раз:
+    один прямой проход по напорам и один обратный проход по расходам.
+    Если все элементы плана размещены в одном хранилище (ElementStore),
+    проходы выполняются непосредственно по его столбцам.
+    '''
 
-    def addElements(self, elmnts, interpretate=False):
+    def __init__(self, model):
         '''
-        Добавляет элементы в модель
+        Компиляция порядка расчета модели
             Вход:
-                elmnts=List(Element): Список элементов для добавления в модель НРС
-                interpretate=False: Если равно True, происходит автоматическая интерпретация 
-                (распределение по спискам входящих и выходящих элементов)
-                элементов модели
-            Выход:
-                NRS_Model: ссылка на текущую модель
+                model=NRS_Model: модель для которой строится порядок расчета
         '''
-        for elmnt in elmnts:
-            if not elmnt in self.elmnts:
-                self.appendElement(elmnt)
-        if interpretate:
-            self.interpretate()
+        self.version = _topology_version
+        self.ids_in  = tuple(id(elmnt) for elmnt in model.elmnts_in)
+        self.ids_out = tuple(id(elmnt) for elmnt in model.elmnts_out)
 
-        return self
+        # Индексация всех элементов участвующих в расчете
+        self.elmnts = []
+        self.index  = {}
 
-    def delElement(self, elmnt:Element, fire_dead_elements=True):
-        '''
-        Удаляем элемент как объект
-        '''
-        if fire_dead_elements:
-            elmnt.drop_links(linked_elements=True, current_element=False)
-            for en in elmnt.elements_next:
-                self.fire_dead_elements_try(en)
-            for ep in elmnt.elements_previous:
-                self.fire_dead_elements_try(ep)
-            elmnt.drop_links(linked_elements=False, current_element=True)
-        else:
-            elmnt.drop_links(linked_elements=True, current_element=True)
+        # Прямой проход (напоры): порядок и "ведущий" родитель каждого элемента
+        self.order_H, self.parent_H = self._compile_heads(model.elmnts_in)
+        self.has_next = [len(elmnt.elements_next)>0 for elmnt in self.elmnts]
 
+        # Обратный проход (расходы): элементы от стволов к насосам
+        self.order_q = self._compile_flows(model.elmnts_out)
+        self.out = [self.index[id(elmnt)] for elmnt in model.elmnts_out]
 
-        if elmnt in self.elmnts:
-            self.elmnts.remove(elmnt)
-        if elmnt in self.elmnts_in:
-            self.elmnts_in.remove(elmnt)
-        if elmnt in self.elmnts_out:
-            self.elmnts_out.remove(elmnt)
+        # Массивы индексов родителей и потомков в формате CSR
+        self.prev_ptr, self.prev_idx = self._csr('elements_previous')
+        self.next_ptr, self.next_idx = self._csr('elements_next')
 
+        # Слоты элементов плана в хранилище
+        # (элементы сторонних классов без хранилища - слот -1, проходы ведутся по атрибутам элементов)
+        stores = {id(getattr(elmnt, '_store', None)): getattr(elmnt, '_store', None) for elmnt in self.elmnts}
+        self.store = stores.popitem()[1] if len(stores)==1 else None
+        self.store_version = self.store.version if self.store else None
+        self.slots   = np.array([getattr(elmnt, '_i', -1) for elmnt in self.elmnts], dtype=np.intp)
+        self.slots_q = self.slots[self.order_q]
 
-    def fire_dead_elements_try(self, elmnt: Element):
+        # Позиции элементов в порядках проходов (-1 - элемент в проходе не участвует)
+        # и индексы элементов по слотам (-1 - слот не принадлежит плану) - для частичного пересчета (см. affected)
+        self.pos_H = self._positions(self.order_H)
+        self.pos_q = self._positions(self.order_q)
+        self.is_out = [False]*len(self.elmnts)
+        for i in self.out:
+            self.is_out[i] = True
+        stored = self.slots>=0
+        self.slot_index = np.full(int(self.slots.max())+1 if stored.any() else 0, -1, dtype=np.intp)
+        self.slot_index[self.slots[stored]] = np.arange(len(self.slots))[stored]
+
+        # Замкнутый контур элементов: проходы по напорам и расходам для него не применимы.
+        # Кроме колец по направлению связей учитываются контуры из параллельных линий
+        # (разветвление -> несколько путей -> водосборник): напоры на входах водосборника различны
+        self.cycle  = self._find_cycle()
+        self.ring   = len(self.cycle)>0     # кольцо по направлению связей: проходы невозможны
+        if not self.ring:
+            self.cycle = self._find_loop()
+        self.cyclic = len(self.cycle)>0
+
+    def _get_index(self, elmnt):
+        '''Возвращает индекс элемента в плане (при необходимости регистрирует элемент)'''
+        i = self.index.get(id(elmnt))
+        if i is None:
+            i = len(self.elmnts)
+            self.index[id(elmnt)] = i
+            self.elmnts.append(elmnt)
+        return i
+
+    def _compile_heads(self, elmnts_in):
         '''
-        Рекурсивная попытка удалить мертвые элементы из модели
+        Построение порядка прямого прохода (см. order_heads)
+            Выход:
+                список индексов в порядке расчета, список индексов ведущих родителей (-1 - напор не меняется)
         '''
-        # print('Проверка элемента:', elmnt.name)
-        if elmnt.type==0 and len(elmnt.elements_next)==0:
-            elmnt.drop_links(linked_elements=True, current_element=False)
-            for ep in elmnt.elements_previous:
-                self.fire_dead_elements_try(ep)
-            self.delElement(elmnt)
-        elif elmnt.type==1 and (len(elmnt.elements_next)==0 or len(elmnt.elements_previous)==0):
-            elmnt.drop_links(linked_elements=True, current_element=False)
-            for en in elmnt.elements_next:
-                self.fire_dead_elements_try(en)
-            for ep in elmnt.elements_previous:
-                self.fire_dead_elements_try(ep)
-            self.delElement(elmnt)
-        elif elmnt.type==2 and len(elmnt.elements_previous)==0:
-            elmnt.drop_links(linked_elements=True, current_element=False)
-            for en in elmnt.elements_next:
-                self.fire_dead_elements_try(en)
-            self.delElement(elmnt)
-        return self
+        elmnts, parent = order_heads(elmnts_in)
+        order = [self._get_index(elmnt) for elmnt in elmnts]
+        position = {i: k for k, i in enumerate(order)}
+        parent_H = {}
+        for i in order:
+            elmnt = self.elmnts[i]
+            p = parent[id(elmnt)]
+            if p is None:
+                # Элемент-источник: напор на входе меняется только если к нему подключены рассчитываемые элементы
+                candidates = [self.index[id(ep)] for ep in elmnt.elements_previous if id(ep) in parent]
+                parent_H[i] = max(candidates, key=position.get) if candidates else -1
+            else:
+                parent_H[i] = self.index[id(p)]
+        return order, [parent_H.get(i, -1) for i in range(len(self.elmnts))]
 
-    def getElement(self, name):
+    def _compile_flows(self, elmnts_out):
         '''
-        Возвращает элемент модели с указанным name. 
-        Если элемент не найден, возвращается None.
+        Построение порядка обратного прохода (см. order_flows)
+            Выход:
+                список индексов в порядке расчета
+        '''
+        return [self._get_index(elmnt) for elmnt in order_flows(elmnts_out)]
 
-        # Вход
+    def _positions(self, order):
+        '''Позиции элементов в порядке прохода (массив array без отдельных объектов чисел)'''
+        pos = array.array('q', [-1])*len(self.elmnts)
+        for k, i in enumerate(order):
+            pos[i] = k
+        return pos
 
-        `name`
-            Имя элемента
-        '''
+    def _csr(self, attr):
+        '''Массивы смежности (ptr, idx) по указанному списку связей элементов плана'''
+        ptr = array.array('q', [0])
+        idx = []
         for elmnt in self.elmnts:
-            if name == elmnt.name:
-                return elmnt
-        return None
+            for linked in getattr(elmnt, attr):
+                i = self.index.get(id(linked))
+                if i is not None:
+                    idx.append(i)
+            ptr.append(len(idx))
+        return ptr, idx
 
-
-    def interpretate(self):
+    def _find_cycle(self):
         '''
-        Интерпретация 
-        (распределеине по спискам входящих и выходящих элементов)
-        элементов модели
+        Поиск замкнутого контура в графе элементов плана (по связям elements_next)
             Выход:
-                NRS_Model: ссылка на текущую модель
+                list - индексы элементов одного контура в порядке связей (пустой список - контуров нет)
         '''
-        for elmnt in self.elmnts:
-            if elmnt.type==0 and not elmnt in self.elmnts_in:
-                self.elmnts_in.append(elmnt)
-            elif elmnt.type==2 and not elmnt in self.elmnts_out:
-                self.elmnts_out.append(elmnt)
-        # logger.warning("Функция `interpretate` устарела и в будущем будет удалена. Ее использование настоятельно не рекомендуется!")
-        return self
+        ne = len(self.elmnts)
+        next_ptr, next_idx = self.next_ptr, self.next_idx
+        # Последовательное исключение элементов без предыдущих: остаются контуры и элементы после них
+        count = [0]*ne
+        for j in next_idx:
+            count[j] += 1
+        stack = [i for i in range(ne) if count[i]==0]
+        while stack:
+            i = stack.pop()
+            for k in range(next_ptr[i], next_ptr[i+1]):
+                j = next_idx[k]
+                count[j] -= 1
+                if count[j]==0:
+                    stack.append(j)
+        left = next((i for i in range(ne) if count[i]>0), None)
+        if left is None:
+            return []
+        # У каждого оставшегося элемента есть оставшийся предыдущий: движение назад замыкается в контур
+        seen = {}
+        path = []
+        i = left
+        while not i in seen:
+            seen[i] = len(path)
+            path.append(i)
+            i = next(self.prev_idx[k] for k in range(self.prev_ptr[i], self.prev_ptr[i+1]) if count[self.prev_idx[k]]>0)
+        cycle = path[seen[i]:]
+        cycle.reverse()
+        return cycle
 
-    def clear(self):
+    def _find_loop(self):
         '''
-        Очистка списков элементов
+        Поиск контура в графе элементов плана без учета направления связей (объединение множеств):
+        связей больше, чем элементов за вычетом связных частей
+            Выход:
+                list - индексы элементов одного контура (пустой список - контуров нет)
         '''
-        self.elmnts=[]
-        self.elmnts_in=[]
-        self.elmnts_out=[]
-        self.counter=0
-        return self
+        ne = len(self.elmnts)
+        parent = list(range(ne))
+        def find(i):
+            while parent[i]!=i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        # Связи остова: связь, соединяющая элементы одной части, замыкает контур
+        tree = [[] for _ in range(ne)]
+        next_ptr, next_idx = self.next_ptr, self.next_idx
+        for i in range(ne):
+            for k in range(next_ptr[i], next_ptr[i+1]):
+                j = next_idx[k]
+                a, b = find(i), find(j)
+                if a==b:
+                    return self._tree_path(tree, j, i)
+                parent[a] = b
+                tree[i].append(j)
+                tree[j].append(i)
+        return []
 
-    def addElementsIn(self, elmnts):
+    @staticmethod
+    def _tree_path(tree, start, end):
+        '''Путь между элементами по связям остова (поиск в ширину)'''
+        prev = {start: None}
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            if i==end:
+                break
+            for j in tree[i]:
+                if not j in prev:
+                    prev[j] = i
+                    queue.append(j)
+        path = []
+        while end is not None:
+            path.append(end)
+            end = prev[end]
+        path.reverse()
+        return path
+
+    def check_acyclic(self, loops=True):
         '''
-        Добавляет элементы в список элементов-источников (насосы и прочее)
+        Проверка отсутствия замкнутых контуров (ValueError) - для проходов по напорам и расходам
             Вход:
-                elmnts=List(Element): Список элементов для добавления в список элементов-источников 
-            Выход:
-                NRS_Model: ссылка на текущую модель
+                loops=bool: отклонять ли контуры из параллельных линий (False - только кольца
+                по направлению связей, для которых проходы невозможны; для параллельных линий 
+                проходы дают приближенное распределение расхода)
         '''
-        self.elmnts_in=elmnts
-        return self
+        if self.ring or (loops and self.cyclic):
+            names = ' -> '.join(self.elmnts[i].name for i in self.cycle)
+            raise ValueError(f'НРС содержит замкнутый контур ({names}), расчет возможен только методом Ньютона')
 
-    def addElementsOut(self, elmnts):
+    def is_actual(self, model):
+        '''Проверка соответствия плана текущей топологии модели'''
+        return (self.version == _topology_version
+                and (self.store is None or self.store.version == self.store_version)
+                and self.ids_in == tuple(id(elmnt) for elmnt in model.elmnts_in)
+                and self.ids_out == tuple(id(elmnt) for elmnt in model.elmnts_out))
+
+    def column(self, name):
         '''
-        Добавляет элементы в список элементов-расхода (стволы и прочее)
+        Значения параметра элементов плана
             Вход:
-                elmnts=List(Element): Список элементов для добавления в список элементов-расхода 
+                name=str: имя столбца хранилища (см. ElementStore.columns)
             Выход:
-                NRS_Model: ссылка на текущую модель
+                np.array: значения в порядке элементов плана
         '''
-        self.elmnts_out=elmnts
-        return self
+        if self.store is not None:
+            return self.store.data[name][self.slots]
+        return np.array([getattr(elmnt, name) for elmnt in self.elmnts], dtype=float)
 
-    def build(self, elmnt, interpretate=True):
+    def set_column(self, name, values):
         '''
-        Построение модели из единственного элемента
+        Запись значений параметра элементов плана
             Вход:
-                `elmnt`: Element 
-                Стартовый элемент от которого будет происходить построение модели\n
-                `interpretate`: bool = True 
-                Если равно True, происходит автоматическая интерпретация 
-                (распределение по спискам входящих и выходящих элементов)
-                элементов модели
+                name=str: имя столбца хранилища (см. ElementStore.columns)
+                values=array: значения в порядке элементов плана
         '''
-        self._elementAdd(elmnt)
-        
-        if interpretate:
-            self.interpretate()
-
-        return self
+        if self.store is not None:
+            self.store.data[name][self.slots] = values
+        else:
+            for elmnt, v in zip(self.elmnts, values):
+                setattr(elmnt, name, float(v))
 
-    def _elementAdd(self, elmnt):
+    def head_pass(self, approved_H=120):
         '''
-        Рекурсивное добавление элементов в модель
-            Вход:
-                elmnt=Element: элемент который следует добавить модель. 
-                Далее _elementAdd будет вызвана для всех подключенных к нему элементов
+        Прямой проход: расчет напоров на входе элементов от источников к стволам.
+        Как и get_H_out, вызывает ValueError при выходе напора за пределы [0, approved_H].
         '''
-        if not elmnt in self.elmnts:
-            self.appendElement(elmnt)
-            for linked in elmnt.elements_next:
-                self._elementAdd(linked)
-            for linked in elmnt.elements_previous:
-                self._elementAdd(linked)
+        parent_H = self.parent_H
+        has_next = self.has_next
+        if self.store is None:
+            elmnts = self.elmnts
+            H_out  = [0.0]*len(elmnts)
+            for i in self.order_H:
+                elmnt = elmnts[i]
+                p = parent_H[i]
+                if p >= 0:
+                    elmnt.H_in = H_out[p]
+                if has_next[i]:
+                    H_out[i] = elmnt.get_H_out(approved_H)
+            return
+
+        data  = self.store.data
+        slots = self.slots
+        s, n, q, H_add, z = (data[c][slots].tolist() for c in ('s', 'n', 'q', 'H_add', 'z'))
+        H_in, h, H_out = (data[c][slots].tolist() for c in ('H_in', 'h', 'H_out'))
+        try:
+            for i in self.order_H:
+                p = parent_H[i]
+                if p >= 0:
+                    H_in[i] = H_out[p]
+                if has_next[i]:
+                    h[i] = s[i] * n[i] * q[i]**2
+                    new_H = H_in[i] + H_add[i] - h[i] - z[i]
+                    if new_H>approved_H:
+                        raise ValueError(f"Напор не может быть выше {approved_H}!")
+                    if new_H<0:
+                        raise ValueError("Напор не может быть меньше 0!")
+                    H_out[i] = new_H
+        finally:
+            data['H_in'][slots]  = H_in
+            data['h'][slots]     = h
+            data['H_out'][slots] = H_out
+
+    def flow_reset(self):
+        '''
+        Обнуление расходов элементов, участвующих в обратном проходе
+        '''
+        if self.store is None:
+            for i in self.order_q:
+                self.elmnts[i].q = 0
+        else:
+            self.store.data['q'][self.slots_q] = 0
+
+    def flow_pass(self, reset=True):
+        '''
+        Обратный проход: обнуление (при reset=True, см. flow_reset) и расчет расходов от стволов к источникам.
+        Расход элемента делится поровну между всеми предыдущими элементами.
+        '''
+        elmnts   = self.elmnts
+        prev_ptr = self.prev_ptr
+        prev_idx = self.prev_idx
+        if reset:
+            self.flow_reset()
+        acc = [0.0]*len(elmnts)
+        for i in self.out:
+            acc[i] += elmnts[i].get_q_out()
+        for i in self.order_q:
+            q = acc[i]
+            start, end = prev_ptr[i], prev_ptr[i+1]
+            if end>start:
+                q = q/(end-start)
+                for k in range(start, end):
+                    acc[prev_idx[k]] += q
+        if self.store is None:
+            for i in self.order_q:
+                elmnts[i].q += acc[i]
+        else:
+            self.store.data['q'][self.slots_q] = [acc[i] for i in self.order_q]
+
+
+    def affected(self, slots):
+        '''
+        Определение части плана, затрагиваемой изменением параметров элементов.\n
+        Изменение параметров элемента меняет напоры ниже по потоку от него, изменение напора 
+        на стволе - его расход, а изменение расхода - расходы на пути к источникам 
+        и, через потери на элементах с сопротивлением, напоры ниже по этим элементам.
+            Вход:
+                slots=iterable: слоты измененных элементов в хранилище
+            Выход:
+                (список индексов для прямого прохода, список индексов для обратного прохода, 
+                список индексов стволов, словарь вкладов в расход от элементов вне части) - 
+                списки в порядке расчета
+        '''
+        data  = self.store.data
+        s, n  = data['s'], data['n']
+        sl    = self.slots
+        next_ptr, next_idx = self.next_ptr, self.next_idx
+        prev_ptr, prev_idx = self.prev_ptr, self.prev_idx
+
+        index = self.slot_index
+        stack_H = [int(index[slot]) for slot in slots if slot<len(index) and index[slot]>=0]
+        stack_q = list(stack_H)
+        heads, flows = set(), set()
+        while stack_H or stack_q:
+            while stack_H:
+                i = stack_H.pop()
+                if i in heads:
+                    continue
+                heads.add(i)
+                stack_H.extend(next_idx[next_ptr[i]:next_ptr[i+1]])
+                if self.is_out[i]:
+                    stack_q.append(i)
+            while stack_q:
+                i = stack_q.pop()
+                if i in flows:
+                    continue
+                flows.add(i)
+                stack_q.extend(prev_idx[prev_ptr[i]:prev_ptr[i+1]])
+                if not i in heads and s[sl[i]]*n[sl[i]]!=0:
+                    stack_H.append(i)
+
+        part = heads | flows
+        pos_H, pos_q = self.pos_H, self.pos_q
+        order_H = sorted((i for i in part if pos_H[i]>=0), key=pos_H.__getitem__)
+        order_q = sorted((i for i in part if pos_q[i]>=0), key=pos_q.__getitem__)
+
+        # Вклад в расход от неизменных потомков (в ходе пересчета части не меняется)
+        q = data['q']
+        base = dict.fromkeys(order_q, 0.0)
+        for i in order_q:
+            for c in next_idx[next_ptr[i]:next_ptr[i+1]]:
+                if not c in part and pos_q[c]>=0:
+                    base[i] += q[sl[c]]/(prev_ptr[c+1]-prev_ptr[c])
+        return order_H, order_q, [i for i in order_q if self.is_out[i]], base
+
+    def head_pass_part(self, part, approved_H=120):
+        '''
+        Прямой проход по части плана (см. affected). 
+        Напоры остальных элементов берутся из хранилища.
+        '''
+        data = self.store.data
+        sl   = self.slots
+        s, n, q, H_add, z = (data[c] for c in ('s', 'n', 'q', 'H_add', 'z'))
+        H_in, h, H_out = data['H_in'], data['h'], data['H_out']
+        parent_H, has_next = self.parent_H, self.has_next
+        for i in part[0]:
+            k = sl[i]
+            p = parent_H[i]
+            if p >= 0:
+                H_in[k] = H_out[sl[p]]
+            if has_next[i]:
+                h[k] = s[k] * n[k] * q[k]**2
+                new_H = H_in[k] + H_add[k] - h[k] - z[k]
+                if new_H>approved_H:
+                    raise ValueError(f"Напор не может быть выше {approved_H}!")
+                if new_H<0:
+                    raise ValueError("Напор не может быть меньше 0!")
+                H_out[k] = new_H
+
+    def flow_pass_part(self, part):
+        '''
+        Обратный проход по части плана (см. affected).
+        Вклад в расход от элементов вне части берется из хранилища.
+            Выход:
+                float: суммарный расход стволов части плана
+        '''
+        q   = self.store.data['q']
+        sl  = self.slots
+        prev_ptr, prev_idx = self.prev_ptr, self.prev_idx
+        order_q = part[1]
+        acc = part[3].copy()
+        Q = 0
+        for i in part[2]:
+            q_out = self.elmnts[i].get_q_out()
+            acc[i] += q_out
+            Q += q_out
+        for i in order_q:
+            q_i = acc[i]
+            q[sl[i]] = q_i
+            start, end = prev_ptr[i], prev_ptr[i+1]
+            if end>start:
+                q_i = q_i/(end-start)
+                for k in range(start, end):
+                    if prev_idx[k] in acc:
+                        acc[prev_idx[k]] += q_i
+        return Q
+
+
+#=======================Профилирование расчета=================================
+class NRS_Profiler(object):
+    '''
+    Профилировщик расчета модели (см. NRS_Model.profile).
+    Для каждой фазы расчета (компиляция, прямой проход, обнуление расходов, обратный проход,
+    фиксация состояний, суммарный расход, callback и др.) накапливает количество вызовов, время,
+    оценки количества посещений элементов и вычислений q_out и прирост количества 
+    выделенных интерпретатором блоков памяти.
+    Оценки (visits_est, q_out_est) не подсчитываются внутри проходов: это размер обрабатываемой 
+    части плана, умноженный на количество завершившихся без исключения вызовов фазы.
+    Фазы оборачиваются только при включенном профилировании, поэтому без профилировщика 
+    расчет не несет дополнительных затрат.
+    '''
+    # Показатели фазы
+    fields = ('calls', 'time', 'visits_est', 'q_out_est', 'blocks')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''
+        Очистка накопленных показателей
+            Выход:
+                NRS_Profiler. Ссылка на текущий профилировщик
+        '''
+        self.stats    = {}      # фаза -> [calls, time, visits_est, q_out_est, blocks]
+        self.topology = {}      # размеры последнего рассчитанного плана
+        return self
+
+    def wrap(self, phase, func, visits=0, q_out=0):
+        '''
+        Обертка функции фазы расчета
+            Вход:
+                phase=str: имя фазы
+                func=callable: функция фазы
+                visits=int: оценка количества посещений элементов за один вызов (размер части плана)
+                q_out=int: оценка количества вычислений q_out за один вызов
+            Выход:
+                callable - функция с теми же аргументами, учитывающая показатели фазы
+        '''
+        stat   = self.stats.setdefault(phase, [0, 0.0, 0, 0, 0])
+        clock  = time.perf_counter
+        blocks = sys.getallocatedblocks
+        def wrapped(*args, **kwargs):
+            b = blocks()
+            t = clock()
+            try:
+                res = func(*args, **kwargs)
+            finally:
+                stat[1] += clock()-t
+                stat[4] += blocks()-b
+                stat[0] += 1
+            # Прерванный исключением вызов обработал неизвестную часть плана и в оценки не входит
+            stat[2] += visits
+            stat[3] += q_out
+            return res
+        return wrapped
+
+    def instrument(self, model, plan, callback):
+        '''
+        Обертки фаз итерационного расчета (см. NRS_Model.calc)
+            Выход:
+                head_pass, flow_reset, flow_pass, fixState, summaryQ, callback
+        '''
+        self.topology = {'elements': len(plan.elmnts), 'links': len(plan.next_idx),
+                         'sources': len(model.elmnts_in), 'outs': len(plan.out)}
+        return (self.wrap('head_pass',  plan.head_pass,  visits=len(plan.order_H)),
+                self.wrap('flow_reset', plan.flow_reset, visits=len(plan.order_q)),
+                self.wrap('flow_pass',  plan.flow_pass,  visits=len(plan.order_q), q_out=len(plan.out)),
+                self.wrap('fixState',   model.fixState,  visits=len(model.elmnts)),
+                self.wrap('summaryQ',   model.summaryQ,  visits=len(model.elmnts_out), q_out=len(model.elmnts_out)),
+                callback and self.wrap('callback', callback))
+
+    def as_dict(self):
+        '''
+        Накопленные показатели
+            Выход:
+                dict - {'phases': {фаза: {'calls', 'time', 'visits_est', 'q_out_est', 'blocks'}}, 
+                'total': суммарное время, 'topology': размеры плана}
+        '''
+        phases = {phase: dict(zip(self.fields, stat)) for phase, stat in self.stats.items()}
+        return {'phases': phases, 'total': sum(stat[1] for stat in self.stats.values()),
+                'topology': dict(self.topology)}
+
+    def to_pstats(self):
+        '''
+        Показатели в виде pstats.Stats (например, для print_stats, sort_stats или dump_stats)
+            Выход:
+                pstats.Stats
+        '''
+        return pstats.Stats(_PstatsSource(self))
+
+
+class _PstatsSource(object):
+    '''Источник данных для pstats.Stats (протокол create_stats/stats)'''
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def create_stats(self):
+        # Ключ - (файл, строка, функция), значение - (вызовы, вызовы без рекурсии, время, общее время, вызывающие)
+        self.stats = {('nrs.py', 0, phase): (stat[0], stat[0], stat[1], stat[1], {})
+                      for phase, stat in self.profiler.stats.items()}
+
+
+#=======================Кэш решений===============================
+class NRS_SolutionCache(object):
+    '''
+    Кэш сошедшихся решений модели (см. NRS_Model.cache_solutions) с вытеснением 
+    давно не использованных записей (LRU) при превышении размера.
+    Ключ записи - сигнатура модели (см. NRS_Model.signature), метод и точность расчета,
+    значение - расходы и напоры элементов плана и сведения о расчете.
+    Сигнатура вычисляется по содержимому модели, поэтому любое изменение связей 
+    или параметров элементов (append, set_ri, set_ro, drop_links, присваивание атрибутов) 
+    дает новый ключ, а одинаковые схемы, собранные заново, - тот же ключ.
+    '''
+    # Сохраняемые столбцы решения
+    columns = ('q', 'H_in', 'h', 'H_out')
+
+    def __init__(self, size=128):
+        '''
+            Вход:
+                size=int: наибольшее количество хранимых решений
+        '''
+        self.size      = size
+        self.entries   = OrderedDict()    # ключ -> (столбцы решения, сведения о расчете, функции q_out)
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def calc(self, model, method, accuracy, fixStates, kwargs):
+        '''
+        Расчет модели с использованием кэша: при наличии решения оно записывается в модель,
+        иначе выполняется расчет (NRS_Model.calc с параметрами kwargs) и сошедшееся решение сохраняется
+            Выход:
+                `NRS_Model` - ссылка на модель\n
+                `NRS_CalcResult` - результат расчета (при 'cached'=True - сохраненный результат)
+        '''
+        start = time.perf_counter()
+        plan = model.get_plan()
+        signature, funcs = model._signature(plan)
+        key = (signature, method, accuracy)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            values, info, _ = entry
+            for c, col in zip(self.columns, values):
+                plan.set_column(c, col)
+            if plan.store is not None:
+                plan.store.dirty.clear()
+            # Решение методом Ньютона распределяет расходы иначе, чем итерационный расчет,
+            # поэтому не используется как начальное для пересчета части модели
+            model.solved = plan if method=='iter' else None
+            if fixStates:
+                model.fixFinalState()
+            return model, NRS_CalcResult(model, plan, **info, time=time.perf_counter()-start, cached=True)
+
+        self.misses += 1
+        model.cache = None
+        try:
+            model, result = model.calc(**kwargs)
+        finally:
+            model.cache = self
+        result['cached'] = False
+        if result['stop']=='converged' and result.plan is plan:
+            info = {k: v for k, v in result.items() if k not in ('time', 'cached')}
+            self.entries[key] = (tuple(plan.column(c) for c in self.columns), info, funcs)
+            while len(self.entries)>self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return model, result
+
+    def stats(self):
+        '''
+        Показатели использования кэша
+            Выход:
+                dict - {'size': количество записей, 'max_size', 'hits', 'misses', 'evictions'}
+        '''
+        return {'size': len(self.entries), 'max_size': self.size,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        '''Удаление всех записей (показатели сохраняются)'''
+        self.entries.clear()
+        return self
+
+
+#=======================Ускорение сходимости расчета===============================
+class NRS_Relaxation(object):
+    '''
+    Релаксация и ускорение итерационного расчета (см. NRS_Model.calc, параметр accelerate).
+    Итерация расчета рассматривается как отображение x -> g(x) вектора расходов элементов 
+    (прямой проход по напорам и обратный проход по расходам), невязка r = g(x) - x.
+    Вместо g(x) следующей итерации передается:
+        'relax'    - x + w*r, коэффициент релаксации w уменьшается вдвое при росте невязки 
+                     и увеличивается (до 1) при ее уменьшении;
+        'aitken'   - x + w*r, коэффициент w уточняется по двум последним невязкам 
+                     (динамическая релаксация Эйткена);
+        'anderson' - линейная комбинация последних m итераций с наименьшей невязкой 
+                     (ускорение Андерсона), при росте невязки история сбрасывается.
+    При выходе напора за допустимые пределы (ValueError в прямом проходе) итерация 
+    повторяется от предыдущего приближения с уменьшенным вдвое коэффициентом (см. backtrack).
+    '''
+    # Поддерживаемые методы
+    methods = ('relax', 'aitken', 'anderson')
+
+    def __init__(self, method='aitken', step=0.5, min_step=1e-3, max_step=1.0, m=5):
+        '''
+            Вход:
+                method=str: метод (см. methods)
+                step=float: начальный коэффициент релаксации (0 < step <= max_step)
+                min_step=float: наименьший коэффициент релаксации - при меньшем расчет считается неустойчивым
+                max_step=float: наибольший коэффициент релаксации
+                m=int: количество запоминаемых итераций для метода 'anderson'
+        '''
+        if method not in self.methods:
+            raise ValueError(f'Неизвестный метод ускорения расчета {method}')
+        if not 0<step<=max_step:
+            raise ValueError(f'Коэффициент релаксации должен быть в пределах (0, {max_step}]')
+        self.method   = method
+        self.step     = step
+        self.min_step = min_step
+        self.max_step = max_step
+        self.m        = m
+        self.x = self.r = None      # предыдущее приближение и его невязка
+        self.dX, self.dR = [], []   # история приращений приближений и невязок ('anderson')
+
+    @property
+    def stalled(self):
+        '''Коэффициент релаксации стал меньше допустимого'''
+        return self.step<self.min_step
+
+    def update(self, x, gx):
+        '''
+        Следующее приближение
+            Вход:
+                x=np.array: текущее приближение (расходы элементов до итерации)
+                gx=np.array: результат итерации (расходы элементов после итерации)
+            Выход:
+                np.array: приближение для следующей итерации
+        '''
+        r = gx - x
+        x_prev, r_prev = self.x, self.r
+        self.x, self.r = x, r
+        if r_prev is None:
+            return x + self.step*r
+
+        dr = r - r_prev
+        norm, norm_prev = np.dot(r, r), np.dot(r_prev, r_prev)
+        if self.method=='relax':
+            self.step = min(self.max_step, self.step*1.2) if norm<norm_prev else self.step/2
+            return x + self.step*r
+
+        if self.method=='aitken':
+            dd = np.dot(dr, dr)
+            if dd>0:
+                self.step = min(self.max_step, max(self.min_step, -self.step*np.dot(r_prev, dr)/dd))
+            return x + self.step*r
+
+        # Андерсон: x + w*r - (dX + w*dR)*gamma, где gamma - МНК-решение dR*gamma = r
+        if norm>=norm_prev:
+            self.dX.clear()
+            self.dR.clear()
+            self.step = self.step/2
+            return x + self.step*r
+        self.step = min(self.max_step, self.step*1.2)
+        self.dX.append(x - x_prev)
+        self.dR.append(dr)
+        if len(self.dX)>self.m:
+            del self.dX[0], self.dR[0]
+        dX, dR = np.array(self.dX).T, np.array(self.dR).T
+        gamma = np.linalg.lstsq(dR, r, rcond=None)[0]
+        return x + self.step*r - (dX + self.step*dR) @ gamma
+
+    def backtrack(self):
+        '''
+        Повтор итерации от предыдущего приближения с уменьшенным вдвое коэффициентом релаксации
+        (при выходе напора за допустимые пределы)
+            Выход:
+                np.array: приближение для повторной итерации (None - повтор невозможен)
+        '''
+        if self.r is None:
+            return None
+        self.step = self.step/2
+        self.dX.clear()
+        self.dR.clear()
+        return self.x + self.step*self.r
+
+
+#=======================Результат расчета модели===============================
+class NRS_CalcResult(dict):
+    '''
+    Результат расчета модели (см. NRS_Model.calc).
+    Словарь с ключами:
+        'iters' - количество итераций, 'QD2' - последнее изменение суммарного расхода,
+        'correct' - можно ли доверять результату (расчет не остановлен из-за неустойчивости),
+        'stop' - причина окончания расчета: 'converged' - достигнута точность, 
+        'iters' - выполнено заданное количество итераций, 'oscillation' - расчет не стабилен,
+        'time' - время расчета, с, 'history' - изменения суммарного расхода по итерациям,
+        'cached' - взят ли результат из кэша решений (только при включенном кэше, см. NRS_Model.cache_solutions).
+    Ключи доступны и как атрибуты (result.iters).
+    Невязки по элементам рассчитываются по запросу (residuals, worst) 
+    для текущего состояния модели, поэтому запрашивать их следует сразу после расчета.
+    '''
+
+    def __init__(self, model, plan, **info):
+        super().__init__(**info)
+        self.model = model
+        self.plan  = plan
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def residuals(self):
+        '''
+        Невязки элементов модели:
+            по расходу - разница между расходом через элемент и расходом, который дал бы 
+            следующий цикл расчета: напоры пересчитываются от источников по текущим расходам, 
+            расходы стволов (q_out) берутся при этих напорах и суммируются к источникам 
+            (состояние элементов не изменяется);
+            по напору - разница между напором на входе в элемент и напором на выходе 
+            из ведущего предыдущего элемента, пересчитанным по текущему расходу.
+            Выход:
+                dict - {'name': список имен элементов, 'q': массив невязок по расходу, л/с, 
+                'H': массив невязок по напору, м}
+        '''
+        plan = self.plan
+        ne = len(plan.elmnts)
+        q, H_in = plan.column('q'), plan.column('H_in')
+        s, n, H_add, z = (plan.column(c) for c in ('s', 'n', 'H_add', 'z'))
+
+        # Напоры на входе после прохода от источников при текущих расходах
+        H_new = H_in.tolist()
+        H_out = (H_in + H_add - s*n*q**2 - z).tolist()
+        for i in plan.order_H:
+            p = plan.parent_H[i]
+            if p >= 0:
+                H_new[i] = H_out[p]
+                H_out[i] = H_new[i] + H_add[i] - s[i]*n[i]*q[i]**2 - z[i]
+
+        # Расходы стволов при новых напорах, суммируемые к источникам (делятся поровну между предыдущими)
+        acc = [0.0]*ne
+        for i in plan.out:
+            elmnt = plan.elmnts[i]
+            H = elmnt.H_in
+            elmnt.H_in = H_new[i]
+            try:
+                acc[i] += elmnt.get_q_out()
+            finally:
+                elmnt.H_in = H
+        prev_ptr, prev_idx = plan.prev_ptr, plan.prev_idx
+        for i in plan.order_q:
+            start, end = prev_ptr[i], prev_ptr[i+1]
+            for k in range(start, end):
+                acc[prev_idx[k]] += acc[i]/(end-start)
+        in_q  = np.asarray(plan.pos_q)>=0
+        res_q = np.where(in_q, q-np.array(acc), 0.0)
+
+        # Напор на выходе ведущего предыдущего элемента при текущем расходе
+        parent = np.asarray(plan.parent_H)
+        has_parent = parent>=0
+        p = parent[has_parent]
+        res_H = np.zeros(ne)
+        res_H[has_parent] = H_in[has_parent] - (H_in[p] + H_add[p] - s[p]*n[p]*q[p]**2 - z[p])
+
+        return {'name': [elmnt.name for elmnt in plan.elmnts], 'q': res_q, 'H': res_H}
+
+    def worst(self, count=5):
+        '''
+        Элементы с наибольшими невязками (см. residuals) - позволяет найти ветви, 
+        сдерживающие сходимость расчета
+            Вход:
+                count=int: количество элементов
+            Выход:
+                list - [(имя элемента, невязка по расходу, невязка по напору)] по убыванию невязки по напору
+        '''
+        res = self.residuals()
+        order = np.lexsort((-np.abs(res['q']), -np.abs(res['H'])))[:count]
+        return [(res['name'][i], float(res['q'][i]), float(res['H'][i])) for i in order]
+
+    def __reduce__(self):
+        # Ссылки на модель и план не сериализуются
+        return (dict, (dict(self),))
+
+
+#=======================Пакетный расчет сценариев===============================
+class NRS_BatchElement(object):
+    '''
+    Представление элемента в пакетном расчете.
+    Параметры элемента возвращаются в виде массивов значений по сценариям,
+    что позволяет использовать функции расчета расходов (q_out) без изменений.
+    '''
+    __slots__ = ('elmnt', 'cols', 'i')
+
+    def __init__(self, elmnt, cols, i):
+        self.elmnt = elmnt
+        self.cols  = cols
+        self.i     = i
+
+    def __getattr__(self, name):
+        cols = object.__getattribute__(self, 'cols')
+        if name in cols:
+            return cols[name][object.__getattribute__(self, 'i')]
+        return getattr(object.__getattribute__(self, 'elmnt'), name)
+
+
+class NRS_Batch(object):
+    '''
+    Пакетный расчет НРС для набора сценариев.
+    Состояние каждого элемента (H_in, h, q) и его параметры хранятся в виде
+    массивов NumPy размерности (количество элементов, количество сценариев),
+    расчет всех сценариев ведется одновременно по скомпилированному порядку (NRS_Plan).
+    Кольца по направлению связей не допускаются (ValueError), для параллельных линий между
+    разветвлением и водосборником распределение расхода приближенное, как в методе 'iter' 
+    (NRS_Model.calc_batch рассчитывает такие НРС методом Ньютона, см. auto_method).
+    '''
+    # Параметры элементов, которые могут задаваться по сценариям
+    params = ('s', 'n', 'p', 'z', 'H_add', 'H_in', 'q')
+
+    def __init__(self, plan, size):
+        '''
+        Инициация состояния пакетного расчета текущими значениями элементов
+            Вход:
+                plan=NRS_Plan: скомпилированный порядок расчета модели
+                size=int: количество сценариев
+        '''
+        plan.check_acyclic(loops=False)
+        self.plan = plan
+        self.size = size
+        self.cols = {}
+        for attr in self.params + ('h',):
+            values = plan.column(attr)
+            self.cols[attr] = np.repeat(values[:, None], size, axis=1)
+        self.cols['H_out'] = np.zeros((len(plan.elmnts), size))
+        self.views = [NRS_BatchElement(elmnt, self.cols, i) for i, elmnt in enumerate(plan.elmnts)]
+
+    def set_param(self, elmnt, attr, values):
+        '''
+        Установка значений параметра элемента по сценариям
+            Вход:
+                elmnt=Element: элемент модели
+                attr=str: имя параметра (см. NRS_Batch.params)
+                values=array: значения параметра (массив длины size или скаляр)
+        '''
+        if not attr in self.params:
+            raise ValueError(f'Параметр {attr} не может задаваться по сценариям')
+        i = self.plan.index.get(id(elmnt))
+        if i is None:
+            raise ValueError(f'Элемент {elmnt.name} не участвует в расчете')
+        self.cols[attr][i] = values
+
+    def head_pass(self, approved_H=120):
+        '''
+        Прямой проход по напорам для всех сценариев
+            Выход:
+                np.array(bool): признак выхода напоров за допустимые пределы по сценариям
+        '''
+        plan  = self.plan
+        cols  = self.cols
+        H_in, H_out, h = cols['H_in'], cols['H_out'], cols['h']
+        s, n, q, H_add, z = cols['s'], cols['n'], cols['q'], cols['H_add'], cols['z']
+        failed = np.zeros(self.size, dtype=bool)
+        for i in plan.order_H:
+            p = plan.parent_H[i]
+            if p>=0:
+                H_in[i] = H_out[p]
+            if plan.has_next[i]:
+                h[i] = s[i]*n[i]*q[i]**2
+                H_out[i] = H_in[i] + H_add[i] - h[i] - z[i]
+                failed |= (H_out[i]>approved_H) | (H_out[i]<0)
+        return failed
+
+    def flow_pass(self):
+        '''
+        Обратный проход по расходам для всех сценариев
+            Выход:
+                np.array: суммарный расход элементов-расхода по сценариям
+        '''
+        plan = self.plan
+        q    = self.cols['q']
+        q[plan.order_q] = 0
+        acc = np.zeros_like(q)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in plan.out:
+                acc[i] += plan.elmnts[i].q_out(self.views[i])
+        Q = acc[plan.out].sum(axis=0)
+        for i in plan.order_q:
+            q[i] += acc[i]
+            start, end = plan.prev_ptr[i], plan.prev_ptr[i+1]
+            if end>start:
+                part = acc[i]/(end-start)
+                for k in range(start, end):
+                    acc[plan.prev_idx[k]] += part
+        return Q
+
+    def summaryQ(self):
+        '''Суммарный расход модели по сценариям'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sum(self.plan.elmnts[i].q_out(self.views[i]) for i in self.plan.out)
+
+
+#=======================Параллельный перебор параметров===============================
+# Модель, переданная процессу-исполнителю при его инициации (см. NRS_Model.sweep)
+_sweep_model = None
+
+def _sweep_init(model):
+    '''Инициация процесса-исполнителя: модель передается один раз на процесс'''
+    global _sweep_model
+    _sweep_model = model
+
+def _sweep_chunk(args):
+    '''Расчет части сетки параметров в процессе-исполнителе'''
+    scenarios, kwargs = args
+    return _sweep_model.calc_batch(scenarios, **kwargs)
+
+
+#=======================Потоковая запись результатов===============================
+class NRS_ResultSink(object):
+    '''
+    Потоковая запись результатов расчетов (циклов calc, sweep, simulate) частями на диск.
+    Каждая строка результатов - одна точка (итерация, точка сетки, момент времени):
+    значения столбцов состояния выбранных элементов (columns) и поля строки (fields), 
+    например время или значения параметров сетки. Строки накапливаются в буфере 
+    по chunk строк и дописываются в файлы, поэтому при аварийном завершении 
+    теряется не более одной части.
+    Форматы (по пути path):
+        '*.csv' - CSV: строка-комментарий '# {описание в JSON}', затем заголовок из имен полей 
+                  и столбцов 'элемент.столбец' (pandas.read_csv(path, skiprows=1));
+        '*.npz' - npz без сжатия со столбцами и заголовком. До закрытия части пишутся 
+                  в каталог path + '.parts' в формате 'npy';
+        иначе   - 'npy': каталог с файлами столбцов '<столбец>.npy' (строки, элементы),
+                  полей 'fields.npy' (строки, поля) и заголовком 'header.json'.
+    Записанные результаты открываются без загрузки в память (см. load, NRS_StoredResults).
+    Экземпляр можно передать как callback в calc: каждая итерация записывается строкой.
+    '''
+    file_format  = 'nrs-results'
+    file_version = 1
+    # Размер заголовка файлов npy: количество строк в нем перезаписывается при каждой записи части
+    npy_header = 128
+
+    def __init__(self, path, elements, columns=('q', 'H_in', 'h'), fields=(), chunk=1000, fmt=None):
+        '''
+            Вход:
+                path=str: путь к файлу (csv, npz) или каталогу (npy)
+                elements=list|NRS_Model: имена элементов или элементы (модель - все элементы ее плана расчета)
+                columns=tuple: записываемые столбцы элементов (см. ElementStore.columns)
+                fields=tuple: имена полей строки
+                chunk=int: количество строк в буфере
+                fmt=str: формат 'csv', 'npy' или 'npz' (по умолчанию - по расширению path)
+        '''
+        if isinstance(elements, NRS_Model):
+            elements = elements.get_plan().elmnts
+        self.elements = [e if isinstance(e, str) else e.name for e in elements]
+        self.columns  = tuple(columns)
+        self.fields   = tuple(fields)
+        for c in self.columns:
+            if not c in ElementStore.columns:
+                raise ValueError(f'Неизвестный столбец элементов {c}')
+        self.path  = os.fspath(path)
+        self.fmt   = fmt or {'.csv': 'csv', '.npz': 'npz'}.get(os.path.splitext(self.path)[1].lower(), 'npy')
+        if not self.fmt in ('csv', 'npy', 'npz'):
+            raise ValueError(f'Неизвестный формат результатов {self.fmt}')
+        self.chunk = chunk
+        self.rows  = 0
+        self._index = None          # (план, индексы элементов в плане) - для записи из модели
+        ne = len(self.elements)
+        self._buffer = {c: np.empty((chunk, ne)) for c in self.columns}
+        self._buffer_fields = np.empty((chunk, len(self.fields)))
+        self._filled = 0
+        self._files  = {}
+
+        if self.fmt=='csv':
+            f = open(self.path, 'w', encoding='utf-8', newline='')
+            f.write('# ' + json.dumps({'format': self.file_format, 'version': self.file_version,
+                                       'fields': len(self.fields), 'columns': list(self.columns)}) + '\n')
+            csv.writer(f).writerow(list(self.fields) + [f'{name}.{c}' for c in self.columns for name in self.elements])
+            self._files['csv'] = f
+        else:
+            self.directory = self.path + '.parts' if self.fmt=='npz' else self.path
+            os.makedirs(self.directory, exist_ok=True)
+            for key, width in [(c, ne) for c in self.columns] + [('fields', len(self.fields))]:
+                f = open(os.path.join(self.directory, f'{key}.npy'), 'w+b')
+                f.write(self._npy_header((0, width)))
+                self._files[key] = f
+            self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __call__(self, model):
+        '''Запись текущего состояния модели строкой (для использования в качестве callback)'''
+        self.write_model(model)
+
+    def _npy_header(self, shape):
+        '''Заголовок файла npy постоянного размера (npy_header байт)'''
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': %r, }" % (tuple(shape),)
+        header = header.ljust(self.npy_header - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def _write_header(self):
+        '''Запись заголовка каталога npy'''
+        header = {'format': self.file_format, 'version': self.file_version, 'rows': self.rows,
+                  'elements': self.elements, 'columns': list(self.columns), 'fields': list(self.fields)}
+        with open(os.path.join(self.directory, 'header.json'), 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+
+    def write_model(self, model, **fields):
+        '''
+        Запись текущего состояния модели строкой
+            Вход:
+                model=NRS_Model: модель
+                fields: значения полей строки
+            Выход:
+                NRS_ResultSink: ссылка на текущий экземпляр
+        '''
+        plan = model.get_plan()
+        if self._index is None or self._index[0] is not plan:
+            index = {elmnt.name: i for i, elmnt in enumerate(plan.elmnts)}
+            self._index = (plan, np.array([index[name] for name in self.elements], dtype=np.intp))
+        idx = self._index[1]
+        return self.write_row({c: plan.column(c)[idx] for c in self.columns}, **fields)
+
+    def write_row(self, values, **fields):
+        '''
+        Запись строки
+            Вход:
+                values=dict: {столбец: массив значений по элементам}
+                fields: значения полей строки
+            Выход:
+                NRS_ResultSink: ссылка на текущий экземпляр
+        '''
+        k = self._filled
+        for c in self.columns:
+            self._buffer[c][k] = values[c]
+        self._buffer_fields[k] = [fields.get(f, np.nan) for f in self.fields]
+        self._filled += 1
+        if self._filled==self.chunk:
+            self.flush()
+        return self
+
+    def write(self, values, **fields):
+        '''
+        Запись части строк
+            Вход:
+                values=dict: {столбец: массив (строки, элементы)}
+                fields: значения полей по строкам (массивы)
+            Выход:
+                NRS_ResultSink: ссылка на текущий экземпляр
+        '''
+        self.flush()
+        rows = len(values[self.columns[0]]) if self.columns else len(next(iter(fields.values())))
+        data = {c: np.asarray(values[c], dtype=float).reshape(rows, len(self.elements)) for c in self.columns}
+        field_data = np.column_stack([np.broadcast_to(np.asarray(fields.get(f, np.nan), dtype=float), (rows,))
+                                      for f in self.fields]) if self.fields else np.empty((rows, 0))
+        self._append(data, field_data)
+        return self
+
+    def flush(self):
+        '''
+        Запись накопленных строк на диск
+            Выход:
+                NRS_ResultSink: ссылка на текущий экземпляр
+        '''
+        if self._filled:
+            k = self._filled
+            self._filled = 0
+            self._append({c: self._buffer[c][:k] for c in self.columns}, self._buffer_fields[:k])
+        return self
+
+    def _append(self, data, field_data):
+        '''Дописывание строк в файлы'''
+        rows = len(field_data)
+        if rows==0:
+            return
+        if self.fmt=='csv':
+            f = self._files['csv']
+            np.savetxt(f, np.hstack([field_data] + [data[c] for c in self.columns]), delimiter=',', fmt='%.17g')
+            f.flush()
+            self.rows += rows
+            return
+        self.rows += rows
+        for key, values in list(data.items()) + [('fields', field_data)]:
+            f = self._files[key]
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+            f.seek(0)
+            f.write(self._npy_header((self.rows, values.shape[1])))
+            f.flush()
+        self._write_header()
+
+    def close(self):
+        '''
+        Завершение записи (для формата 'npz' - упаковка частей в файл npz)
+            Выход:
+                str - путь к результатам
+        '''
+        if not self._files:
+            return self.path
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        if self.fmt=='npz':
+            with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as z:
+                for name in sorted(os.listdir(self.directory)):
+                    z.write(os.path.join(self.directory, name), name)
+            shutil.rmtree(self.directory)
+        return self.path
+
+    @staticmethod
+    def load(path):
+        '''
+        Открытие записанных результатов без загрузки в память
+            Вход:
+                path=str: путь к результатам (см. NRS_ResultSink)
+            Выход:
+                NRS_StoredResults
+        '''
+        return NRS_StoredResults(path)
+
+
+class NRS_StoredResults(object):
+    '''
+    Результаты, записанные NRS_ResultSink. Столбцы форматов 'npy' отображаются в память (np.memmap),
+    'npz' - читаются по одному при обращении, 'csv' - читаются построчно (только нужные значения).
+    Доступ:
+        results['q']        - массив (строки, элементы) столбца;
+        results['Ств1.q']   - массив по строкам для одного элемента;
+        results['t']        - массив по строкам для поля;
+        results.chunks(n)   - перебор частей по n строк в виде {имя: массив}.
+    '''
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        if os.path.isdir(self.path):
+            self.fmt = 'npy'
+            with open(os.path.join(self.path, 'header.json'), encoding='utf-8') as f:
+                header = json.load(f)
+        elif self.path.lower().endswith('.csv'):
+            self.fmt = 'csv'
+            with open(self.path, encoding='utf-8', newline='') as f:
+                layout = json.loads(f.readline()[1:])
+                names = next(csv.reader(f))
+                rows = sum(1 for _ in f)
+            width = layout['fields']
+            ne = (len(names)-width)//max(len(layout['columns']), 1)
+            header = {'rows': rows, 'fields': names[:width], 'columns': layout['columns'],
+                      'elements': [name.rpartition('.')[0] for name in names[width:width+ne]]}
+        else:
+            self.fmt = 'npz'
+            self._npz = np.load(self.path)
+            with self._npz.zip.open('header.json') as f:
+                header = json.loads(f.read().decode('utf-8'))
+        self.rows     = header['rows']
+        self.elements = header['elements']
+        self.columns  = tuple(header['columns'])
+        self.fields   = tuple(header['fields'])
+        self.index    = {name: i for i, name in enumerate(self.elements)}
+
+    def __len__(self):
+        return self.rows
+
+    def _array(self, key):
+        '''Столбец или массив полей (строки, элементы|поля)'''
+        if self.fmt=='npy':
+            return np.load(os.path.join(self.path, f'{key}.npy'), mmap_mode='r')
+        if self.fmt=='npz':
+            return self._npz[key]
+        # CSV: чтение только нужных позиций строк
+        width = len(self.fields)
+        if key=='fields':
+            usecols = range(width)
+        else:
+            k = self.columns.index(key)
+            ne = len(self.elements)
+            usecols = range(width+k*ne, width+(k+1)*ne)
+        return np.loadtxt(self.path, delimiter=',', skiprows=2, usecols=usecols, ndmin=2)
+
+    def __getitem__(self, key):
+        if key in self.columns:
+            return self._array(key)
+        if key in self.fields:
+            return self._array('fields')[:, self.fields.index(key)]
+        name, _, c = key.rpartition('.')
+        if c in self.columns and name in self.index:
+            if self.fmt=='csv':
+                col = len(self.fields) + self.columns.index(c)*len(self.elements) + self.index[name]
+                return np.loadtxt(self.path, delimiter=',', skiprows=2, usecols=(col,), ndmin=1)
+            return self._array(c)[:, self.index[name]]
+        raise KeyError(key)
+
+    def chunks(self, size=10000):
+        '''
+        Перебор результатов частями
+            Вход:
+                size=int: количество строк в части
+            Выход:
+                генератор dict - {столбец: массив (строки, элементы), поле: массив по строкам}
+        '''
+        if self.fmt=='csv':
+            with open(self.path, encoding='utf-8') as f:
+                next(f)
+                next(f)
+                while True:
+                    lines = list(itertools.islice(f, size))
+                    if not lines:
+                        return
+                    yield self._split(np.loadtxt(lines, delimiter=',', ndmin=2))
+        else:
+            arrays = {key: self._array(key) for key in self.columns + ('fields',)}
+            for start in range(0, self.rows, size):
+                part = {key: np.asarray(arr[start:start+size]) for key, arr in arrays.items()}
+                fields = part.pop('fields')
+                part.update({f: fields[:, i] for i, f in enumerate(self.fields)})
+                yield part
+
+    def _split(self, data):
+        '''Разбиение строк CSV на поля и столбцы'''
+        width, ne = len(self.fields), len(self.elements)
+        part = {f: data[:, i] for i, f in enumerate(self.fields)}
+        for k, c in enumerate(self.columns):
+            part[c] = data[:, width+k*ne:width+(k+1)*ne]
+        return part
+
+
+#=======================Расчет НРС методом Ньютона===============================
+class NRS_Newton(object):
+    '''
+    Система нелинейных уравнений НРС для расчета методом Ньютона-Рафсона.
+    Каждый элемент рассматривается как участок между узлом на входе и узлом на выходе,
+    узлы соединенных элементов объединяются. Неизвестные - расходы участков и напоры в свободных узлах.
+
+    Уравнения:
+        участок: H_in + H_add - z - s*n*q*|q| - H_out = 0
+        ствол:   H_in - K*q*|q| = 0, где K=1/p^2 (q_out_nozzle) или K=s (q_out_nozzle_by_s)
+        узел:    сумма входящих расходов - сумма выходящих расходов = 0
+
+    В отличие от итерационного расчета расход к водосборнику распределяется
+    между подключенными линиями в соответствии с их сопротивлениями, допускаются
+    замкнутые контуры (кольцевые магистрали) и обратное направление расхода в них.
+    Для больших НРС матрица Якоби собирается и раскладывается в разреженном виде (scipy.sparse).
+    '''
+    # Размер системы, начиная с которого по умолчанию используются разреженные матрицы
+    sparse_size = 300
+    # Функции расхода стволов, поддерживаемые методом
+    q_out_funcs = (q_out_nozzle, q_out_nozzle_by_s)
+    # Точность по умолчанию (изменение расходов на шаге, л/с) и допустимая норма невязки 
+    # при расчете заданного количества шагов (см. NRS_Model.calc)
+    accuracy  = 1e-6
+    tolerance = 1e-6
+
+    def __init__(self, plan, model, use_sparse=None):
+        '''
+        Сборка структуры системы уравнений
+            Вход:
+                plan=NRS_Plan: скомпилированный порядок расчета модели
+                model=NRS_Model: рассчитываемая модель
+                use_sparse=bool: использовать разреженные матрицы (None - при наличии scipy 
+                и размере системы не меньше sparse_size)
+        '''
+        self.plan = plan
+        elmnts = plan.elmnts
+        ne = len(elmnts)
+
+        # Объединение узлов (номера 2*i - вход, 2*i+1 - выход элемента i): выход предыдущего элемента = вход следующего
+        next_ptr = np.asarray(plan.next_ptr)
+        prev_out = 2*np.repeat(np.arange(ne), np.diff(next_ptr))+1
+        next_in  = 2*np.asarray(plan.next_idx, dtype=int)
+        if sparse is not None:
+            graph = sparse.coo_matrix((np.ones(len(next_in)), (prev_out, next_in)), shape=(2*ne, 2*ne))
+            root = sparse.csgraph.connected_components(graph, directed=False)[1]
+        else:
+            parent = list(range(2*ne))
+            def find(x):
+                while parent[x]!=x:
+                    parent[x] = parent[parent[x]]
+                    x = parent[x]
+                return x
+            for a, b in zip(prev_out.tolist(), next_in.tolist()):
+                a, b = find(a), find(b)
+                if a!=b:
+                    parent[a] = b
+            root = np.array([find(x) for x in range(2*ne)], dtype=int)
+
+        # Стволы: сопротивление насадка или признак перекрытия
+        self.is_out = np.zeros(ne, dtype=bool)
+        self.is_out[plan.out] = True
+        self.K      = np.zeros(ne)
+        self.closed = np.zeros(ne, dtype=bool)
+        for i in plan.out:
+            elmnt = elmnts[i]
+            if elmnt.q_out is q_out_nozzle:
+                if elmnt.p==0:
+                    self.closed[i] = True
+                else:
+                    self.K[i] = 1/elmnt.p**2
+            elif elmnt.q_out is q_out_nozzle_by_s:
+                self.K[i] = elmnt.s
+            else:
+                raise ValueError(f'Метод newton не поддерживает функцию расхода элемента {elmnt.name}')
+
+        # Узлы с заданным напором: входы источников без подключенных элементов и выходы стволов (атмосфера)
+        self.sources = [plan.index[id(elmnt)] for elmnt in model.elmnts_in
+                        if plan.prev_ptr[plan.index[id(elmnt)]]==plan.prev_ptr[plan.index[id(elmnt)]+1]]
+
+        # Нумерация узлов: сначала свободные (в порядке появления), затем атмосфера и источники
+        number = np.full(root.max()+1 if ne else 0, -1, dtype=int)
+        fixed  = root[2*np.asarray(self.sources, dtype=int)]
+        side_out = np.zeros(2*ne, dtype=bool)
+        side_out[1::2] = self.is_out
+        candidates = root[~side_out & ~np.isin(root, fixed)]
+        free, first = np.unique(candidates, return_index=True)
+        free = free[np.argsort(first)]
+        self.nn = len(free)
+        self.ne = ne
+        atm = self.nn
+        number[free]  = np.arange(self.nn)
+        number[fixed] = atm+1+np.arange(len(fixed))
+        self.node_in  = number[root[0::2]]
+        self.node_out = number[root[1::2]]
+        self.node_out[self.is_out] = atm
+        self.has_next = np.array(plan.has_next, dtype=bool)
+
+        # Постоянная часть матрицы Якоби (все, кроме диагонали уравнений участков)
+        nn = self.nn
+        e  = np.arange(ne)
+        m_in, m_out = self.node_in<nn, self.node_out<nn
+        o_in, o_out = m_in & ~self.closed, m_out & ~self.closed
+        self.pattern = (np.concatenate((e[o_in], e[o_out], ne+self.node_out[m_out], ne+self.node_in[m_in])),
+                        np.concatenate((ne+self.node_in[o_in], ne+self.node_out[o_out], e[m_out], e[m_in])),
+                        np.concatenate((np.ones(o_in.sum()), -np.ones(o_out.sum()),
+                                        np.ones(m_out.sum()), -np.ones(m_in.sum()))))
+
+        if use_sparse is None:
+            use_sparse = sparse is not None and ne+nn>=self.sparse_size
+        elif use_sparse and sparse is None:
+            raise ImportError('Для расчета с разреженными матрицами требуется пакет scipy')
+        self.use_sparse = use_sparse
+        self.factor = None
+        if use_sparse:
+            # Матрицы связи участков с узлами: B - в уравнениях участков (без перекрытых стволов), C - в уравнениях узлов
+            rows, cols, vals = self.pattern
+            m = rows<ne
+            self.B = sparse.csr_matrix((vals[m], (rows[m], cols[m]-ne)), shape=(ne, nn))
+            self.C = sparse.csr_matrix((vals[~m], (rows[~m]-ne, cols[~m])), shape=(nn, ne))
+
+    @classmethod
+    def unsupported(cls, plan):
+        '''
+        Проверка применимости метода к плану
+            Выход:
+                Element - первый ствол с функцией расхода, не поддерживаемой методом (None - метод применим)
+        '''
+        return next((plan.elmnts[i] for i in plan.out if not plan.elmnts[i].q_out in cls.q_out_funcs), None)
+
+    def params(self):
+        '''
+        Текущие параметры элементов
+            Выход:
+                R - сопротивления участков, H_add - дополнительные напоры, z - перепады высот, H_fixed - заданные напоры
+        '''
+        plan  = self.plan
+        R     = plan.column('s')*plan.column('n')
+        H_add = plan.column('H_add')
+        z     = plan.column('z')
+        R[self.is_out]     = self.K[self.is_out]
+        H_add[self.is_out] = 0
+        z[self.is_out]     = 0
+        H_fixed = np.concatenate(([0.0], plan.column('H_in')[self.sources]))
+        return R, H_add, z, H_fixed
+
+    def residual(self, q, H, R, H_add, z, H_fixed):
+        '''
+        Невязки уравнений системы
+            Выход:
+                np.array: невязки уравнений участков, затем узлов
+        '''
+        H_all = np.concatenate((H, H_fixed))
+        F_e = H_all[self.node_in] + H_add - z - R*q*np.abs(q) - H_all[self.node_out]
+        F_e[self.closed] = q[self.closed]
+        size = self.nn + len(H_fixed)
+        F_n = (np.bincount(self.node_out, weights=q, minlength=size)
+               - np.bincount(self.node_in, weights=q, minlength=size))
+        return np.concatenate((F_e, F_n[:self.nn]))
+
+    def jacobian(self, q, R):
+        '''
+        Матрица Якоби системы
+            Выход:
+                np.array (ne+nn, ne+nn) или scipy.sparse.csc_matrix (при use_sparse)
+        '''
+        ne, nn = self.ne, self.nn
+        # Малая добавка исключает вырождение при нулевых расходах
+        diag = -np.maximum(2*R*np.abs(q), 1e-8)
+        diag[self.closed] = 1
+        rows, cols, vals = self.pattern
+        e = np.arange(ne)
+        if self.use_sparse:
+            return sparse.csc_matrix((np.concatenate((diag, vals)), (np.concatenate((e, rows)), np.concatenate((e, cols)))),
+                                     shape=(ne+nn, ne+nn))
+        J = np.zeros((ne+nn, ne+nn))
+        J[e, e] = diag
+        np.add.at(J, (rows, cols), vals)
+        return J
+
+    def solve(self, J, rhs):
+        '''
+        Решение линейной системы J*x = rhs (rhs - вектор или матрица правых частей)
+            Выход:
+                np.array
+        '''
+        if not self.use_sparse:
+            return np.linalg.solve(J, rhs)
+        return self.factorize(J).solve(rhs)
+
+    def factorize(self, J):
+        '''
+        LU-разложение разреженной матрицы
+            Выход:
+                scipy.sparse.linalg.SuperLU
+        '''
+        try:
+            return sparse_linalg.splu(J)
+        except RuntimeError as err:
+            raise np.linalg.LinAlgError(str(err))
+
+    def sensitivity(self, q, R, elmnts):
+        '''
+        Производные решения по дополнительным напорам элементов в точке решения: 
+        из F(u, H_add) = 0 следует J*du = -dF/dH_add, где dF/dH_add - единица в уравнении участка
+            Вход:
+                q=np.array: расходы участков в точке решения
+                R=np.array: сопротивления участков (см. params)
+                elmnts=list: индексы элементов плана, по напорам которых берутся производные
+            Выход:
+                dq - производные расходов элементов (ne, len(elmnts)),\n
+                dH_in - производные напоров на входе элементов (ne, len(elmnts))
+        '''
+        ne, k = self.ne, len(elmnts)
+        rhs = np.zeros((ne+self.nn, k))
+        rhs[elmnts, np.arange(k)] = -1
+        du = self.solve(self.jacobian(q, R), rhs)
+        # Напоры в узлах с заданным напором от H_add не зависят
+        dH = np.vstack((du[ne:], np.zeros((len(self.sources)+1, k))))
+        return du[:ne], dH[self.node_in]
+
+    def initial(self):
+        '''
+        Начальное приближение из текущего состояния элементов
+            Выход:
+                q, H
+        '''
+        q = self.plan.column('q')
+        q[np.abs(q)<1e-3] = 1.0
+        H = np.zeros(self.nn)
+        m = self.node_in<self.nn
+        H[self.node_in[m]] = self.plan.column('H_in')[m]
+        return q, H
+
+    def direction(self, q, R, F, reuse=False):
+        '''
+        Направление шага метода Ньютона (решение J*delta = -F).
+        При use_sparse система сводится к системе только для напоров свободных узлов (метод градиентов):
+        изменение расхода участка выражается через изменения напоров его узлов,
+        матрица B^T*D*B (D - проводимости участков при текущих расходах) симметрична и много меньше J.
+            Вход:
+                reuse=bool: использовать разложение матрицы предыдущего шага (упрощенный метод Ньютона,
+                только при use_sparse) - для близких последовательных решений, например в simulate
+            Выход:
+                np.array: изменения расходов участков, затем напоров узлов
+        '''
+        if not self.use_sparse:
+            return self.solve(self.jacobian(q, R), -F)
+        ne, B, C = self.ne, self.B, self.C
+        F_e, F_n = F[:ne], F[ne:]
+        if reuse and self.factor is not None:
+            d, lu = self.factor
+        else:
+            # Участки: -g*dq + B*dH = -F_e, перекрытые стволы: dq = -F_e
+            d = 1/np.maximum(2*R*np.abs(q), 1e-8)
+            d[self.closed] = 0
+            # Узлы: C*dq = -F_n, C = -B^T для участков (кроме перекрытых стволов)
+            lu = self.factorize((B.T @ sparse.diags(d) @ B).tocsc())
+            self.factor = (d, lu)
+        dq_closed = np.where(self.closed, -F_e, 0)
+        dH = lu.solve(F_n + C @ dq_closed - B.T @ (d*F_e))
+        dq = np.where(self.closed, dq_closed, d*(F_e + B @ dH))
+        return np.concatenate((dq, dH))
+
+    def step(self, q, H, R, H_add, z, H_fixed, reuse=False):
+        '''
+        Шаг метода Ньютона с дроблением шага по норме невязки
+            Вход:
+                reuse=bool: использовать разложение матрицы предыдущего шага (см. direction)
+            Выход:
+                q, H, максимальное изменение расхода, норма невязки
+        '''
+        F = self.residual(q, H, R, H_add, z, H_fixed)
+        norm = np.linalg.norm(F)
+        delta = self.direction(q, R, F, reuse)
+        t = 1.0
+        while True:
+            q_new = q + t*delta[:self.ne]
+            H_new = H + t*delta[self.ne:]
+            norm_new = np.linalg.norm(self.residual(q_new, H_new, R, H_add, z, H_fixed))
+            if norm_new<norm or t<1e-4:
+                break
+            t /= 2
+        return q_new, H_new, float(np.max(np.abs(q_new-q), initial=0)), float(norm_new)
+
+    def write(self, q, H, H_fixed, check=False):
+        '''
+        Запись решения в элементы модели
+            Вход:
+                check=False: проверять ли допустимость напоров (get_H_out)
+        '''
+        plan = self.plan
+        H_in = np.concatenate((H, H_fixed))[self.node_in]
+        if plan.store is not None:
+            # Запись столбцами хранилища (проверка напоров - как в get_H_out)
+            has_next = self.has_next
+            h     = np.where(has_next, plan.column('s')*plan.column('n')*q**2, plan.column('h'))
+            H_out = np.where(has_next, H_in+plan.column('H_add')-h-plan.column('z'), plan.column('H_out'))
+            plan.set_column('q', q)
+            plan.set_column('H_in', H_in)
+            plan.set_column('h', h)
+            if check and np.any(H_out[has_next]>120):
+                raise ValueError("Напор не может быть выше 120!")
+            if check and np.any(H_out[has_next]<0):
+                raise ValueError("Напор не может быть меньше 0!")
+            plan.set_column('H_out', H_out)
+            return
+        for i, elmnt in enumerate(plan.elmnts):
+            elmnt.q = float(q[i])
+            elmnt.H_in = float(H_in[i])
+            if plan.has_next[i]:
+                if check:
+                    elmnt.get_H_out()
+                else:
+                    elmnt.get_h()
+                    elmnt.H_out = elmnt.H_in + elmnt.H_add - elmnt.h - elmnt.z
+
+
+class NRS_Model(object):
+    '''
+    Класс модели НРС
+    '''
+    # Формат файлов модели (см. save)
+    file_format    = 'nrs'
+    file_version   = 1
+    # Сохраняемые столбцы хранилища: параметры элементов и расчетное состояние
+    params_columns = ('s', 'n', 'p', 'z', 'H_add', 'l', 'H_in')
+    state_columns  = ('q', 'h', 'H_out')
+
+    # 'name'
+    # elmnts=[]                 # Коллекция всх элементов модели
+    # elmnts_in=[]              # Коллекция элементов с входящим потоком (для которых выполняется расчет) - для промежуточных не выполняется
+    # elmnts_out=[]             # Коллекция элементов с выходящим потоком (для стволов)
+
+    def __init__(self, name):
+        '''
+        Инициация класса
+            Вход:
+                name=string: имя модели
+        '''
+        self.name       = name
+        self.elmnts     = []
+        self.elmnts_in  = []
+        self.elmnts_out = []
+        self.counter    = 0
+        self.plan       = None
+        self.store      = ElementStore()   # хранилище параметров элементов модели
+        self.solved     = None             # план, для которого в хранилище лежит сошедшееся решение
+        self.profiler   = None             # профилировщик расчета (см. profile)
+        self.cache      = None             # кэш решений (см. cache_solutions)
+
+        # Индексы модели: имя -> элемент (первый из элементов с таким именем), 
+        # количество элементов с повторяющимся именем, множества элементов списков входящих и выходящих элементов.
+        # Принадлежность элемента модели определяется по ссылке элемента на модель (см. _contains),
+        # для элементов сторонних классов (без хранилища и ссылки на модель) - по множеству _foreign
+        self._names       = {}
+        self._names_count = {}
+        self._in_set      = set()
+        self._out_set     = set()
+        self._foreign     = set()
+
+    def _contains(self, elmnt):
+        '''Включен ли элемент в модель'''
+        owner = getattr(elmnt, '_owner', _NO_OWNER)
+        if owner is _NO_OWNER:
+            return elmnt in self._foreign
+        return owner is self or (isinstance(owner, list) and self in owner)
+
+    def _include(self, elmnt):
+        '''Отметка о включении элемента в модель и перенос его параметров в хранилище модели'''
+        if isinstance(elmnt, Element):
+            elmnt._addModel(self)
+            self.store.adopt(elmnt)
+        else:
+            self._foreign.add(elmnt)
+
+    def _exclude(self, elmnt):
+        '''Отметка об исключении элемента из модели (параметры переносятся в общее хранилище)'''
+        if isinstance(elmnt, Element):
+            elmnt._dropModel(self)
+            if elmnt._store is self.store:
+                _detached.adopt(elmnt)
+        else:
+            self._foreign.discard(elmnt)
+
+    def _indexName(self, elmnt):
+        '''Добавление элемента в индекс имен (количество учитывается только для повторяющихся имен)'''
+        name = elmnt.name
+        if name in self._names:
+            self._names_count[name] = self._names_count.get(name, 1) + 1
+        else:
+            self._names[name] = elmnt
+
+    def _unindexName(self, elmnt, name):
+        '''Удаление элемента из индекса имен'''
+        count = self._names_count.get(name, 1) - 1
+        if count<=0:
+            self._names.pop(name, None)
+            return
+        if count==1:
+            del self._names_count[name]
+        else:
+            self._names_count[name] = count
+        if self._names.get(name) is elmnt:
+            self._names[name] = next(e for e in self.elmnts if e is not elmnt and e.name==name)
+
+    def _renameElement(self, elmnt, old_name, new_name):
+        '''Обновление индекса имен при переименовании элемента'''
+        self._unindexName(elmnt, old_name)
+        self._indexName(elmnt)
+
+    def _syncSets(self):
+        '''Восстановление множеств входящих и выходящих элементов после прямого изменения списков'''
+        if len(self._in_set)!=len(self.elmnts_in):
+            self._in_set = set(self.elmnts_in)
+        if len(self._out_set)!=len(self.elmnts_out):
+            self._out_set = set(self.elmnts_out)
+
+
+    def appendElement(self, elmnt):
+        '''
+        Добавляет элемент в модель
+            Вход:
+                elmnt=Element: Элемент для добавления в модель НРС
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        self.counter+=1
+        if elmnt.name=='':
+            elmnt.name=str(self.counter)
+        logger.info("Новый элемент НРС: %s", elmnt.name)
+        
+        # добавление в основной список
+        self.elmnts.append(elmnt)
+        self._indexName(elmnt)
+        self._include(elmnt)
+        # # Добавление в дополнительные списки
+        # if elmnt.type==0:
+        #     self.elmnts_in.append(elmnt)
+        # elif elmnt.type==2:
+        #     self.elmnts_out.append(elmnt)
+
+        return self
+
+    def addElements(self, elmnts, interpretate=False):
+        '''
+        Добавляет элементы в модель
+            Вход:
+                elmnts=List(Element): Список элементов для добавления в модель НРС
+                interpretate=False: Если равно True, происходит автоматическая интерпретация 
+                (распределение по спискам входящих и выходящих элементов)
+                элементов модели
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        for elmnt in elmnts:
+            if not self._contains(elmnt):
+                self.appendElement(elmnt)
+        if interpretate:
+            self.interpretate()
+
+        return self
+
+    def delElement(self, elmnt:Element, fire_dead_elements=True):
+        '''
+        Удаляем элемент как объект.
+        При fire_dead_elements=True вслед за элементом удаляются ставшие мертвыми связанные с ним элементы
+        (см. _cascade), все связи удаляемых элементов разрываются за один проход (см. _detach).
+        '''
+        if not fire_dead_elements:
+            elmnt.drop_links(linked_elements=True, current_element=True)
+            self._removeElements([elmnt])
+            return
+
+        removed = self._cascade([elmnt], forced=[elmnt])
+        self._detach(removed)
+        self._removeElements(removed)
+
+    def _isDead(self, elmnt):
+        '''
+        Проверка, является ли элемент мертвым: насос без выходов, 
+        соединение без входов или выходов, ствол без входов
+        '''
+        if elmnt.type==0:
+            return len(elmnt.elements_next)==0
+        elif elmnt.type==1:
+            return len(elmnt.elements_next)==0 or len(elmnt.elements_previous)==0
+        elif elmnt.type==2:
+            return len(elmnt.elements_previous)==0
+        return False
+
+    def _cascade(self, seeds, forced=()):
+        '''
+        Элементы, удаляемые вместе с seeds: мертвые элементы из seeds (и все forced) и элементы модели,
+        ставшие мертвыми после удаления уже отобранных. Связи не изменяются: для каждого элемента 
+        подсчитываются только утраченные связи, поэтому каждый элемент проверяется при изменении его связей, 
+        а время пропорционально количеству связей удаляемых элементов.
+            Вход:
+                seeds=list: элементы, с которых начинается проверка
+                forced=list: элементы, удаляемые независимо от наличия связей
+            Выход:
+                list(Element) - удаляемые элементы в порядке отбора
+        '''
+        self._syncSets()
+        contains = self._contains
+        forced  = {id(elmnt) for elmnt in forced}
+        lost_next, lost_prev = Counter(), Counter()
+        removed = {}
+        stack = list(reversed(seeds))
+        while stack:
+            elmnt = stack.pop()
+            key = id(elmnt)
+            if key in removed or (not key in forced and not contains(elmnt)):
+                continue
+            elements_next, elements_previous = elmnt.elements_next, elmnt.elements_previous
+            if not key in forced:
+                e_type = int(elmnt.type)
+                no_next = len(elements_next)==lost_next[key]
+                no_prev = len(elements_previous)==lost_prev[key]
+                if not ((e_type==EType.PUMP and no_next) or (e_type==EType.CONNECTOR and (no_next or no_prev))
+                        or (e_type==EType.NOZZLE and no_prev)):
+                    continue
+            removed[key] = elmnt
+            for en in elements_next:
+                lost_prev[id(en)] += 1
+            for ep in elements_previous:
+                lost_next[id(ep)] += 1
+            stack.extend(reversed(elements_previous))
+            stack.extend(reversed(elements_next))
+        return list(removed.values())
+
+    def _detach(self, elmnts):
+        '''
+        Разрыв всех связей элементов за один проход: списки связей каждого оставшегося 
+        соседнего элемента перестраиваются однократно
+        '''
+        drop = {id(elmnt) for elmnt in elmnts}
+        border = {}
+        for elmnt in elmnts:
+            for linked in elmnt.elements_next + elmnt.elements_previous:
+                if not id(linked) in drop:
+                    border[id(linked)] = linked
+        for elmnt in border.values():
+            elmnt.elements_next[:] = [en for en in elmnt.elements_next if not id(en) in drop]
+            elmnt.elements_previous[:] = [ep for ep in elmnt.elements_previous if not id(ep) in drop]
+        for elmnt in elmnts:
+            elmnt.elements_next = []
+            elmnt.elements_previous = []
+        if elmnts:
+            _topology_changed()
+
+    def _removeElements(self, elmnts):
+        '''Исключение элементов из списков и индексов модели'''
+        self._syncSets()
+        elmnts = [elmnt for elmnt in elmnts if self._contains(elmnt)]
+        if not elmnts:
+            return
+        drop = set(elmnts)
+        for elmnt in elmnts:
+            self._unindexName(elmnt, elmnt.name)
+            self._exclude(elmnt)
+        _exclude(self.elmnts, elmnts, drop)
+        if not self._in_set.isdisjoint(drop):
+            _exclude(self.elmnts_in, [elmnt for elmnt in elmnts if elmnt in self._in_set], drop)
+            self._in_set -= drop
+        if not self._out_set.isdisjoint(drop):
+            _exclude(self.elmnts_out, [elmnt for elmnt in elmnts if elmnt in self._out_set], drop)
+            self._out_set -= drop
+
+    def fire_dead_elements_try(self, elmnt: Element):
+        '''
+        Попытка удалить мертвые элементы из модели, начиная с elmnt
+        '''
+        # print('Проверка элемента:', elmnt.name)
+        if self._isDead(elmnt):
+            self.delElement(elmnt)
+        return self
+
+    def _components(self):
+        '''
+        Компоненты связности модели (объединение элементов по связям)
+            Выход:
+                dict - {id(элемент): индекс в elmnts}\n
+                list - индексы следующих элементов модели для каждого элемента\n
+                list - компоненты - списки индексов элементов (по убыванию размера)\n
+                list - номера компонент без насосов или без стволов
+        '''
+        elmnts = self.elmnts
+        ne = len(elmnts)
+        index = {id(elmnt): i for i, elmnt in enumerate(elmnts)}
+        nxt = [[index[id(en)] for en in elmnt.elements_next if id(en) in index] for elmnt in elmnts]
+        parent = list(range(ne))
+        def find(x):
+            while parent[x]!=x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for i in range(ne):
+            for j in nxt[i]:
+                a, b = find(i), find(j)
+                if a!=b:
+                    parent[a] = b
+        groups = {}
+        for i in range(ne):
+            groups.setdefault(find(i), []).append(i)
+        components = sorted(groups.values(), key=len, reverse=True)
+        inactive = [k for k, group in enumerate(components)
+                    if not any(elmnts[i].type==EType.PUMP for i in group)
+                    or not any(elmnts[i].type==EType.NOZZLE for i in group)]
+        return index, nxt, components, inactive
+
+    def validate(self):
+        '''
+        Проверка топологии модели за один проход (время линейно по количеству элементов и связей)
+            Выход:
+                dict - {'ok': нет мертвых элементов, превышения количества патрубков и связей с элементами вне модели,
+                'components': компоненты связности - списки имен элементов (по убыванию размера),
+                'inactive': номера компонент (в components) без насосов или без стволов,
+                'dead': имена элементов, удаляемых prune (мертвые и ставшие мертвыми после их удаления),
+                'overloaded': [(имя, 'ri' | 'ro', подключено, допустимо)],
+                'foreign': [(имя, имя связанного элемента вне модели)],
+                'cycles': замкнутые контуры - списки имен элементов в порядке связей (не более одного на компоненту)}
+        '''
+        elmnts = self.elmnts
+        ne = len(elmnts)
+        index, nxt, components, inactive = self._components()
+        label = [0]*ne
+        for k, group in enumerate(components):
+            for i in group:
+                label[i] = k
+
+        # Замкнутые контуры: после исключения элементов без предыдущих остаются контуры и элементы после них
+        count = [0]*ne
+        for i in range(ne):
+            for j in nxt[i]:
+                count[j] += 1
+        prv = [[] for _ in range(ne)]
+        for i in range(ne):
+            for j in nxt[i]:
+                prv[j].append(i)
+        stack = [i for i in range(ne) if count[i]==0]
+        while stack:
+            i = stack.pop()
+            for j in nxt[i]:
+                count[j] -= 1
+                if count[j]==0:
+                    stack.append(j)
+        cycles = []
+        seen_components = set()
+        for i in range(ne):
+            if count[i]==0 or label[i] in seen_components:
+                continue
+            seen_components.add(label[i])
+            position, path = {}, []
+            while not i in position:
+                position[i] = len(path)
+                path.append(i)
+                i = next(p for p in prv[i] if count[p]>0)
+            cycles.append([elmnts[k].name for k in reversed(path[position[i]:])])
+
+        overloaded = []
+        foreign = []
+        for elmnt in elmnts:
+            if len(elmnt.elements_previous)>elmnt.ri:
+                overloaded.append((elmnt.name, 'ri', len(elmnt.elements_previous), elmnt.ri))
+            if len(elmnt.elements_next)>elmnt.ro:
+                overloaded.append((elmnt.name, 'ro', len(elmnt.elements_next), elmnt.ro))
+            foreign += [(elmnt.name, linked.name) for linked in elmnt.elements_next + elmnt.elements_previous
+                        if not id(linked) in index]
+
+        dead = [elmnt.name for elmnt in self._cascade([elmnt for elmnt in elmnts if self._isDead(elmnt)])]
+        return {'ok': not (dead or overloaded or foreign),
+                'components': [[elmnts[i].name for i in group] for group in components],
+                'inactive': inactive, 'dead': dead, 'overloaded': overloaded, 'foreign': foreign, 'cycles': cycles}
+
+    def prune(self, components=None, overloaded=False):
+        '''
+        Очистка модели за один проход: удаление мертвых элементов (насосов без выходов, соединений 
+        без входов или выходов, стволов без входов) вместе со ставшими мертвыми после их удаления.
+        Все связи удаляемых элементов разрываются и элементы исключаются из модели одним пакетом.
+            Вход:
+                components=str: удаление компонент связности: None - не удалять,
+                'inactive' - удалить компоненты без насосов или без стволов (см. validate),
+                'largest' - оставить только наибольшую компоненту
+                overloaded=bool: отключить связи сверх допустимого количества патрубков
+                (последние подключенные - append не подключает элементы сверх патрубков, 
+                поэтому лишними считаются связи, добавленные напрямую)
+            Выход:
+                dict - {'removed': имена удаленных элементов, 'unlinked': количество отключенных связей сверх патрубков}
+        '''
+        unlinked = 0
+        if overloaded:
+            for elmnt in self.elmnts:
+                while len(elmnt.elements_previous)>elmnt.ri:
+                    ep = elmnt.elements_previous.pop()
+                    ep.elements_next.remove(elmnt)
+                    unlinked += 1
+                while len(elmnt.elements_next)>elmnt.ro:
+                    en = elmnt.elements_next.pop()
+                    en.elements_previous.remove(elmnt)
+                    unlinked += 1
+            if unlinked:
+                _topology_changed()
+
+        forced = []
+        if components is not None:
+            if not components in ('inactive', 'largest'):
+                raise ValueError(f'Неизвестный способ удаления компонент {components}')
+            _, _, groups, inactive = self._components()
+            drop = inactive if components=='inactive' else range(1, len(groups))
+            forced = [self.elmnts[i] for k in drop for i in groups[k]]
+
+        seeds = forced + [elmnt for elmnt in self.elmnts if self._isDead(elmnt)]
+        removed = self._cascade(seeds, forced=forced)
+        self._detach(removed)
+        self._removeElements(removed)
+        return {'removed': [elmnt.name for elmnt in removed], 'unlinked': unlinked}
+
+    def getElement(self, name):
+        '''
+        Возвращает элемент модели с указанным name. 
+        Если элемент не найден, возвращается None.
+
+        # Вход
+
+        `name`
+            Имя элемента
+        '''
+        return self._names.get(name)
+
+
+    def interpretate(self):
+        '''
+        Интерпретация 
+        (распределеине по спискам входящих и выходящих элементов)
+        элементов модели
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        self._syncSets()
+        for elmnt in self.elmnts:
+            if elmnt.type==0 and not elmnt in self._in_set:
+                self.elmnts_in.append(elmnt)
+                self._in_set.add(elmnt)
+            elif elmnt.type==2 and not elmnt in self._out_set:
+                self.elmnts_out.append(elmnt)
+                self._out_set.add(elmnt)
+        # logger.warning("Функция `interpretate` устарела и в будущем будет удалена. Ее использование настоятельно не рекомендуется!")
+        return self
+
+    def clear(self):
+        '''
+        Очистка списков элементов
+        '''
+        for elmnt in self.elmnts:
+            self._exclude(elmnt)
+        self.elmnts=[]
+        self.elmnts_in=[]
+        self.elmnts_out=[]
+        self.counter=0
+        self.solved=None
+        self._names={}
+        self._names_count={}
+        self._in_set=set()
+        self._out_set=set()
+        return self
+
+    def addElementsIn(self, elmnts):
+        '''
+        Добавляет элементы в список элементов-источников (насосы и прочее)
+            Вход:
+                elmnts=List(Element): Список элементов для добавления в список элементов-источников 
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        self.elmnts_in=elmnts
+        self._in_set=set(elmnts)
+        return self
+
+    def addElementsOut(self, elmnts):
+        '''
+        Добавляет элементы в список элементов-расхода (стволы и прочее)
+            Вход:
+                elmnts=List(Element): Список элементов для добавления в список элементов-расхода 
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        self.elmnts_out=elmnts
+        self._out_set=set(elmnts)
+        return self
+
+    def build(self, elmnt, interpretate=True):
+        '''
+        Построение модели из единственного элемента
+            Вход:
+                `elmnt`: Element 
+                Стартовый элемент от которого будет происходить построение модели\n
+                `interpretate`: bool = True 
+                Если равно True, происходит автоматическая интерпретация 
+                (распределение по спискам входящих и выходящих элементов)
+                элементов модели
+        '''
+        self._elementAdd(elmnt)
+        
+        if interpretate:
+            self.interpretate()
+
+        return self
+
+    def _elementAdd(self, elmnt):
+        '''
+        Добавление элементов в модель (обход в глубину без рекурсии)
+            Вход:
+                elmnt=Element: элемент который следует добавить модель. 
+                Далее в модель добавляются все связанные с ним элементы
+        '''
+        stack = [elmnt]
+        while stack:
+            elmnt = stack.pop()
+            if not self._contains(elmnt):
+                self.appendElement(elmnt)
+                stack.extend(reversed(elmnt.elements_previous))
+                stack.extend(reversed(elmnt.elements_next))
+
+    def compile(self):
+        '''
+        Компиляция модели в плоский порядок расчета (NRS_Plan).
+        Вызывается автоматически при расчете, если связи элементов или списки
+        входящих и выходящих элементов изменились с момента последней компиляции.
+        При прямом изменении списков elements_next/elements_previous компиляцию следует выполнить вручную.
+        Запас емкости хранилища модели при этом освобождается (см. ElementStore.trim).
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        self.store.trim()
+        if self.profiler is None:
+            self.plan = NRS_Plan(self)
+        else:
+            self.plan = self.profiler.wrap('compile', NRS_Plan, visits=len(self.elmnts))(self)
+        return self
+
+    def profile(self, enabled=True):
+        '''
+        Включение или отключение профилирования расчетов модели (см. NRS_Profiler).
+        Показатели накапливаются по всем последующим расчетам до повторного включения.
+            Вход:
+                enabled=bool: включить ли профилирование
+            Выход:
+                NRS_Profiler - профилировщик модели (None при отключении)
+        '''
+        self.profiler = NRS_Profiler() if enabled else None
+        return self.profiler
+
+    def cache_solutions(self, size=128):
+        '''
+        Включение или отключение кэша сошедшихся решений модели (см. NRS_SolutionCache).
+        При включенном кэше расчет до точности (calc с accuracy>0) для уже рассчитанной 
+        схемы с теми же параметрами не выполняется: сохраненное решение записывается в модель 
+        без итераций (callback и фиксация промежуточных состояний не вызываются).
+            Вход:
+                size=int: наибольшее количество хранимых решений (0 или None - отключить кэш)
+            Выход:
+                NRS_SolutionCache - кэш модели (None при отключении)
+        '''
+        self.cache = NRS_SolutionCache(size) if size else None
+        return self.cache
+
+    def signature(self):
+        '''
+        Каноническая сигнатура модели: хэш связей элементов, их типов, количества входов и выходов, 
+        функций q_out, параметров s, n, p, z, H_add и напоров на входе источников.
+        Не зависит от имен элементов и расчетного состояния, меняется при любом изменении 
+        связей или параметров элементов.
+            Выход:
+                str
+        '''
+        return self._signature(self.get_plan())[0]
+
+    def _signature(self, plan):
+        '''
+        Сигнатура модели по скомпилированному плану (см. signature)
+            Выход:
+                str - сигнатура\n
+                tuple - функции q_out элементов (незарегистрированные функции входят в сигнатуру 
+                по id, поэтому должны существовать, пока используется сигнатура)
+        '''
+        elmnts = plan.elmnts
+        registered = {id(func): name for name, func in Q_OUT_FUNCS.items()}
+        funcs = [elmnt.q_out for elmnt in elmnts]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.array([(elmnt.type, elmnt.ri, elmnt.ro) for elmnt in elmnts], dtype=np.int64).tobytes())
+        digest.update('\0'.join(registered.get(id(func)) or f'id:{id(func)}' for func in funcs).encode())
+        ins = [plan.index.get(id(elmnt), -1) for elmnt in self.elmnts_in]
+        for links in (plan.next_ptr, plan.next_idx, plan.prev_ptr, plan.prev_idx, plan.out, ins):
+            digest.update(np.array(links, dtype=np.int64).tobytes())
+            digest.update(b'|')
+        for c in ('s', 'n', 'p', 'z', 'H_add'):
+            digest.update(plan.column(c).tobytes())
+        roots = np.diff(np.array(plan.prev_ptr))==0
+        digest.update(plan.column('H_in')[roots].tobytes())
+        return digest.hexdigest(), tuple(set(funcs))
+
+    def find_cycle(self):
+        '''
+        Поиск замкнутого контура элементов модели: кольца по направлению связей 
+        или параллельных линий между разветвлением и водосборником
+            Выход:
+                list(Element) - элементы одного контура в порядке связей (пустой список - контуров нет)
+        '''
+        plan = self.get_plan()
+        return [plan.elmnts[i] for i in plan.cycle]
+
+    def get_plan(self):
+        '''
+        Возвращает актуальный скомпилированный порядок расчета модели
+            Выход:
+                NRS_Plan
+        '''
+        if self.plan is None or not self.plan.is_actual(self):
+            self.compile()
+        return self.plan
 
     def observersInit(self):
         '''
-        Инициация всех обозревателей модели
+        Инициация всех обозревателей модели
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        for elmnt in self.elmnts:
+            elmnt.observerInit()
+        return self
+
+    def auto_method(self):
+        '''
+        Выбор метода расчета модели (см. calc с method=None): 'iter' для НРС без замкнутых контуров, 
+        'newton' для НРС с контурами (кольца, параллельные линии между разветвлением и водосборником).
+        Если метод Ньютона не поддерживает функцию расхода одного из стволов, контур из параллельных линий 
+        рассчитывается проходами по напорам и расходам с предупреждением (распределение расхода 
+        между линиями приближенное).
+            Выход:
+                str - 'iter' или 'newton'
+        '''
+        plan = self.get_plan()
+        if not plan.cyclic:
+            return 'iter'
+        elmnt = NRS_Newton.unsupported(plan)
+        if elmnt is None or plan.ring:
+            logger.debug('НРС %s содержит замкнутый контур, расчет методом Ньютона', self.name)
+            return 'newton'
+        warnings.warn(f'НРС {self.name} содержит замкнутый контур, но метод newton не поддерживает '
+                      f'функцию расхода элемента {elmnt.name}: расчет проходами по напорам и расходам, '
+                      f'распределение расхода между параллельными линиями приближенное', Warning)
+        return 'iter'
+
+    def calc(self,
+            iters     = None,
+            callback  = None,
+            accuracy  = 0,
+            fixStates = True,
+            step      = 0.5,
+            method    = None,
+            incremental = True,
+            accelerate  = None):
+        '''
+        Рассчитывает модель
+            Вход:
+                `iters`:int 
+                количество циклов расчета, ед. По умолчанию (None) - один цикл, 
+                для метода 'newton' - до достижения точности NRS_Newton.accuracy
+
+                `callback`:callable 
+                функция вызываемая по окончании каждой итерации. По умолчанию callback=None
+
+                `accuracy`:float = 0
+                точность расчета НРС. Если точность не равна 0, 
+                то модель будет рассчитываться до тех пор, 
+                пока не будет достигнута указанная точность.
+                
+                `fixStates`:Bool=True 
+                фиксировать ли состояния модели при расчете
+
+                `step`:float=0.5
+                начальный коэффициент релаксации расходов при расчете с ускорением (см. accelerate).
+                Позволяет избежать выхода значений расхода за допустимые пределы при резком изменении напора.
+
+                `method`:str=None
+                метод расчета: 'iter' - последовательные проходы по напорам и расходам,
+                'newton' - решение системы уравнений НРС методом Ньютона-Рафсона (см. NRS_Newton),
+                None - выбор метода по модели (см. auto_method).
+                Для метода 'newton' при accuracy>0 расчет ведется до изменения расходов не более accuracy,
+                при accuracy=0 и заданном iters выполняется iters шагов метода (точность определяется 
+                по норме невязки, см. NRS_Newton.tolerance), иначе - расчет до точности NRS_Newton.accuracy.
+                НРС с замкнутыми контурами (см. find_cycle) при method=None рассчитываются методом 'newton'.
+                Явно указанный метод 'iter' для параллельных линий между разветвлением и водосборником 
+                дает приближенное распределение расхода, для колец по направлению связей - ValueError.
+
+                `incremental`:Bool=True
+                пересчитывать только часть модели, затронутую изменением параметров элементов 
+                (s, n, p, z, H_add, q_out, H_in источников) после последнего сошедшегося расчета.
+                Используется для метода 'iter' при accuracy>0 и неизменной топологии модели.
+
+                `accelerate`:str=None
+                релаксация и ускорение сходимости метода 'iter' (см. NRS_Relaxation): 
+                None - без релаксации, 'relax' - адаптивная нижняя релаксация, 
+                'aitken' - динамическая релаксация Эйткена, 'anderson' - ускорение Андерсона.
+                Позволяет получить решение для НРС, расчет которых без релаксации не стабилен. 
+                При accuracy>0 точность сравнивается с суммой изменений расходов стволов за итерацию, 
+                количество итераций ограничено (max_iters), пересчет части модели не используется.
+            Выход:
+                `NRS_Model` - ссылка на текущий экземпляр модели\n
+                `NRS_CalcResult` - результат расчета: количество итераций, последнее изменение расхода, 
+                причина окончания расчета, время расчета, история изменения расхода, невязки по элементам
+        '''
+        if method is None:
+            method = self.auto_method()
+        elif method=='iter':
+            self.get_plan().check_acyclic(loops=False)
+        if self.cache is not None and accuracy>0:
+            return self.cache.calc(self, method, accuracy, fixStates,
+                                   dict(iters=iters, callback=callback, accuracy=accuracy, fixStates=fixStates,
+                                        step=step, method=method, incremental=incremental, accelerate=accelerate))
+        start = time.perf_counter()
+        if method=='newton':
+            self.solved = None
+            return self._calc_newton(iters, callback, accuracy, fixStates, start)
+        elif method!='iter':
+            raise ValueError(f'Неизвестный метод расчета {method}')
+        if iters is None:
+            iters = 1
+
+        plan = self.get_plan()
+        if accelerate is not None:
+            return self._calc_relaxed(plan, iters, callback, accuracy, fixStates, start,
+                                      NRS_Relaxation(accelerate, step))
+        if incremental and accuracy>0 and self.solved is plan and plan.store is not None:
+            return self._calc_part(plan, callback, accuracy, fixStates, start)
+        self.solved = None
+        if plan.store is not None:
+            plan.store.dirty.clear()
+        # Q=[10000, 1000, self.summaryQ()]
+        Q = [100000, 10000, 1000]
+        QD_2 = float('nan')
+        history = []
+        # Фазы расчета (при включенном профилировании - с учетом показателей, см. NRS_Profiler)
+        head_pass, flow_reset, flow_pass = plan.head_pass, plan.flow_reset, plan.flow_pass
+        fixState, summaryQ = self.fixState, self.summaryQ
+        if self.profiler is not None:
+            head_pass, flow_reset, flow_pass, fixState, summaryQ, callback = self.profiler.instrument(self, plan, callback)
+        # print(Q)
+        if accuracy==0:
+            # if iters>=3:
+                # Q=[0,0,0]
+            for i in range(iters):
+                # Прямой проход по напорам и обратный проход по расходам
+                head_pass()
+                flow_reset()
+                flow_pass(reset=False)
+                # Попытка уйти от комплексности в отдельных случаях (пока безуспешно)
+                # new_q = elmnt.get_q_out()
+                # if abs(elmnt.q - new_q) > step:
+                #     if elmnt.q - new_q > 0:
+                #         new_q = elmnt.q - step
+                #     else:
+                #         new_q = elmnt.q + step
+                # elmnt.q = 0 # Обнуляем для того, чтобы дальнейшее суммирование производительностей проводилось корректно
+                # elmnt.set_q(new_q)
+                if fixStates:
+                    fixState()
+                    # for elmnt in self.elmnts:
+                    #     elmnt.fixState()
+                if callback:
+                    callback(self)
+
+                # if iters>=3:
+                Q[0]=Q[1]
+                Q[1]=Q[2]
+                Q[2]=summaryQ()
+                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_out])
+
+
+                QD_1=abs(Q[1]-Q[0])
+                QD_2=abs(Q[2]-Q[1])
+                history.append(QD_2)
+
+                # if QD_1<QD_2:
+                #     print("Расчет НРС не возможен")
+
+        if accuracy>0:
+            i=0
+            # print('до', Q)
+            # while abs(Q[2]-Q[1])>accuracy:      # and not Q[2]==Q[1]:
+            while abs(Q[2]-Q[1])>accuracy and Q[2]!=Q[1]:
+                # print(i)
+                # print('0', Q)
+                # Прямой проход по напорам и обратный проход по расходам
+                head_pass()
+                flow_reset()
+                flow_pass(reset=False)
+                # Попытка уйти от комплексности в отдельных случаях (пока безуспешно)
+                # print('-'*10)
+                # new_q = elmnt.get_q_out()
+                # # print(elmnt.q, elmnt.H_in, new_q, elmnt.q - new_q)
+                # if abs(elmnt.q - new_q) > step:
+                #     if elmnt.q - new_q > 0:
+                #         new_q = elmnt.q - step
+                #     else:
+                #         new_q = elmnt.q + step
+                # # print(elmnt.q, new_q)
+                # elmnt.q = 0 # Обнуляем для того, чтобы дальнейшее суммирование производительностей проводилось корректно
+                # elmnt.set_q(new_q)
+                if fixStates:
+                    fixState()
+                    # for elmnt in self.elmnts:
+                    #     elmnt.fixState()
+                if callback:
+                    callback(self)
+
+                # if iters>=3:
+                Q[0]=Q[1]
+                Q[1]=Q[2]
+                Q[2]=summaryQ()
+                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_in])
+                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_out])
+                # print(Q[2])
+                
+                QD_1=abs(Q[1]-Q[0])
+                QD_2=abs(Q[2]-Q[1])
+                history.append(QD_2)
+                if QD_1<=QD_2:
+                    # logger.debug("Расчет НРС не возможен")
+                    # print('Невязки', Q, QD_1, QD_2)
+                    warnings.warn("НРС с заданными параметрами не стабильна!", Warning)
+                    return self, self._result(plan, start, history, fixStates, i, QD_2, 'oscillation')
+                    # raise ValueError("НРС с заданными параметрами не стабильна")
+
+                i+=1
+
+            # QD_2 - QD_1 - невязка модели
+            QD_1=abs(Q[1]-Q[0])
+            QD_2=abs(Q[2]-Q[1])
+            self.solved = plan
+            return self, self._result(plan, start, history, fixStates, i, QD_2, 'converged')
+
+        return self, self._result(plan, start, history, fixStates, iters, QD_2, 'iters') #- QD_1
+
+    def _result(self, plan, start, history, fixStates, iters, QD2, stop, correct=None):
+        '''
+        Завершение расчета: фиксация итогового состояния и формирование результата (см. NRS_CalcResult)
+        '''
+        if fixStates:
+            self.fixFinalState()
+        return NRS_CalcResult(self, plan, iters=iters, QD2=QD2,
+                              correct=stop!='oscillation' if correct is None else correct,
+                              stop=stop, time=time.perf_counter()-start, history=np.array(history))
+
+    def _calc_part(self, plan, callback, accuracy, fixStates, start):
+        '''
+        Пересчет части модели, затронутой изменением параметров элементов после последнего 
+        сошедшегося расчета (см. NRS_Plan.affected). Расчет начинается с предыдущего решения, 
+        критерий сходимости и проверка устойчивости - как в calc.
+            Выход:
+                `NRS_Model` - ссылка на текущий экземпляр модели\n
+                `NRS_CalcResult` - результат расчета
+        '''
+        prof = self.profiler
+        affected = plan.affected if prof is None else prof.wrap('affected', plan.affected)
+        part = affected(plan.store.dirty)
+        plan.store.dirty.clear()
+        self.solved = None
+        Q = [100000, 10000, 1000]
+        QD_2 = 0
+        history = []
+        i = 0
+        head_pass, flow_pass, fixState = plan.head_pass_part, plan.flow_pass_part, self.fixState
+        if prof is not None:
+            head_pass = prof.wrap('head_pass_part', head_pass, visits=len(part[0]))
+            flow_pass = prof.wrap('flow_pass_part', flow_pass, visits=len(part[1]), q_out=len(part[2]))
+            fixState  = prof.wrap('fixState', fixState, visits=len(self.elmnts))
+            callback  = callback and prof.wrap('callback', callback)
+        if part[0] or part[1]:
+            while abs(Q[2]-Q[1])>accuracy and Q[2]!=Q[1]:
+                head_pass(part)
+                Q[0]=Q[1]
+                Q[1]=Q[2]
+                Q[2]=flow_pass(part)
+                if fixStates:
+                    fixState()
+                if callback:
+                    callback(self)
+
+                QD_1=abs(Q[1]-Q[0])
+                QD_2=abs(Q[2]-Q[1])
+                history.append(QD_2)
+                if QD_1<=QD_2:
+                    warnings.warn("НРС с заданными параметрами не стабильна!", Warning)
+                    return self, self._result(plan, start, history, fixStates, i, QD_2, 'oscillation')
+                i+=1
+
+        self.solved = plan
+        return self, self._result(plan, start, history, fixStates, i, QD_2, 'converged')
+
+    def _calc_relaxed(self, plan, iters, callback, accuracy, fixStates, start, relax, max_iters=1000):
+        '''
+        Итерационный расчет с релаксацией и ускорением сходимости (см. NRS_Relaxation).
+        Каждая итерация начинается с приближения, полученного из результатов предыдущих итераций,
+        и заканчивается полным проходом, поэтому после расчета состояние модели согласовано.
+            Выход:
+                `NRS_Model` - ссылка на текущий экземпляр модели\n
+                `NRS_CalcResult` - результат расчета ('QD2' и 'history' - сумма изменений расходов стволов 
+                за итерацию, 'stop'='iters' при accuracy>0 - точность не достигнута за max_iters итераций)
+        '''
+        self.solved = None
+        if plan.store is not None:
+            plan.store.dirty.clear()
+        head_pass, flow_reset, flow_pass = plan.head_pass, plan.flow_reset, plan.flow_pass
+        fixState = self.fixState
+        if self.profiler is not None:
+            head_pass, flow_reset, flow_pass, fixState, _, callback = self.profiler.instrument(self, plan, callback)
+        out = plan.out
+        x = plan.column('q')
+        QD_2 = float('nan')
+        history = []
+        count = iters if accuracy==0 else max_iters
+        i = 0
+        while i<count:
+            try:
+                head_pass()
+            except ValueError:
+                # Выход напора за допустимые пределы - повтор от предыдущего приближения с меньшим шагом
+                x = relax.backtrack()
+                if x is None or relax.stalled:
+                    raise
+                plan.set_column('q', x)
+                continue
+            flow_reset()
+            flow_pass(reset=False)
+            gx = plan.column('q')
+            if fixStates:
+                fixState()
+            if callback:
+                callback(self)
+
+            QD_2 = float(np.abs(gx[out]-x[out]).sum())
+            history.append(QD_2)
+            i+=1
+            if accuracy>0 and QD_2<=accuracy:
+                self.solved = plan
+                return self, self._result(plan, start, history, fixStates, i, QD_2, 'converged')
+            if i<count:
+                x = relax.update(x, gx)
+                if relax.stalled:
+                    warnings.warn("НРС с заданными параметрами не стабильна!", Warning)
+                    return self, self._result(plan, start, history, fixStates, i, QD_2, 'oscillation')
+                plan.set_column('q', x)
+
+        if accuracy>0:
+            warnings.warn(f"Точность расчета НРС не достигнута за {max_iters} итераций", Warning)
+            return self, self._result(plan, start, history, fixStates, i, QD_2, 'iters', correct=False)
+        return self, self._result(plan, start, history, fixStates, i, QD_2, 'iters')
+
+    def _calc_newton(self, iters, callback, accuracy, fixStates, start, max_iters=100):
+        '''
+        Расчет модели методом Ньютона-Рафсона: при accuracy>0 - до изменения расходов не более accuracy 
+        (не более max_iters шагов), при заданном iters и accuracy=0 - iters шагов с проверкой нормы невязки, 
+        по умолчанию - до изменения расходов не более NRS_Newton.accuracy
+            Выход:
+                `NRS_Model` - ссылка на текущий экземпляр модели\n
+                `NRS_CalcResult` - результат расчета ('QD2' и 'history' - наибольшее изменение расхода элементов на шаге,
+                'correct' - достигнута ли точность)
+        '''
+        plan = self.get_plan()
+        system = NRS_Newton(plan, self)
+        R, H_add, z, H_fixed = system.params()
+        q, H = system.initial()
+        step, write = system.step, system.write
+        if self.profiler is not None:
+            step  = self.profiler.wrap('newton_step', step, visits=len(plan.elmnts))
+            write = self.profiler.wrap('newton_write', write, visits=len(plan.elmnts))
+
+        if iters is None and accuracy==0:
+            accuracy = NRS_Newton.accuracy
+        if accuracy==0:
+            count = iters
+        else:
+            count = max_iters if iters is None else max(iters, max_iters)
+        dq = 0
+        norm = float('nan')
+        history = []
+        i = 0
+        while i<count:
+            q, H, dq, norm = step(q, H, R, H_add, z, H_fixed)
+            history.append(dq)
+            i+=1
+            if fixStates or callback:
+                write(q, H, H_fixed)
+                if fixStates:
+                    self.fixState()
+                if callback:
+                    callback(self)
+            if accuracy>0 and dq<=accuracy:
+                break
+
+        write(q, H, H_fixed, check=True)
+        correct = norm<=NRS_Newton.tolerance if accuracy==0 else dq<=accuracy
+        if not correct:
+            warnings.warn("Расчет НРС методом Ньютона не достиг заданной точности!", Warning)
+        stop = 'converged' if accuracy>0 and correct else 'iters'
+        return self, self._result(plan, start, history, fixStates, i, dq, stop, correct)
+
+    def calc_batch(self,
+                   scenarios,
+                   iters      = None,
+                   accuracy   = 0.05,
+                   drop_q     = False,
+                   approved_H = 120,
+                   max_iters  = 1000):
+        '''
+        Пакетный расчет модели для набора сценариев (см. NRS_Batch).
+        Все сценарии рассчитываются одновременно, состояния элементов при этом не изменяются.
+        НРС с замкнутыми контурами, для которых выбирается метод 'newton' (см. auto_method), 
+        рассчитываются по одному сценарию методом Ньютона (медленнее векторизованного расчета).
+            Вход:
+                `scenarios`:dict
+                значения параметров элементов по сценариям в виде {'имя элемента.параметр': массив}, например
+                {'Н1.H_add': np.arange(10, 100), 'МРЛ.n': 3}. Скаляры распространяются на все сценарии.
+
+                `iters`:int=None
+                количество циклов расчета. Если указано, точность расчета не проверяется
+
+                `accuracy`:float=0.05
+                точность расчета, аналогично calc. Каждый сценарий рассчитывается до достижения точности
+                или до признания его нестабильным
+
+                `drop_q`:bool=False
+                начинать ли расчет с нулевых расходов (аналог drop_q перед calc)
+
+                `approved_H`:float=120
+                предельно допустимый напор. Сценарии с выходом напоров за допустимые пределы
+                признаются некорректными, их значения заполняются NaN
+
+                `max_iters`:int=1000
+                предельное количество циклов расчета при accuracy>0
+            Выход:
+                dict - {имя элемента: {'H_in': массив, 'h': массив, 'q': массив}}\n
+                dict - {'iters': массив количества итераций, 'QD2': массив невязок,
+                'stable': признаки стабильности, 'feasible': признаки допустимости напоров,
+                'correct': признаки корректности расчета сценариев}
+        '''
+        plan = self.get_plan()
+
+        # Разбор параметров сценариев
+        values = {}
+        for key, val in scenarios.items():
+            name, _, attr = key.rpartition('.')
+            elmnt = self.getElement(name)
+            if elmnt is None:
+                raise ValueError(f'Элемент {name} не найден в модели {self.name}')
+            values[(elmnt, attr)] = np.asarray(val, dtype=float)
+        size = max([v.size for v in values.values() if v.ndim>0], default=1)
+        if plan.cyclic and self.auto_method()=='newton':
+            return self._calc_each(values, size, iters, accuracy, drop_q, approved_H, max_iters)
+
+        batch = NRS_Batch(plan, size)
+        if drop_q:
+            batch.cols['q'][:] = 0
+        for (elmnt, attr), val in values.items():
+            batch.set_param(elmnt, attr, val)
+
+        cols     = batch.cols
+        Q        = [np.full(size, 100000.0), np.full(size, 10000.0), np.full(size, 1000.0)]
+        count    = np.zeros(size, dtype=int)
+        failed   = np.zeros(size, dtype=bool)
+        unstable = np.zeros(size, dtype=bool)
+        active   = np.ones(size, dtype=bool)
+        by_accuracy = iters is None and accuracy>0
+        for _ in range(max_iters if by_accuracy else (iters or 0)):
+            if not active.any():
+                break
+            frozen = ~active
+            if frozen.any():
+                saved = {attr: col[:, frozen].copy() for attr, col in cols.items()}
+
+            failed_now = batch.head_pass(approved_H)
+            Q_new = batch.flow_pass()
+
+            if frozen.any():
+                for attr, col in cols.items():
+                    col[:, frozen] = saved[attr]
+            Q[0] = np.where(active, Q[1], Q[0])
+            Q[1] = np.where(active, Q[2], Q[1])
+            Q[2] = np.where(active, Q_new, Q[2])
+            failed |= active & failed_now
+            QD_1 = np.abs(Q[1]-Q[0])
+            QD_2 = np.abs(Q[2]-Q[1])
+            active &= ~failed
+            if by_accuracy:
+                unstable_now = active & (QD_1<QD_2)
+                unstable |= unstable_now
+                active &= ~unstable_now
+                count += active
+                active &= (QD_2>accuracy) & (Q[2]!=Q[1])
+            else:
+                count += active
+
+        # Результаты по элементам модели
+        res = {}
+        for elmnt in self.elmnts:
+            i = plan.index.get(id(elmnt))
+            res[elmnt.name] = {}
+            for attr in ('H_in', 'h', 'q'):
+                if i is None:
+                    col = np.full(size, float(getattr(elmnt, attr)))
+                else:
+                    col = cols[attr][i].copy()
+                col[failed] = np.nan
+                res[elmnt.name][attr] = col
+        return res, {'iters':count, 'QD2':np.abs(Q[2]-Q[1]), 'stable':~unstable,
+                     'feasible':~failed, 'correct':~unstable & ~failed}
+
+    def _calc_each(self, values, size, iters, accuracy, drop_q, approved_H, max_iters):
+        '''
+        Расчет сценариев по одному методом Ньютона (НРС с замкнутыми контурами, см. calc_batch).
+        Каждый сценарий рассчитывается от исходного состояния модели, после расчета оно восстанавливается.
+            Вход:
+                values=dict: значения параметров {(элемент, параметр): массив или скаляр}
             Выход:
-                NRS_Model: ссылка на текущую модель
+                dict, dict - аналогично calc_batch
         '''
-        for elmnt in self.elmnts:
-            elmnt.observerInit()
-        return self
+        plan  = self.get_plan()
+        saved = {c: plan.column(c) for c in ElementStore.columns}
+        dirty = set(plan.store.dirty) if plan.store is not None else None
+        links = [(elmnt, attr, np.broadcast_to(val, size)) for (elmnt, attr), val in values.items()]
+        res = {elmnt.name: {c: np.full(size, np.nan) for c in ('H_in', 'h', 'q')} for elmnt in self.elmnts}
+        count    = np.zeros(size, dtype=int)
+        QD2      = np.full(size, np.nan)
+        correct  = np.zeros(size, dtype=bool)
+        feasible = np.ones(size, dtype=bool)
+        has_next = np.asarray(plan.has_next, dtype=bool)
+        try:
+            for j in range(size):
+                for elmnt, attr, val in links:
+                    setattr(elmnt, attr, float(val[j]))
+                if drop_q:
+                    plan.set_column('q', np.zeros(len(plan.elmnts)))
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore')
+                        _, result = self._calc_newton(iters, None, 0 if iters else accuracy, False,
+                                                      time.perf_counter(), max_iters)
+                    feasible[j] = not np.any(plan.column('H_out')[has_next]>approved_H)
+                except (ValueError, np.linalg.LinAlgError):
+                    feasible[j] = False
+                if feasible[j]:
+                    count[j], QD2[j], correct[j] = result['iters'], result['QD2'], result['correct']
+                    for elmnt in self.elmnts:
+                        row = res[elmnt.name]
+                        row['H_in'][j], row['h'][j], row['q'][j] = elmnt.H_in, elmnt.h, elmnt.q
+                for c, col in saved.items():
+                    plan.set_column(c, col)
+        finally:
+            for c, col in saved.items():
+                plan.set_column(c, col)
+            if plan.store is not None:
+                plan.store.dirty = dirty
+            self.solved = None
+        return res, {'iters': count, 'QD2': QD2, 'stable': correct | ~feasible,
+                     'feasible': feasible, 'correct': correct & feasible}
 
-    def calc(self,
-            iters     = 1,
-            callback  = None,
-            accuracy  = 0,
-            fixStates = True,
-            step      = 0.5):
+    def sweep(self,
+              grid,
+              workers = None,
+              chunk   = 10000,
+              product = True,
+              sink    = None,
+              **kwargs):
         '''
-        Рассчитывает модель
+        Перебор параметров модели по сетке с распределением расчета по процессам.
+        Модель передается каждому процессу-исполнителю один раз, сетка делится на части,
+        каждая часть рассчитывается пакетно (calc_batch), результаты собираются в массивы.
+        На платформах с поддержкой fork процессы наследуют модель без сериализации,
+        поэтому допускаются любые функции q_out (в том числе lambda). При запуске
+        процессов через spawn функции q_out должны быть определены на уровне модуля.
             Вход:
-                `iters`:int 
-                количество циклов расчета, ед. По умолчанию iters=1
+                `grid`:dict
+                значения параметров в виде {'имя элемента.параметр': массив}
 
-                `callback`:callable 
-                функция вызываемая по окончании каждой итерации. По умолчанию callback=None
+                `workers`:int=None
+                количество процессов. По умолчанию - количество процессоров. При workers=1 расчет ведется в текущем процессе
 
-                `accuracy`:float = 0
-                точность расчета НРС. Если точность не равна 0, 
-                то модель будет рассчитываться до тех пор, 
-                пока не будет достигнута указанная точность.
-                
-                `fixStates`:Bool=True 
-                фиксировать ли состояния модели при расчете
+                `chunk`:int=10000
+                количество точек сетки в одной части
 
-                `step`:float=0.5
-                шаг изменения расхода при расчете. 
-                Позволяет избежать выхода значений расхода за допустимые пределы при резком изменении напора.
+                `product`:bool=True
+                если True, рассчитываются все сочетания значений параметров (декартово произведение),
+                иначе массивы параметров рассматриваются как согласованные списки точек
+
+                `sink`:NRS_ResultSink=None
+                потоковая запись результатов: каждая рассчитанная часть сетки записывается строками
+                (столбцы 'H_in', 'h', 'q'; поля - параметры сетки и признаки расчета точек), 
+                результаты в памяти не накапливаются
+
+                `kwargs`
+                параметры пакетного расчета (см. calc_batch)
             Выход:
-                `NRS_Model` - ссылка на текущий экземпляр модели\n
-                int - количество итераций потребовавшихся для достижения необходимой точности расчета (при accuracy>0)
+                dict - {имя элемента: {'H_in': массив, 'h': массив, 'q': массив}} (None при записи в sink)\n
+                dict - признаки расчета точек (см. calc_batch), а также 'grid' - значения параметров в точках сетки
         '''
-        # Q=[10000, 1000, self.summaryQ()]
+        keys = list(grid.keys())
+        if product:
+            axes = np.meshgrid(*[np.atleast_1d(np.asarray(grid[key], dtype=float)) for key in keys], indexing='ij')
+            points = {key: axis.ravel() for key, axis in zip(keys, axes)}
+        else:
+            points = {key: np.broadcast_to(np.asarray(grid[key], dtype=float), 
+                                           np.broadcast_shapes(*[np.shape(v) for v in grid.values()])).ravel()
+                      for key in keys}
+        size = len(next(iter(points.values()))) if points else 1
+        tasks = [({key: val[start:start+chunk] for key, val in points.items()}, kwargs)
+                 for start in range(0, size, chunk)]
+
+        def collect(parts):
+            '''Части результатов (при записи в sink - только признаки расчета точек)'''
+            for (scenarios, _), (res, info) in zip(tasks, parts):
+                if sink is not None:
+                    sink.write({c: np.column_stack([res[name][c] for name in sink.elements]) for c in sink.columns},
+                               **scenarios, **info)
+                    res = None
+                yield res, info
+
+        workers = workers or os.cpu_count() or 1
+        if workers==1 or len(tasks)==1:
+            _sweep_init(self)
+            parts = list(collect(_sweep_chunk(task) for task in tasks))
+        else:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context,
+                                     initializer=_sweep_init, initargs=(self,)) as executor:
+                parts = list(collect(executor.map(_sweep_chunk, tasks)))
+        if sink is not None:
+            sink.flush()
+
+        res = None if sink is not None else {
+            name: {attr: np.concatenate([part[0][name][attr] for part in parts]) for attr in cols}
+            for name, cols in parts[0][0].items()}
+        info = {key: np.concatenate([part[1][key] for part in parts]) for key in parts[0][1]}
+        info['grid'] = points
+        return res, info
+
+    def _converge(self, plan, accuracy, max_iters, approved_H=120, method=None):
+        '''
+        Расчет модели от текущего состояния до достижения точности (критерии - как в calc)
+        с ограничением количества итераций. Если текущее состояние - сошедшееся решение 
+        для того же плана, пересчитывается только часть модели, затронутая изменениями.
+            Выход:
+                int - количество итераций\n
+                float - последнее изменение суммарного расхода\n
+                str - результат: 'ok', 'unstable' - расчет не стабилен, 
+                'infeasible' - напор вне допустимых пределов, 'max_iters' - точность не достигнута.
+                НРС с замкнутыми контурами при method=None рассчитываются методом Ньютона (см. auto_method)
+        '''
+        if plan.cyclic and (method or self.auto_method())=='newton':
+            self.solved = None
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    _, result = self._calc_newton(None, None, accuracy, False, time.perf_counter(), max_iters)
+            except (ValueError, np.linalg.LinAlgError):
+                return 0, 0, 'infeasible'
+            if np.any(plan.column('H_out')[np.asarray(plan.has_next, dtype=bool)]>approved_H):
+                return result['iters'], result['QD2'], 'infeasible'
+            return result['iters'], result['QD2'], 'ok' if result['correct'] else 'max_iters'
+        plan.check_acyclic(loops=False)
+        part = None
+        if self.solved is plan and plan.store is not None:
+            part = plan.affected(plan.store.dirty)
+            if not (part[0] or part[1]):
+                return 0, 0, 'ok'
+        if plan.store is not None:
+            plan.store.dirty.clear()
+        self.solved = None
+
         Q = [100000, 10000, 1000]
-        # print(Q)
-        if accuracy==0:
-            # if iters>=3:
-                # Q=[0,0,0]
-            for i in range(iters):
-                for elmnt in self.elmnts_in:
-                    elmnt.set_H_in(elmnt.H_in)
-                    # elmnt.set_H_in(elmnt.H_add + elmnt.H_in)  elmnt.H_add = self.h + self.H_in
-                for elmnt in self.elmnts_out:
-                    elmnt.set_q_zero()
-                    # for elmnt_in in elmnt.elements_previous:
-                    #     elmnt_in.set_q_zero()
-                for elmnt in self.elmnts_out:
-                    elmnt.set_q(elmnt.get_q_out())
-                    # Попытка уйти от комплексности в отдельных случаях (пока безуспешно)
-                    # new_q = elmnt.get_q_out()
-                    # if abs(elmnt.q - new_q) > step:
-                    #     if elmnt.q - new_q > 0:
-                    #         new_q = elmnt.q - step
-                    #     else:
-                    #         new_q = elmnt.q + step
-                    # elmnt.q = 0 # Обнуляем для того, чтобы дальнейшее суммирование производительностей проводилось корректно
-                    # elmnt.set_q(new_q)
-                if fixStates:
-                    self.fixState()
-                    # for elmnt in self.elmnts:
-                    #     elmnt.fixState()
-                if callback:
-                    callback(self)
+        QD_2 = 0
+        for i in range(max_iters):
+            try:
+                if part:
+                    plan.head_pass_part(part, approved_H)
+                    Q_new = plan.flow_pass_part(part)
+                else:
+                    plan.head_pass(approved_H)
+                    plan.flow_pass()
+                    Q_new = self.summaryQ()
+            except ValueError:
+                return i, QD_2, 'infeasible'
+            Q[0]=Q[1]
+            Q[1]=Q[2]
+            Q[2]=Q_new
+            QD_1=abs(Q[1]-Q[0])
+            QD_2=abs(Q[2]-Q[1])
+            if QD_1<=QD_2:
+                return i, QD_2, 'unstable'
+            if not (QD_2>accuracy and Q[2]!=Q[1]):
+                self.solved = plan
+                return i+1, QD_2, 'ok'
+        return max_iters, QD_2, 'max_iters'
 
-                # if iters>=3:
-                Q[0]=Q[1]
-                Q[1]=Q[2]
-                Q[2]=self.summaryQ()
-                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_out])
+    def continuation(self,
+                     param,
+                     values,
+                     accuracy   = 0.05,
+                     step       = None,
+                     min_step   = None,
+                     fast_iters = 5,
+                     max_iters  = 200,
+                     approved_H = 120):
+        '''
+        Расчет модели вдоль пути изменения параметра (метод продолжения по параметру).
+        Каждая точка рассчитывается от решения в предыдущей точке. Если расчет не сходится, 
+        шаг по параметру дробится (вплоть до min_step), если сходится быстро - увеличивается.
+        Точки, которые не удалось рассчитать, отмечаются, а границы области устойчивости 
+        и допустимости напоров фиксируются в info['boundary'].
+        По окончании расчета модель находится в состоянии последней рассчитанной точки.
+            Вход:
+                `param`:str
+                изменяемый параметр в виде 'имя элемента.параметр', например 'Н1.H_add'
 
+                `values`:array
+                значения параметра в точках пути (в порядке прохождения)
 
-                QD_1=abs(Q[1]-Q[0])
-                QD_2=abs(Q[2]-Q[1])
+                `accuracy`:float=0.05
+                точность расчета в каждой точке, аналогично calc
 
-                # if QD_1<QD_2:
-                #     print("Расчет НРС не возможен")
+                `step`:float=None
+                начальный наибольший шаг по параметру. По умолчанию - расстояние до следующей точки
 
-        if accuracy>0:
-            i=0
-            # print('до', Q)
-            # while abs(Q[2]-Q[1])>accuracy:      # and not Q[2]==Q[1]:
-            while abs(Q[2]-Q[1])>accuracy and Q[2]!=Q[1]:
-                # print(i)
-                # print('0', Q)
-                for elmnt in self.elmnts_in:
-                    elmnt.set_H_in(elmnt.H_in)      
-                #     # elmnt.set_H_in(elmnt.H_add + elmnt.H_in)
-                for elmnt in self.elmnts_out:
-                    elmnt.set_q_zero()
-                    # for elmnt_in in elmnt.elements_previous:
-                    #     elmnt_in.set_q_zero()
-                for elmnt in self.elmnts_out:
-                    elmnt.set_q(elmnt.get_q_out())
-                    # Попытка уйти от комплексности в отдельных случаях (пока безуспешно)
-                    # print('-'*10)
-                    # new_q = elmnt.get_q_out()
-                    # # print(elmnt.q, elmnt.H_in, new_q, elmnt.q - new_q)
-                    # if abs(elmnt.q - new_q) > step:
-                    #     if elmnt.q - new_q > 0:
-                    #         new_q = elmnt.q - step
-                    #     else:
-                    #         new_q = elmnt.q + step
-                    # # print(elmnt.q, new_q)
-                    # elmnt.q = 0 # Обнуляем для того, чтобы дальнейшее суммирование производительностей проводилось корректно
-                    # elmnt.set_q(new_q)
-                if fixStates:
-                    self.fixState()
-                    # for elmnt in self.elmnts:
-                    #     elmnt.fixState()
-                if callback:
-                    callback(self)
+                `min_step`:float=None
+                наименьший шаг по параметру при дроблении. По умолчанию - 1/64 расстояния между точками
 
-                # if iters>=3:
-                Q[0]=Q[1]
-                Q[1]=Q[2]
-                Q[2]=self.summaryQ()
-                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_in])
-                # Q[2]=sum([elmnt.q for elmnt in self.elmnts_out])
-                # print(Q[2])
-                
-                QD_1=abs(Q[1]-Q[0])
-                QD_2=abs(Q[2]-Q[1])
-                if QD_1<QD_2:
-                    # logger.debug("Расчет НРС не возможен")
-                    # print('Невязки', Q, QD_1, QD_2)
-                    warnings.warn("НРС с заданными параметрами не стабильна!", Warning)
-                    return self, {'iters':i, 'QD2':QD_2, 'correct':True}
-                    # raise ValueError("НРС с заданными параметрами не стабильна")
+                `fast_iters`:int=5
+                если расчет сошелся не более чем за fast_iters итераций, шаг увеличивается вдвое,
+                если более чем за 4*fast_iters - уменьшается вдвое
 
-                i+=1
+                `max_iters`:int=200
+                предельное количество итераций на один шаг
 
-            # QD_2 - QD_1 - невязка модели
-            QD_1=abs(Q[1]-Q[0])
-            QD_2=abs(Q[2]-Q[1])
-            return self, {'iters':i, 'QD2':QD_2, 'correct':True}
+                `approved_H`:float=120
+                предельно допустимый напор
+            Выход:
+                dict - {имя элемента: {'H_in': массив, 'h': массив, 'q': массив}} (NaN в нерассчитанных точках)\n
+                dict - {'iters': итерации по точкам (с учетом промежуточных шагов), 'steps': количество шагов,
+                'status': результат по точкам ('ok', 'unstable', 'infeasible', 'max_iters'),
+                'stable', 'feasible', 'correct': признаки расчета точек (см. calc_batch),
+                'boundary': список переходов между областями [{'value': значение параметра, 
+                начиная с которого результат расчета - 'status', 'last': ближайшее значение 
+                с предыдущим результатом}]}
+        '''
+        name, _, attr = param.rpartition('.')
+        elmnt = self.getElement(name)
+        if elmnt is None:
+            raise ValueError(f'Элемент {name} не найден в модели {self.name}')
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        size = len(values)
+        plan = self.get_plan()
+        state_cols = ('q', 'H_in', 'h', 'H_out')
+
+        res = {e.name: {c: np.full(size, np.nan) for c in ('H_in', 'h', 'q')} for e in self.elmnts}
+        iters  = np.zeros(size, dtype=int)
+        steps  = np.zeros(size, dtype=int)
+        status = np.full(size, 'ok', dtype=object)
+        boundary = []
+
+        # Исходное и последнее сошедшееся состояния
+        init_value = getattr(elmnt, attr)
+        init_state = {c: plan.column(c) for c in state_cols}
+        good_value = None
+        good_state = None
+        h_max = step
+        for k, target in enumerate(values):
+            cur = target if good_value is None else good_value
+            interval = abs(target-cur)
+            h = min(h_max, interval) if h_max else interval
+            h_min = min_step if min_step is not None else interval/64
+            # За границей области расчета шаг не дробится: делается одна попытка расчета точки
+            failed_before = k>0 and status[k-1]!='ok'
+            if failed_before:
+                h = h_min = interval
+            while True:
+                trial = target if h>=abs(target-cur) else cur + np.sign(target-cur)*h
+                setattr(elmnt, attr, trial)
+                n_iters, _, result = self._converge(plan, accuracy, max_iters, approved_H)
+                iters[k] += n_iters
+                steps[k] += 1
+                if result=='ok':
+                    cur = trial
+                    good_value = trial
+                    good_state = {c: plan.column(c) for c in state_cols}
+                    if n_iters<=fast_iters:
+                        h *= 2
+                    elif n_iters>4*fast_iters:
+                        h /= 2
+                    h_max = h or h_max
+                    if cur==target:
+                        break
+                    continue
+                # Возврат к последнему сошедшемуся (или исходному) состоянию и дробление шага
+                setattr(elmnt, attr, init_value if good_state is None else good_value)
+                for c in state_cols:
+                    plan.set_column(c, (init_state if good_state is None else good_state)[c])
+                if plan.store is not None:
+                    plan.store.dirty.clear()
+                self.solved = None if good_state is None else plan
+                h /= 2
+                if good_state is None or h<h_min or h==0:
+                    status[k] = result
+                    if not failed_before:
+                        boundary.append({'value': float(trial), 'status': result,
+                                         'last': None if good_value is None else float(good_value)})
+                    break
+
+            if failed_before and status[k]!=status[k-1]:
+                boundary.append({'value': float(target), 'status': status[k], 'last': float(values[k-1])})
+            if status[k]=='ok':
+                for e in self.elmnts:
+                    for c in ('H_in', 'h', 'q'):
+                        res[e.name][c][k] = getattr(e, c)
+
+        ok = status=='ok'
+        return res, {'iters':iters, 'steps':steps, 'status':status,
+                     'stable':status!='unstable', 'feasible':status!='infeasible', 'correct':ok,
+                     'boundary':boundary}
+
+    def simulate(self,
+                 schedule,
+                 t,
+                 accuracy   = 0.05,
+                 max_iters  = 200,
+                 approved_H = 120,
+                 columns    = ('q', 'H_in', 'h'),
+                 method     = None,
+                 accelerate = 'anderson',
+                 sink       = None):
+        '''
+        Квазистационарный расчет работы НРС во времени: параметры элементов меняются 
+        по расписанию, в каждый момент времени рассчитывается установившийся режим.
+        Расчет каждого момента начинается от линейной экстраполяции решений в два предыдущих момента
+        (для метода 'iter' без ускорения - от решения в предыдущий момент), состояния элементов 
+        записываются в заранее выделенные массивы. Если момент рассчитать не удалось, 
+        его результат - NaN, а расчет следующего момента начинается от последнего сошедшегося решения.
+        По окончании расчета модель находится в состоянии последнего момента времени.
+            Вход:
+                `schedule`:dict
+                расписание изменения параметров {'имя элемента.параметр': значения}, например
+                {'Н1.H_add': [(0, 20), (80, 100)], 'Ств1.p': lambda t: 0 if t>90 else p_B}.
+                Параметры - s, n, p, z, H_add, H_in (см. NRS_Batch.params). Значения задаются:
+                числом (постоянное значение), массивом значений по моментам t, функцией от времени
+                или списком точек [(время, значение), ...] с линейной интерполяцией между ними
+
+                `t`:array
+                моменты времени в порядке возрастания
+
+                `accuracy`:float=0.05
+                точность расчета в каждый момент, аналогично calc
+
+                `max_iters`:int=200
+                предельное количество итераций на один момент времени
+
+                `approved_H`:float=120
+                предельно допустимый напор
+
+                `columns`:tuple=('q', 'H_in', 'h')
+                записываемые параметры состояния элементов (см. NRS_Model.state_columns)
+
+                `method`:str=None
+                метод расчета каждого момента (см. calc). По умолчанию НРС с замкнутыми контурами 
+                рассчитываются методом 'newton' (см. auto_method), система уравнений которого 
+                пересобирается только при изменении проводимости стволов
+
+                `accelerate`:str='anderson'
+                ускорение сходимости метода 'iter' (см. calc). None - расчет без ускорения 
+                с пересчетом только части модели, затронутой изменением параметров
+
+                `sink`:NRS_ResultSink=None
+                потоковая запись результатов: каждый момент записывается строкой 
+                (столбцы - columns sink, поля 't', 'iters', 'correct'), массивы состояний не выделяются
+            Выход:
+                dict - {имя элемента: {параметр: массив по моментам t}} (представления общих массивов, 
+                None при записи в sink)\n
+                dict - {'t': моменты времени, 'data': {параметр: массив (моменты, элементы плана)},
+                'elements': имена элементов в порядке столбцов data, 'iters': итерации по моментам, 
+                'status': результат по моментам ('ok', 'unstable', 'infeasible', 'max_iters'), 
+                'correct': признаки расчета моментов, 'time': время расчета, с}
+        '''
+        start = time.perf_counter()
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        size = len(t)
+        plan = self.get_plan()
+        if method is None:
+            method = self.auto_method()
+        if method not in ('iter', 'newton'):
+            raise ValueError(f'Неизвестный метод расчета {method}')
+        if method=='iter':
+            plan.check_acyclic(loops=False)
+        newton = method=='newton'
+
+        # Значения параметров по моментам времени
+        changes = []
+        for param, spec in schedule.items():
+            name, _, attr = param.rpartition('.')
+            elmnt = self.getElement(name)
+            if elmnt is None:
+                raise ValueError(f'Элемент {name} не найден в модели {self.name}')
+            if not attr in NRS_Batch.params or attr=='q':
+                raise ValueError(f'Параметр {attr} не может задаваться расписанием')
+            if callable(spec):
+                values = np.array([spec(x) for x in t], dtype=float)
+            else:
+                values = np.asarray(spec, dtype=float)
+                if values.ndim==2 and values.shape[1]==2:
+                    values = np.interp(t, values[:, 0], values[:, 1])
+                values = np.broadcast_to(values, (size,))
+            changes.append((elmnt, attr, values))
+
+        # Предварительно выделенные массивы состояний: (моменты, элементы плана)
+        data   = None if sink is not None else {c: np.full((size, len(plan.elmnts)), np.nan) for c in columns}
+        iters  = np.zeros(size, dtype=int)
+        status = np.full(size, 'ok', dtype=object)
+        stops  = {'converged': 'ok', 'oscillation': 'unstable', 'iters': 'max_iters'}
+        state_cols = ('q', 'H_in', 'h', 'H_out')
+        good_state = None
+        system = None
+        prev = []           # два последних сошедшихся момента: (время, расходы, напоры узлов для 'newton')
+        def predict(k):
+            '''Линейная экстраполяция решения на момент k (None - недостаточно предыдущих решений)'''
+            if len(prev)<2 or k<2 or not t[k-1]>t[k-2]:
+                return None
+            (t1, *x1), (t2, *x2) = prev
+            return [b + (b-a)*(t[k]-t2)/(t2-t1) for a, b in zip(x1, x2)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for k in range(size):
+                rebuild = False
+                for elmnt, attr, values in changes:
+                    if getattr(elmnt, attr)!=values[k]:
+                        setattr(elmnt, attr, values[k])
+                        rebuild = rebuild or attr=='p'
+
+                if newton:
+                    if system is None or rebuild:
+                        system = NRS_Newton(plan, self)
+                        q, H = system.initial()
+                        prev = []
+                    q_k, H_k = predict(k) or (q, H)
+                    dq = np.inf
+                    R, H_add, z, H_fixed = system.params()
+                    # Разложение матрицы обновляется, только если шаги с прежним разложением сходятся медленно
+                    reuse = True
+                    while iters[k]<max_iters and dq>accuracy:
+                        q_k, H_k, dq_new, _ = system.step(q_k, H_k, R, H_add, z, H_fixed, reuse)
+                        reuse = dq_new<0.25*dq or not reuse
+                        dq = dq_new
+                        iters[k] += 1
+                    try:
+                        system.write(q_k, H_k, H_fixed, check=True)
+                        status[k] = 'ok' if dq<=accuracy else 'max_iters'
+                    except ValueError:
+                        status[k] = 'infeasible'
+                    if status[k]=='ok':
+                        q, H = q_k, H_k
+                elif accelerate is not None:
+                    x = predict(k)
+                    if x is not None:
+                        plan.set_column('q', x[0])
+                    try:
+                        _, result = self._calc_relaxed(plan, 1, None, accuracy, False, time.perf_counter(),
+                                                       NRS_Relaxation(accelerate), max_iters)
+                        iters[k], status[k] = result['iters'], stops[result['stop']]
+                    except ValueError:
+                        status[k] = 'infeasible'
+                else:
+                    iters[k], _, status[k] = self._converge(plan, accuracy, max_iters, approved_H, method)
+
+                if sink is not None and status[k]=='ok':
+                    sink.write_model(self, t=t[k], iters=iters[k], correct=1.0)
+                elif sink is not None:
+                    sink.write_row({c: np.nan for c in sink.columns}, t=t[k], iters=iters[k], correct=0.0)
+                if status[k]=='ok':
+                    if data is not None:
+                        for c in columns:
+                            data[c][k] = plan.column(c)
+                    good_state = {c: plan.column(c) for c in state_cols}
+                    prev = (prev + [(t[k], q, H) if newton else (t[k], good_state['q'])])[-2:]
+                else:
+                    prev = []
+                    if good_state is not None:
+                        # Следующий момент рассчитывается от последнего сошедшегося решения
+                        for c, col in good_state.items():
+                            plan.set_column(c, col)
+                        self.solved = None
+
+        if not all(status=='ok'):
+            warnings.warn(f"Не рассчитано моментов времени: {int(np.sum(status!='ok'))} из {size}", Warning)
+        if sink is not None:
+            sink.flush()
+        names = [elmnt.name for elmnt in plan.elmnts]
+        res = None if data is None else {name: {c: data[c][:, i] for c in columns} for i, name in enumerate(names)}
+        return res, {'t': t, 'data': data, 'elements': names, 'iters': iters, 'status': status,
+                     'correct': status=='ok', 'time': time.perf_counter()-start}
+
+    def solve_inverse(self,
+                      targets,
+                      pumps      = None,
+                      tol        = 0.01,
+                      accuracy   = 1e-4,
+                      approved_H = 120,
+                      bounds     = None,
+                      max_iters  = 20,
+                      max_solve_iters = 200):
+        '''
+        Обратная задача: подбор дополнительных напоров насосов (H_add), при которых 
+        расходы или напоры на входе стволов равны заданным.
+        Напоры насосов уточняются методом Ньютона (при несовпадении количества целей и насосов - 
+        методом наименьших квадратов) с дроблением шага. Каждое приближение рассчитывается 
+        прямым расчетом от предыдущего решения (см. _converge), производные целей по напорам насосов 
+        берутся из системы уравнений НРС в точке решения (NRS_Newton.sensitivity), 
+        а если она неприменима или не дает уменьшения невязки - оцениваются по приращениям 
+        прямым расчетом. По окончании модель находится в состоянии найденного решения.
+            Вход:
+                `targets`:dict
+                цели по элементам {имя элемента или Element: расход, л/с} 
+                или {имя элемента: {'q': расход, л/с}} / {имя элемента: {'H_in': напор на входе, м}}
+
+                `pumps`:list=None
+                насосы (имена или элементы), напоры которых подбираются. По умолчанию - все насосы модели
 
-        return self, QD_2 #- QD_1
+                `tol`:float=0.01
+                допустимое отклонение от целей (л/с для расходов, м для напоров)
+
+                `accuracy`:float=1e-4
+                точность прямого расчета, аналогично calc
+
+                `approved_H`:float=120
+                предельно допустимый напор (см. get_H_out): решения с напорами вне [0, approved_H] отбрасываются
+
+                `bounds`:tuple=None
+                пределы H_add насосов (min, max). По умолчанию - (0, approved_H)
+
+                `max_iters`:int=20
+                предельное количество шагов метода Ньютона
+
+                `max_solve_iters`:int=200
+                предельное количество итераций одного прямого расчета
+            Выход:
+                dict - {имя насоса: H_add}\n
+                dict - {'status': 'ok' - цели достигнуты, 'bounds' - для достижения целей 
+                требуется напор за пределами bounds, 'unreachable' - невязку не удается уменьшить 
+                (например, цели противоречат друг другу), 'infeasible' - прямой расчет не сходится уже 
+                в начальной точке, 'max_iters' - цели не достигнуты за max_iters шагов;
+                'correct': цели достигнуты, 'iters': шаги метода Ньютона, 'solves': прямые расчеты,
+                'residual': {имя элемента: отклонение от цели}}
+        '''
+        plan = self.get_plan()
+        state_cols = ('q', 'H_in', 'h', 'H_out')
+
+        def resolve(key):
+            elmnt = key if isinstance(key, Element) else self.getElement(key)
+            if elmnt is None or not id(elmnt) in plan.index:
+                raise ValueError(f'Элемент {key} не найден в модели {self.name}')
+            return elmnt
+
+        # Цели: индексы элементов в плане, признак цели по расходу, целевые значения
+        names, idx, is_q, goal = [], [], [], []
+        for key, value in targets.items():
+            elmnt = resolve(key)
+            attr, value = next(iter(value.items())) if isinstance(value, dict) else ('q', value)
+            if not attr in ('q', 'H_in'):
+                raise ValueError(f'Цель {attr} не поддерживается (допустимы q и H_in)')
+            names.append(elmnt.name)
+            idx.append(plan.index[id(elmnt)])
+            is_q.append(attr=='q')
+            goal.append(float(value))
+        is_q, goal = np.array(is_q), np.array(goal)
+
+        if pumps is None:
+            pumps = [elmnt for elmnt in plan.elmnts if elmnt.type==EType.PUMP]
+        pumps = [resolve(pump) for pump in pumps]
+        if not pumps:
+            raise ValueError(f'В модели {self.name} нет насосов для подбора напора')
+        p_idx = [plan.index[id(pump)] for pump in pumps]
+        lo, hi = bounds or (0, approved_H)
+
+        solves = 0
+        def forward(x):
+            '''Прямой расчет при напорах насосов x: значения целей (None - расчет не сошелся)'''
+            nonlocal solves
+            solves += 1
+            for pump, value in zip(pumps, x):
+                pump.H_add = float(value)
+            if self._converge(plan, accuracy, max_solve_iters, approved_H)[2]!='ok':
+                return None
+            return np.where(is_q, plan.column('q')[idx], plan.column('H_in')[idx])
+
+        def save(x, y):
+            return x.copy(), y, {c: plan.column(c) for c in state_cols}
+
+        def restore(state):
+            '''Возврат к сошедшемуся состоянию'''
+            for pump, value in zip(pumps, state[0]):
+                pump.H_add = float(value)
+            for c in state_cols:
+                plan.set_column(c, state[2][c])
+            if plan.store is not None:
+                plan.store.dirty.clear()
+            self.solved = plan
+            return state[0].copy(), state[1]
+
+        system = None
+        def derivatives(state, numeric=False):
+            '''Производные целей по напорам насосов в точке решения'''
+            nonlocal system
+            if not numeric:
+                try:
+                    if system is None:
+                        system = NRS_Newton(plan, self)
+                    dq, dH = system.sensitivity(plan.column('q'), system.params()[0], p_idx)
+                    return np.where(is_q[:, None], dq[idx], dH[idx])
+                except (ValueError, np.linalg.LinAlgError):
+                    pass
+            # Оценка по приращениям: каждый насос поочередно смещается на 1 м
+            x, y = state[0], state[1]
+            J = np.zeros((len(idx), len(pumps)))
+            for k in range(len(pumps)):
+                dx = 1.0 if x[k]+1.0<=hi else -1.0
+                x_k = x.copy()
+                x_k[k] += dx
+                y_k = forward(x_k)
+                restore(state)
+                if y_k is not None:
+                    J[:, k] = (y_k-y)/dx
+            return J
+
+        # Начальная точка: текущие напоры насосов в пределах bounds
+        x = np.clip(np.array([pump.H_add for pump in pumps], dtype=float), lo, hi)
+        y = forward(x)
+        if y is None:
+            self.drop_q()
+            y = forward(x)
+        status = 'infeasible' if y is None else 'max_iters'
+        i = 0
+        while y is not None and i<max_iters:
+            r = y-goal
+            if np.max(np.abs(r))<=tol:
+                status = 'ok'
+                break
+            i += 1
+            state = save(x, y)
+            norm = np.linalg.norm(r)
+            accepted = False
+            for numeric in (False, True):
+                dx = np.linalg.lstsq(derivatives(state, numeric), -r, rcond=None)[0]
+                t = 1.0
+                while t>=1/64:
+                    x_new = np.clip(x + t*dx, lo, hi)
+                    if np.allclose(x_new, x):
+                        break
+                    y_new = forward(x_new)
+                    if y_new is not None and np.linalg.norm(y_new-goal)<norm:
+                        x, y, accepted = x_new, y_new, True
+                        break
+                    restore(state)
+                    t /= 2
+                if accepted:
+                    break
+            if not accepted:
+                x, y = restore(state)
+                at_bound = (x<=lo) | (x>=hi)
+                status = 'bounds' if at_bound.any() else 'unreachable'
+                break
+
+        residual = {} if y is None else dict(zip(names, (y-goal).tolist()))
+        return ({pump.name: pump.H_add for pump in pumps},
+                {'status': status, 'correct': status=='ok', 'iters': i, 'solves': solves, 'residual': residual})
+
+    def __getstate__(self):
+        '''Скомпилированный порядок расчета и кэш решений не сериализуются: они привязаны к объектам текущего процесса'''
+        state = self.__dict__.copy()
+        state['plan'] = None
+        state['solved'] = None
+        state['cache'] = None
+        return state
+
+    def to_arrays(self, state=True):
+        '''
+        Представление модели в виде массивов NumPy (связи элементов - в формате CSR)
+            Вход:
+                state=True: включать ли расчетное состояние элементов (см. state_columns)
+            Выход:
+                dict - {'meta': описание модели (строка JSON: формат, имя модели, имена функций q_out), 
+                'name', 'type', 'ri', 'ro', 'q_out': номер функции q_out в meta, столбцы параметров, 
+                'next_ptr', 'next_idx', 'prev_ptr', 'prev_idx', 'in', 'out': индексы элементов}
+        '''
+        elmnts = self.elmnts
+        index  = {id(elmnt): i for i, elmnt in enumerate(elmnts)}
+
+        # Функции расчета расходов сохраняются по именам из реестра (см. register_q_out)
+        registered = {id(func): name for name, func in Q_OUT_FUNCS.items()}
+        codes = {}
+        q_out = []
+        for elmnt in elmnts:
+            name = registered.get(id(elmnt.q_out))
+            if name is None:
+                raise ValueError(f'Функция расчета расхода элемента {elmnt.name} не зарегистрирована (см. register_q_out)')
+            q_out.append(codes.setdefault(name, len(codes)))
+
+        meta = {'format': self.file_format, 'version': self.file_version, 'name': self.name,
+                'counter': self.counter, 'q_out': list(codes), 'state': state}
+        arrays = {'meta':  np.array(json.dumps(meta, ensure_ascii=False)),
+                  'name':  np.array([elmnt.name for elmnt in elmnts], dtype=str),
+                  'type':  np.array([elmnt.type for elmnt in elmnts], dtype=np.int8),
+                  'ri':    np.array([elmnt.ri for elmnt in elmnts], dtype=np.int32),
+                  'ro':    np.array([elmnt.ro for elmnt in elmnts], dtype=np.int32),
+                  'q_out': np.array(q_out, dtype=np.int32)}
+
+        columns = self.params_columns + (self.state_columns if state else ())
+        if all(getattr(elmnt, '_store', None) is self.store for elmnt in elmnts):
+            slots = np.array([elmnt._i for elmnt in elmnts], dtype=np.intp)
+            for c in columns:
+                arrays[c] = self.store.data[c][slots]
+        else:
+            for c in columns:
+                arrays[c] = np.array([getattr(elmnt, c) for elmnt in elmnts], dtype=float)
+
+        for key, attr in (('next', 'elements_next'), ('prev', 'elements_previous')):
+            ptr, idx = [0], []
+            for elmnt in elmnts:
+                idx.extend(index[id(linked)] for linked in getattr(elmnt, attr) if id(linked) in index)
+                ptr.append(len(idx))
+            arrays[key+'_ptr'] = np.array(ptr, dtype=np.int64)
+            arrays[key+'_idx'] = np.array(idx, dtype=np.int64)
+        arrays['in']  = np.array([index[id(elmnt)] for elmnt in self.elmnts_in], dtype=np.int64)
+        arrays['out'] = np.array([index[id(elmnt)] for elmnt in self.elmnts_out], dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        Создание модели из массивов (см. to_arrays). 
+        Элементы создаются сразу в хранилище новой модели, связи восстанавливаются в исходном порядке.
+            Вход:
+                arrays=dict|NpzFile: массивы модели
+            Выход:
+                NRS_Model
+        '''
+        meta = json.loads(str(arrays['meta']))
+        if meta.get('format')!=cls.file_format or meta.get('version', 0)>cls.file_version:
+            raise ValueError('Неизвестный формат или версия файла модели')
+        funcs = []
+        for name in meta['q_out']:
+            if not name in Q_OUT_FUNCS:
+                raise ValueError(f'Функция расчета расхода {name} не зарегистрирована (см. register_q_out)')
+            funcs.append(Q_OUT_FUNCS[name])
+
+        model = cls(meta['name'])
+        names = arrays['name'].tolist()
+        ne    = len(names)
+        store = model.store = ElementStore(max(ne, 64))
+        store.size = ne
+        for c in cls.params_columns + cls.state_columns:
+            if c in arrays:
+                store.data[c][:ne] = arrays[c]
+
+        etypes = {int(t): t for t in EType}
+        types, ri, ro, q_out = (arrays[key].tolist() for key in ('type', 'ri', 'ro', 'q_out'))
+        # Сборщик мусора на время создания элементов отключается: 
+        # иначе он многократно обходит растущее множество новых объектов
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            attach = Element._attach
+            elmnts = [attach(model, i, names[i], etypes[types[i]], ri[i], ro[i], funcs[q_out[i]])
+                      for i in range(ne)]
+            ptr = arrays['next_ptr'].tolist()
+            linked = [elmnts[i] for i in arrays['next_idx'].tolist()]
+            for i, elmnt in enumerate(elmnts):
+                elmnt.elements_next = linked[ptr[i]:ptr[i+1]]
+            ptr = arrays['prev_ptr'].tolist()
+            linked = [elmnts[i] for i in arrays['prev_idx'].tolist()]
+            for i, elmnt in enumerate(elmnts):
+                elmnt.elements_previous = linked[ptr[i]:ptr[i+1]]
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        # Индексы модели (имя -> первый элемент с таким именем)
+        model.elmnts = elmnts
+        model._names = dict(zip(reversed(names), reversed(elmnts)))
+        model._names_count = {name: k for name, k in Counter(names).items() if k>1}
+        model.addElementsIn([elmnts[i] for i in arrays['in'].tolist()])
+        model.addElementsOut([elmnts[i] for i in arrays['out'].tolist()])
+        model.counter = meta['counter']
+        _topology_changed()
+        return model
+
+    def to_dict(self, state=True):
+        '''
+        Представление модели в виде словаря для сохранения в JSON: 
+        элементы со своими параметрами и индексами связанных элементов
+            Вход:
+                state=True: включать ли расчетное состояние элементов (см. state_columns)
+            Выход:
+                dict
+        '''
+        arrays = self.to_arrays(state)
+        meta   = json.loads(str(arrays['meta']))
+        columns = [c for c in self.params_columns + self.state_columns if c in arrays]
+        values  = {key: arrays[key].tolist() for key in columns + ['type', 'ri', 'ro', 'q_out']}
+        links   = {key: (arrays[key+'_ptr'].tolist(), arrays[key+'_idx'].tolist()) for key in ('next', 'prev')}
+        etypes  = {int(t): t.name for t in EType}
+        elements = []
+        for i, name in enumerate(arrays['name'].tolist()):
+            elmnt = {'name': name, 'type': etypes[values['type'][i]],
+                     'ri': values['ri'][i], 'ro': values['ro'][i],
+                     'q_out': meta['q_out'][values['q_out'][i]]}
+            for c in columns:
+                elmnt[c] = values[c][i]
+            for key, (ptr, idx) in links.items():
+                elmnt[key] = idx[ptr[i]:ptr[i+1]]
+            elements.append(elmnt)
+        return {'format': meta['format'], 'version': meta['version'], 'name': meta['name'],
+                'counter': meta['counter'], 'elements': elements,
+                'in': arrays['in'].tolist(), 'out': arrays['out'].tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        Создание модели из словаря (см. to_dict)
+            Выход:
+                NRS_Model
+        '''
+        elements = data['elements']
+        funcs = list(dict.fromkeys(elmnt['q_out'] for elmnt in elements))
+        codes = {name: k for k, name in enumerate(funcs)}
+        meta = {'format': data.get('format'), 'version': data.get('version', 0), 'name': data['name'],
+                'counter': data.get('counter', len(elements)), 'q_out': funcs}
+        arrays = {'meta':  json.dumps(meta),
+                  'name':  np.array([elmnt['name'] for elmnt in elements], dtype=str),
+                  'type':  np.array([EType[elmnt['type']] for elmnt in elements], dtype=np.int8),
+                  'ri':    np.array([elmnt['ri'] for elmnt in elements], dtype=np.int32),
+                  'ro':    np.array([elmnt['ro'] for elmnt in elements], dtype=np.int32),
+                  'q_out': np.array([codes[elmnt['q_out']] for elmnt in elements], dtype=np.int32),
+                  'in':    np.array(data['in'], dtype=np.int64),
+                  'out':   np.array(data['out'], dtype=np.int64)}
+        for c in cls.params_columns + cls.state_columns:
+            if elements and c in elements[0]:
+                arrays[c] = np.array([elmnt[c] for elmnt in elements], dtype=float)
+        for key in ('next', 'prev'):
+            arrays[key+'_ptr'] = np.cumsum([0]+[len(elmnt[key]) for elmnt in elements])
+            arrays[key+'_idx'] = np.array([i for elmnt in elements for i in elmnt[key]], dtype=np.int64)
+        return cls.from_arrays(arrays)
+
+    # Значения параметров элементов по умолчанию (см. Element.__init__)
+    edge_defaults = {'s': 0, 'n': 1, 'p': 1, 'z': 0, 'H_add': 0, 'l': 0, 'H_in': 0,
+                     'q': 3.7, 'h': 0, 'H_out': 0, 'ri': 1, 'ro': 1}
+
+    @classmethod
+    def from_edges(cls, nodes, edges, name='Модель', interpretate=True):
+        '''
+        Пакетное создание модели из таблицы элементов и списка связей.
+        Количество входов и выходов (ri, ro) проверяется сразу для всех связей,
+        связи элементов строятся непосредственно (без поэлементного append).
+            Вход:
+                nodes: элементы - список словарей, словарь {имя: словарь параметров},
+                    словарь столбцов или pandas.DataFrame (имена - столбец name или индекс).
+                    Параметры: name, type (EType, номер или имя типа), ri, ro,
+                    q_out (имя из реестра или функция), столбцы params_columns и state_columns.
+                    Не указанные параметры принимают значения по умолчанию (см. edge_defaults), type обязателен
+                edges: связи (откуда, куда) по именам элементов - список пар,
+                    словарь {откуда: куда или список}, словарь столбцов или pandas.DataFrame
+                    (столбцы from, to или первые два столбца). Порядок связей сохраняется
+                name='Модель': имя модели
+                interpretate=True: распределить элементы по спискам входящих и выходящих (см. interpretate)
+            Выход:
+                NRS_Model
+        '''
+        columns, ne = _table_columns(nodes)
+        if not 'name' in columns:
+            raise ValueError('Не указаны имена элементов (столбец name или индекс)')
+        missing = [i for i, value in enumerate(columns['name']) if value is None or value!=value]
+        if missing or len(columns['name'])!=ne:
+            raise ValueError(f'Количество имен ({len(columns["name"])-len(missing)}) не совпадает '
+                             f'с количеством элементов ({ne}), нет имен в строках: ' + _listing(missing))
+        names = [str(value) for value in columns['name']]
+        if not 'type' in columns:
+            raise ValueError('Не указаны типы элементов (столбец type)')
+        counts = Counter(names)
+        if len(counts)<ne:
+            raise ValueError('Имена элементов не уникальны: ' +
+                             _listing(name for name, k in counts.items() if k>1))
+        index = dict(zip(names, range(ne)))
+
+        # Типы элементов и функции расчета расходов
+        etypes = {}
+        for t in EType:
+            etypes.update({t: t, int(t): t, t.name: t, t.name.lower(): t})
+        try:
+            types = np.array([etypes[t] for t in columns['type']], dtype=np.int8)
+        except (KeyError, TypeError):
+            raise ValueError('Неизвестный тип элемента: ' +
+                             _listing(t for t in columns['type'] if not t in etypes)) from None
+        registered = {id(func): key for key, func in Q_OUT_FUNCS.items()}
+        default = registered[id(q_out_simple)]
+        codes, q_out, custom = {}, [], {}
+        for i, func in enumerate(columns.get('q_out') or [None]*ne):
+            if isinstance(func, str):
+                if not func in Q_OUT_FUNCS:
+                    raise ValueError(f'Функция расчета расхода {func} не зарегистрирована (см. register_q_out)')
+                key = func
+            elif callable(func):
+                key = registered.get(id(func))
+                if key is None:
+                    custom[i] = func
+                    key = default
+            else:
+                key = default
+            q_out.append(codes.setdefault(key, len(codes)))
+
+        meta = {'format': cls.file_format, 'version': cls.file_version, 'name': name,
+                'counter': ne, 'q_out': list(codes)}
+        arrays = {'meta': json.dumps(meta), 'name': np.array(names, dtype=str), 'type': types,
+                  'q_out': np.array(q_out, dtype=np.int32)}
+        defaults = cls.edge_defaults
+        for c in ('ri', 'ro') + cls.params_columns + cls.state_columns:
+            values = columns.get(c)
+            if values is None:
+                arrays[c] = np.full(ne, defaults[c], dtype=float)
+                continue
+            column = np.array([defaults[c] if v is None else v for v in values], dtype=float)
+            column[np.isnan(column)] = defaults[c]
+            arrays[c] = column
+        ri = arrays['ri'] = arrays['ri'].astype(np.int32)
+        ro = arrays['ro'] = arrays['ro'].astype(np.int32)
+
+        # Связи: индексы элементов по именам
+        if isinstance(edges, dict) and not ('from' in edges and 'to' in edges):
+            pairs = [(a, b) for a, targets in edges.items()
+                     for b in (targets if isinstance(targets, (list, tuple)) else (targets,))]
+        else:
+            pairs = edges
+        links, _ = _table_columns(pairs, index=None)
+        keys = ('from', 'to') if 'from' in links and 'to' in links else list(links)[:2]
+        if len(keys)<2:
+            links, keys = {0: [], 1: []}, (0, 1)
+        ends = []
+        for key in keys:
+            column = [str(value) for value in links[key]]
+            unknown = [value for value in column if not value in index]
+            if unknown:
+                raise ValueError('Связи ссылаются на отсутствующие элементы: ' + _listing(unknown))
+            ends.append(np.array([index[value] for value in column], dtype=np.int64))
+        src, dst = ends
+
+        # Проверка количества входов и выходов сразу для всех связей
+        errors = []
+        for degree, limit, what in ((np.bincount(src, minlength=ne), ro, 'выходов'),
+                                    (np.bincount(dst, minlength=ne), ri, 'входов')):
+            over = np.flatnonzero(degree>limit)
+            if len(over):
+                errors.append(f'превышено количество {what}: ' +
+                              _listing(f'{names[i]} ({degree[i]} > {limit[i]})' for i in over))
+        if errors:
+            raise ValueError('; '.join(errors))
+
+        # Связи в формате CSR (устойчивая сортировка сохраняет порядок связей)
+        for key, a, b in (('next', src, dst), ('prev', dst, src)):
+            order = np.argsort(a, kind='stable')
+            arrays[key+'_ptr'] = np.concatenate(([0], np.cumsum(np.bincount(a, minlength=ne))))
+            arrays[key+'_idx'] = b[order]
+        arrays['in']  = np.flatnonzero(types==EType.PUMP) if interpretate else np.zeros(0, dtype=np.int64)
+        arrays['out'] = np.flatnonzero(types==EType.NOZZLE) if interpretate else np.zeros(0, dtype=np.int64)
+
+        model = cls.from_arrays(arrays)
+        for i, func in custom.items():
+            model.elmnts[i].q_out = func
+        return model
+
+    def to_edges(self, state=False, frame=False):
+        '''
+        Представление модели в виде таблицы элементов и списка связей (см. from_edges)
+            Вход:
+                state=False: включать ли расчетное состояние элементов (см. state_columns)
+                frame=False: вернуть таблицы pandas.DataFrame вместо списков
+            Выход:
+                (nodes - список словарей параметров элементов, edges - список пар имен (откуда, куда)).
+                Функции q_out должны быть зарегистрированы (см. register_q_out)
+        '''
+        arrays = self.to_arrays(state)
+        names  = arrays['name'].tolist()
+        counts = Counter(names)
+        if len(counts)<len(names):
+            raise ValueError('Имена элементов не уникальны: ' +
+                             _listing(name for name, k in counts.items() if k>1))
+        meta    = json.loads(str(arrays['meta']))
+        columns = [c for c in self.params_columns + self.state_columns if c in arrays]
+        values  = {key: arrays[key].tolist() for key in columns + ['type', 'ri', 'ro', 'q_out']}
+        etypes  = {int(t): t.name for t in EType}
+        values['type']  = [etypes[t] for t in values['type']]
+        values['q_out'] = [meta['q_out'][k] for k in values['q_out']]
+        keys  = ['name', 'type', 'ri', 'ro', 'q_out'] + columns
+        nodes = [dict(zip(keys, row)) for row in zip(names, *(values[key] for key in keys[1:]))]
+
+        ptr = arrays['next_ptr']
+        src = np.repeat(np.arange(len(names)), np.diff(ptr)).tolist()
+        edges = [(names[a], names[b]) for a, b in zip(src, arrays['next_idx'].tolist())]
+        if frame:
+            import pandas
+            return pandas.DataFrame(nodes, columns=keys), pandas.DataFrame(edges, columns=['from', 'to'])
+        return nodes, edges
+
+    def save(self, path, state=True, compress=False):
+        '''
+        Сохранение модели в файл: '*.json' - в читаемом виде (см. to_dict), 
+        иначе - в двоичном формате NumPy npz (см. to_arrays)
+            Вход:
+                path=str: путь к файлу
+                state=True: сохранять ли расчетное состояние элементов (расходы и напоры)
+                compress=False: сжимать ли файл npz
+            Выход:
+                NRS_Model: ссылка на текущую модель
+        '''
+        if str(path).lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(state), f, ensure_ascii=False, indent=1)
+        else:
+            with open(path, 'wb') as f:
+                (np.savez_compressed if compress else np.savez)(f, **self.to_arrays(state))
+        return self
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Загрузка модели из файла (см. save), формат определяется по содержимому файла
+            Выход:
+                NRS_Model
+        '''
+        with open(path, 'rb') as f:
+            if f.read(2)==b'PK':
+                f.seek(0)
+                with np.load(f) as arrays:
+                    return cls.from_arrays(arrays)
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_bytes(self, state=True):
+        '''
+        Модель в двоичном формате npz (см. to_arrays) - для передачи процессам-исполнителям и кэширования
+            Выход:
+                bytes
+        '''
+        buffer = io.BytesIO()
+        np.savez(buffer, **self.to_arrays(state))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''
+        Создание модели из двоичного представления (см. to_bytes)
+            Выход:
+                NRS_Model
+        '''
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls.from_arrays(arrays)
 
     def summaryQ(self):
         '''
@@ -890,6 +4796,7 @@ class NRS_Model(object):
         '''
         for elmnt in self.elmnts:
             elmnt.q = 0
+        self.solved = None
 
     def fixState(self):
         '''
@@ -898,6 +4805,13 @@ class NRS_Model(object):
         for elmnt in self.elmnts:
             elmnt.fixState()
 
+    def fixFinalState(self):
+        '''
+        Фиксирует итоговое состояние параметров элементов модели по окончании расчета
+        '''
+        for elmnt in self.elmnts:
+            elmnt.fixFinalState()
+
 
 class NRS_Data(object):
     '''
@@ -957,3 +4871,132 @@ class NRS_Data(object):
         "77нп": s["Непрорезиненный напорный рукав диаметром 77мм (20м)"]/20,
     }
 
+
+    # Каталог рукавов в виде массивов (строится по таблицам ss и aa, см. _hose_catalog):
+    # key - ключ ss, d - диаметр, мм, kind - исполнение ('пр' - прорезиненный, 'нп' - непрорезиненный,
+    # 'дв' - с двухсторонним покрытием), length - длина рукава, м, s - сопротивление рукава, a - сопротивление 1 м
+    hose_dtype = np.dtype([('key', 'U8'), ('d', np.int32), ('kind', 'U2'),
+                           ('length', float), ('s', float), ('a', float)])
+    hoses = None
+    _hose_keys  = None     # отсортированные ключи каталога (для поиска searchsorted)
+    _hose_order = None     # позиции отсортированных ключей в каталоге
+
+    # Характеристики стволов: {имя: (напоры, м; проводимости q/H^0.5; описание)}, см. register_nozzle
+    nozzles = {}
+
+    @classmethod
+    def _hose_catalog(cls):
+        '''
+        Построение каталога рукавов (hoses) по таблицам ss и aa
+        '''
+        rows = []
+        for key, s in cls.ss.items():
+            digits = key.rstrip('нпдв')
+            rows.append((key, int(digits), key[len(digits):] or 'пр', round(s/cls.aa[key]), s, cls.aa[key]))
+        cls.hoses = np.array(rows, dtype=cls.hose_dtype)
+        cls._hose_order = np.argsort(cls.hoses['key'])
+        cls._hose_keys  = cls.hoses['key'][cls._hose_order]
+        return cls.hoses
+
+    @classmethod
+    def hose_index(cls, keys):
+        '''
+        Позиции рукавов в каталоге hoses
+            Вход:
+                keys: ключ или массив ключей каталога (см. ss), например '51', '77нп', 150
+            Выход:
+                int | np.ndarray
+        '''
+        keys = np.asarray(keys).astype(str)
+        pos  = np.minimum(np.searchsorted(cls._hose_keys, keys), len(cls._hose_keys)-1)
+        found = cls._hose_keys[pos]==keys
+        if not np.all(found):
+            raise KeyError('Рукава отсутствуют в каталоге: ' + _listing(np.unique(keys[~found])))
+        return cls._hose_order[pos]
+
+    @classmethod
+    def hose_s(cls, keys, length=None):
+        '''
+        Гидравлическое сопротивление рукавов
+            Вход:
+                keys: ключ или массив ключей каталога (см. ss)
+                length=None: длина рукава, м (число или массив); по умолчанию - табличная длина рукава
+            Выход:
+                float | np.ndarray
+            Пример:
+                ```
+                NRS_Data.hose_s(['51', '77', '150'])
+                >>>array([1.3e-01, 1.5e-02, 4.6e-04])
+                ```
+        '''
+        rows = cls.hoses[cls.hose_index(keys)]
+        return rows['s'] if length is None else rows['a']*length
+
+    @classmethod
+    def register_nozzle(cls, name, H, q, description=''):
+        '''
+        Регистрация табличной характеристики ствола (зависимости расхода от напора)
+            Вход:
+                name=str: имя ствола
+                H=array: напоры на входе в ствол, м (по возрастанию, больше нуля)
+                q=array: расходы ствола при напорах H, л/с
+                description=str: описание ствола (источник данных)
+        '''
+        H = np.asarray(H, dtype=float)
+        q = np.asarray(q, dtype=float)
+        if H.ndim!=1 or H.shape!=q.shape or len(H)==0 or H[0]<=0 or np.any(np.diff(H)<=0):
+            raise ValueError('Напоры характеристики ствола должны быть положительными и возрастать, '
+                             'количество напоров и расходов должно совпадать')
+        cls.nozzles[name] = (H, q/np.sqrt(H), description)
+
+    @classmethod
+    def nozzle_p(cls, name, H):
+        '''
+        Проводимость ствола (см. NRS_Revision.calc_p) при заданных напорах - 
+        линейная интерполяция по табличной характеристике. 
+        За пределами таблицы проводимость принимается равной крайнему значению (расход - пропорционально H^0.5)
+            Вход:
+                name: имя ствола или массив имен (см. register_nozzle)
+                H: напор или массив напоров на входе в ствол, м
+            Выход:
+                float | np.ndarray
+        '''
+        H = np.asarray(H, dtype=float)
+        if np.ndim(name)==0:
+            H_t, p_t, _ = cls.nozzles[name]
+            return np.interp(H, H_t, p_t)
+        names, inverse = np.unique(np.asarray(name), return_inverse=True)
+        inverse = inverse.reshape(np.shape(name))
+        H, inverse = np.broadcast_arrays(H, inverse)
+        p = np.empty(H.shape)
+        for k, key in enumerate(names.tolist()):
+            mask = inverse==k
+            H_t, p_t, _ = cls.nozzles[key]
+            p[mask] = np.interp(H[mask], H_t, p_t)
+        return p
+
+    @classmethod
+    def nozzle_q(cls, name, H):
+        '''
+        Расход ствола при заданных напорах по табличной характеристике (см. nozzle_p)
+            Вход:
+                name: имя ствола или массив имен (см. register_nozzle)
+                H: напор или массив напоров на входе в ствол, м
+            Выход:
+                float | np.ndarray
+            Пример:
+                ```
+                NRS_Data.nozzle_q('Б', [10, 40, 90])
+                >>>array([1.85, 3.7 , 5.55])
+                ```
+        '''
+        return cls.nozzle_p(name, H)*np.sqrt(np.maximum(H, 0))
+
+
+NRS_Data._hose_catalog()
+
+# Стволы со сплошной струей: расход пропорционален корню из напора (3,7 и 7,4 л/с при напоре 40 м)
+_H = np.arange(10., 101., 10.)
+for _name, _q, _description in (('Б', 3.7, 'Ручной ствол Б (РС-50), насадок 13 мм'),
+                                 ('А', 7.4, 'Ручной ствол А (РС-70), насадок 19 мм')):
+    NRS_Data.register_nozzle(_name, _H, NRS_Revision.calc_p(_q, 40)*np.sqrt(_H), _description)
@@ -0,0 +1,18 @@
+'''
+Измерение производительности расчета НРС на синтетических схемах.
+
+Генераторы схем (generators): цепочки перекачки, деревья разветвлений,
+схемы с водосборниками, случайные ациклические схемы и кольцевые магистрали. Для каждой схемы
+измеряется время создания элементов, build, interpretate, calc (по количеству
+итераций, до точности и после изменения одного элемента), sweep и delElement
+(bench). Результаты расчета сверяются с эталоном (reference).
+
+Запуск из каталога workFolder:
+    python -m nrs_bench                     # все схемы, размеры по умолчанию
+    python -m nrs_bench --cases tree dag --sizes 2 4
+    python -m nrs_bench --check             # только сверка с эталоном
+'''
+from .generators import (GENERATORS, build_model, relay_chain, splitter_tree,
+                         joiner_layout, random_dag, ring_main)
+from .bench import SIZES, PHASES, bench_case, run, format_table
+from .reference import CASES, solve_case, update_reference, check_reference
@@ -0,0 +1,42 @@
+'''
+Запуск измерений: python -m nrs_bench --help
+'''
+import argparse
+import json
+import sys
+
+from . import GENERATORS, run, format_table, check_reference, update_reference
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nrs_bench', description='Измерение производительности расчета НРС')
+    parser.add_argument('--cases', nargs='+', choices=list(GENERATORS), help='генераторы схем (по умолчанию - все)')
+    parser.add_argument('--sizes', nargs='+', type=int, help='размеры схем (по умолчанию - свои для каждого генератора)')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов измерений')
+    parser.add_argument('--json', help='сохранить результаты измерений в файл JSON')
+    parser.add_argument('--check', action='store_true', help='только сверить результаты расчета с эталоном')
+    parser.add_argument('--update-reference', action='store_true', help='пересчитать эталонные результаты')
+    args = parser.parse_args(argv)
+
+    if args.update_reference:
+        update_reference()
+        print('Эталонные результаты обновлены')
+        return 0
+
+    diffs = check_reference()
+    for key, elmnt, expected, got in diffs:
+        print(f'Расхождение с эталоном {key} {elmnt}: {expected} -> {got}')
+    print('Сверка с эталоном:', 'есть расхождения' if diffs else 'OK')
+    if args.check:
+        return 1 if diffs else 0
+
+    rows = run(args.cases, args.sizes, repeat=args.repeat)
+    print(format_table(rows))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+    return 1 if diffs else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+'''
+Измерение времени основных операций с моделью НРС на синтетических схемах
+'''
+import time
+import warnings
+
+import numpy as np
+
+from .generators import GENERATORS, build_model
+
+
+# Размеры схем по умолчанию для каждого генератора
+SIZES = {
+    'relay':    (10, 100, 1000),
+    'tree':     (2, 4, 6),
+    'joiner':   (10, 100, 400),
+    'dag':      (100, 1000, 10000),
+    'ring':     (50, 500, 5000),
+}
+
+# Измеряемые операции (в порядке вывода)
+PHASES = ('generate', 'build', 'interpretate', 'calc_iters', 'calc_accuracy',
+          'calc_incremental', 'sweep', 'delElement')
+
+
+def _timed(func, repeat):
+    '''
+    Лучшее время выполнения функции из repeat запусков
+        Выход:
+            (время, с; результат последнего запуска)
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter()-start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_case(name, size, repeat=3, iters=10, accuracy=0.01, sweep_points=100):
+    '''
+    Измерение времени операций для одной схемы
+        Вход:
+            name=str: имя генератора (см. GENERATORS)
+            size=int: размер схемы
+            repeat=int: количество повторов каждого измерения (берется лучшее время)
+            iters=int: количество итераций для расчета calc(iters=...)
+            accuracy=float: точность для расчета calc(accuracy=...)
+            sweep_points=int: количество точек перебора напора головного насоса (NRS_Model.sweep);
+            для схем с замкнутыми контурами перебор не измеряется (время - None)
+        Выход:
+            dict - {'case', 'size', 'elements', 'iters' (итераций до точности), операция: время, с}
+    '''
+    gen = GENERATORS[name]
+    row = {'case': name, 'size': size}
+
+    # Создание элементов и сборка модели (на каждый повтор - новые элементы)
+    row['generate'], _ = _timed(lambda: gen(size), repeat)
+    builds = []
+    for _ in range(repeat):
+        _, roots = gen(size)
+        start = time.perf_counter()
+        model = build_model(roots, interpretate=False)
+        builds.append(time.perf_counter()-start)
+    row['build'] = min(builds)
+    row['elements'] = len(model.elmnts)
+    row['interpretate'], _ = _timed(model.interpretate, repeat)
+    model.compile()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+
+        def calc_iters():
+            model.drop_q()
+            return model.calc(iters=iters, fixStates=False)
+        row['calc_iters'], _ = _timed(calc_iters, repeat)
+
+        def calc_accuracy():
+            model.drop_q()
+            return model.calc(accuracy=accuracy, fixStates=False, incremental=False)
+        row['calc_accuracy'], (_, result) = _timed(calc_accuracy, repeat)
+        row['iters'] = result['iters']
+
+        # Пересчет после изменения одного ствола
+        nozzle = model.elmnts_out[-1]
+        p = nozzle.p
+        def calc_incremental():
+            nozzle.p = p*1.1 if nozzle.p==p else p
+            return model.calc(accuracy=accuracy, fixStates=False)
+        row['calc_incremental'], _ = _timed(calc_incremental, repeat)
+
+        pump = roots[0]
+        grid = {f'{pump.name}.H_add': np.linspace(0.9, 1.1, sweep_points)*pump.H_add}
+        row['sweep'] = None
+        if not model.get_plan().cyclic:
+            row['sweep'], _ = _timed(lambda: model.sweep(grid, workers=1, accuracy=accuracy), repeat)
+
+    # Удаление ствола с каскадным удалением ставших "мертвыми" элементов (однократно)
+    row['delElement'], _ = _timed(lambda: model.delElement(nozzle), 1)
+    return row
+
+
+def run(cases=None, sizes=None, **kwargs):
+    '''
+    Измерение времени операций для набора схем разного размера
+        Вход:
+            cases=list: имена генераторов (по умолчанию - все)
+            sizes=dict|list: размеры схем по генераторам или общий список размеров (по умолчанию - SIZES)
+            kwargs: параметры bench_case
+        Выход:
+            list - строки результатов (см. bench_case)
+    '''
+    rows = []
+    for name in cases or GENERATORS:
+        case_sizes = sizes.get(name, SIZES[name]) if isinstance(sizes, dict) else sizes or SIZES[name]
+        for size in case_sizes:
+            rows.append(bench_case(name, size, **kwargs))
+    return rows
+
+
+def format_table(rows):
+    '''
+    Таблица результатов измерений (время в мс, '-' - операция не измерялась)
+        Выход:
+            str
+    '''
+    header = ['case', 'size', 'elements', 'iters'] + list(PHASES)
+    lines = ['  '.join(f'{h:>12}' for h in header)]
+    for row in rows:
+        cells = [f'{row[h]:>12}' for h in header[:4]]
+        cells += [f'{row[h]*1000:>12.3f}' if row[h] is not None else f'{"-":>12}' for h in PHASES]
+        lines.append('  '.join(cells))
+    return '\n'.join(lines)
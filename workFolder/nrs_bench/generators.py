@@ -0,0 +1,214 @@
+'''
+Генераторы синтетических НРС для измерения производительности.
+Каждый генератор возвращает список связанных элементов и список элементов,
+от которых строится модель (см. build_model). Все генераторы детерминированы.
+'''
+import random
+
+from nrs import Element, EType, NRS_Model, NRS_Revision, NRS_Data, q_out_nozzle
+
+
+# Стволы, используемые в генераторах
+P_B = NRS_Revision.calc_p(3.7, 40)       # ствол Б
+P_A = NRS_Revision.calc_p(7.4, 40)       # ствол А
+P_L = NRS_Revision.calc_p(20, 60)        # лафетный ствол
+
+
+def build_model(roots, name='bench', interpretate=True):
+    '''
+    Сборка модели из элементов генератора
+        Вход:
+            roots=list: элементы, от которых строится модель (NRS_Model.build) - 
+            по одному на каждую несвязанную часть НРС
+            interpretate=bool: определять ли входящие и выходящие элементы
+        Выход:
+            NRS_Model
+    '''
+    model = NRS_Model(name)
+    for root in roots:
+        model.build(root, interpretate=False)
+    if interpretate:
+        model.interpretate()
+    return model
+
+
+def relay_chain(stages, hoses=5):
+    '''
+    Перекачка на подъем по цепочке насосов: головной насос, далее stages ступеней
+    "магистральная линия из hoses рукавов 150 мм - промежуточный насос",
+    в конце - рабочая линия 51 мм и ствол Б. Подъем на каждой ступени подобран так,
+    чтобы промежуточный насос компенсировал его вместе с потерями при расходе ствола 
+    около 4.5 л/с, поэтому напоры не выходят за допустимые пределы при любой длине цепочки.
+        Выход:
+            (список элементов, [головной насос])
+    '''
+    s = NRS_Data.ss['150']
+    q = P_B * 60**0.5
+    pump = Element('Н0', EType.PUMP, H_add=60)
+    elmnts = [pump]
+    prev = pump
+    for k in range(1, stages+1):
+        hose = Element(f'МРЛ{k}', EType.CONNECTOR, s=s, n=hoses, l=20, z=20-s*hoses*q**2)
+        relay = Element(f'Н{k}', EType.CONNECTOR, H_add=20)
+        prev.append(hose).append(relay)
+        elmnts += [hose, relay]
+        prev = relay
+    hose = Element('РРЛ', EType.CONNECTOR, s=NRS_Data.ss['51'], n=2, l=20)
+    nozzle = Element('Ств', EType.NOZZLE, p=P_B, q_out=q_out_nozzle)
+    prev.append(hose).append(nozzle)
+    elmnts += [hose, nozzle]
+    return elmnts, [pump]
+
+
+def splitter_tree(depth, k=3, total_q=30):
+    '''
+    Дерево разветвлений (аналогично example_complex_1_2_5): насос, магистральная линия,
+    далее depth уровней разветвлений по k выходов с рукавными линиями 77 мм,
+    на концах - рабочие линии 66 мм и стволы. Проводимость стволов подобрана так,
+    чтобы суммарный расход был около total_q л/с при любом размере дерева.
+        Выход:
+            (список элементов, [насос])
+    '''
+    leaves = k**depth
+    p = NRS_Revision.calc_p(total_q/leaves, 40)
+    pump = Element('Н', EType.PUMP, H_add=80)
+    hose = Element('МРЛ', EType.CONNECTOR, s=NRS_Data.ss['77'], n=2, l=20)
+    pump.append(hose)
+    elmnts = [pump, hose]
+    level = [hose]
+    for d in range(depth):
+        new_level = []
+        for i, parent in enumerate(level):
+            splitter = Element(f'Р{d}_{i}', EType.CONNECTOR, ro=k)
+            parent.append(splitter)
+            elmnts.append(splitter)
+            for j in range(k):
+                line = Element(f'Л{d}_{i}_{j}', EType.CONNECTOR, s=NRS_Data.ss['77'], n=1, l=20)
+                splitter.append(line)
+                elmnts.append(line)
+                new_level.append(line)
+        level = new_level
+    for i, parent in enumerate(level):
+        hose = Element(f'РРЛ{i}', EType.CONNECTOR, s=NRS_Data.ss['66'], n=1, l=20)
+        nozzle = Element(f'Ств{i}', EType.NOZZLE, p=p, q_out=q_out_nozzle)
+        parent.append(hose).append(nozzle)
+        elmnts += [hose, nozzle]
+    return elmnts, [pump]
+
+
+def joiner_layout(groups, pumps=2):
+    '''
+    Схема с водосборниками: groups групп, в каждой pumps насосов подают воду
+    по магистральным линиям 77 мм в водосборник, от которого рабочая линия 77 мм
+    питает лафетный ствол (аналогично pump_to_pump.ipynb)
+        Выход:
+            (список элементов, [первый насос каждой группы])
+    '''
+    elmnts = []
+    roots = []
+    for g in range(groups):
+        joiner = Element(f'ВС{g}', EType.CONNECTOR, ri=pumps, ro=1)
+        for i in range(pumps):
+            pump = Element(f'Н{g}_{i}', EType.PUMP, H_add=80)
+            hose = Element(f'МРЛ{g}_{i}', EType.CONNECTOR, s=NRS_Data.ss['77'], n=4+2*i, l=20)
+            pump.append(hose).append(joiner)
+            elmnts += [pump, hose]
+            if i==0:
+                roots.append(pump)
+        line = Element(f'РРЛ{g}', EType.CONNECTOR, s=NRS_Data.ss['77'], n=4, l=20)
+        nozzle = Element(f'Ств{g}', EType.NOZZLE, p=P_L, q_out=q_out_nozzle)
+        joiner.append(line).append(nozzle)
+        elmnts += [joiner, line, nozzle]
+    return elmnts, roots
+
+
+def random_dag(size, seed=0):
+    '''
+    Случайная ациклическая НРС из size соединительных элементов: несколько насосов,
+    разветвления и водосборники со случайным числом входов и выходов,
+    стволы на всех концевых элементах. Водосборник объединяет только линии 
+    от разных насосов, поэтому контуров нет и без учета направления связей. 
+    Сопротивления и проводимости стволов малы, поэтому напоры остаются 
+    в допустимых пределах при любом размере.
+        Вход:
+            size=int: количество соединительных элементов
+            seed=int: начальное значение генератора случайных чисел
+        Выход:
+            (список элементов, насосы)
+    '''
+    rnd = random.Random(seed)
+    pumps = [Element(f'Н{i}', EType.PUMP, H_add=60) for i in range(max(1, size//50))]
+    open_ = list(pumps)             # элементы со свободными выходами
+    elmnts = list(pumps)
+    part = {id(pump): k for k, pump in enumerate(pumps)}    # связная часть элемента
+    merged = list(range(len(pumps)))                        # объединенные части
+    def find(k):
+        while merged[k]!=k:
+            k = merged[k]
+        return k
+    for i in range(size):
+        parents = [rnd.choice(open_)]
+        if rnd.random()<0.1:
+            # Водосборник: второй вход - от другой связной части
+            first = find(part[id(parents[0])])
+            others = [e for e in open_ if find(part[id(e)])!=first]
+            if others:
+                parents.append(rnd.choice(others))
+                merged[find(part[id(parents[1])])] = first
+        elmnt = Element(f'Э{i}', EType.CONNECTOR, s=rnd.choice([0, 0.0005, 0.001]),
+                        n=rnd.randint(1, 3), ri=len(parents), ro=rnd.choice([1, 1, 2, 3]))
+        part[id(elmnt)] = part[id(parents[0])]
+        for parent in parents:
+            parent.append(elmnt)
+            if len(parent.elements_next)>=parent.ro:
+                open_.remove(parent)
+        open_.append(elmnt)
+        elmnts.append(elmnt)
+    for i, elmnt in enumerate([e for e in elmnts if not e.elements_next]):
+        nozzle = Element(f'Ств{i}', EType.NOZZLE, p=0.05, q_out=q_out_nozzle)
+        elmnt.append(nozzle)
+        elmnts.append(nozzle)
+    return elmnts, pumps
+
+
+def ring_main(size, feed=50):
+    '''
+    Кольцевая магистраль из size узлов, соединенных линиями 77 мм в замкнутый контур.
+    От каждого узла рабочая линия 51 мм питает ствол малой проводимости, через каждые feed узлов
+    кольцо питается насосом по магистральной линии 77 мм. Рассчитывается только методом Ньютона.
+        Выход:
+            (список элементов, насосы)
+    '''
+    pumps = []
+    nodes = []
+    elmnts = []
+    for i in range(size):
+        feeding = i%feed==0
+        node = Element(f'У{i}', EType.CONNECTOR, ri=2 if feeding else 1, ro=2)
+        if feeding:
+            pump = Element(f'Н{i//feed}', EType.PUMP, H_add=60)
+            hose = Element(f'МРЛ{i//feed}', EType.CONNECTOR, s=NRS_Data.ss['77'], n=2, l=20)
+            pump.append(hose).append(node)
+            pumps.append(pump)
+            elmnts += [pump, hose]
+        hose = Element(f'РРЛ{i}', EType.CONNECTOR, s=NRS_Data.ss['51'], n=1, l=20)
+        nozzle = Element(f'Ств{i}', EType.NOZZLE, p=0.05, q_out=q_out_nozzle)
+        node.append(hose).append(nozzle)
+        nodes.append(node)
+        elmnts += [node, hose, nozzle]
+    for i, node in enumerate(nodes):
+        line = Element(f'КЛ{i}', EType.CONNECTOR, s=NRS_Data.ss['77'], n=1, l=20)
+        node.append(line).append(nodes[(i+1)%size])
+        elmnts.append(line)
+    return elmnts, pumps
+
+
+# Генераторы НРС по именам (единственный обязательный аргумент - размер НРС);
+# все схемы, кроме кольцевой магистрали (ring), ациклические
+GENERATORS = {
+    'relay':    relay_chain,
+    'tree':     splitter_tree,
+    'joiner':   joiner_layout,
+    'dag':      random_dag,
+    'ring':     ring_main,
+}
@@ -0,0 +1,74 @@
+'''
+Эталонные результаты расчета синтетических схем.
+Эталон хранится в reference.json рядом с модулем и обновляется только
+при осознанном изменении методики расчета (update_reference).
+'''
+import json
+import os
+import warnings
+
+from .generators import GENERATORS, build_model
+
+
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), 'reference.json')
+
+# Схемы, для которых хранятся эталонные результаты: (генератор, размер)
+CASES = (
+    ('relay', 10),
+    ('relay', 100),
+    ('tree', 3),
+    ('joiner', 5),
+    ('dag', 300),
+    ('ring', 100),
+)
+
+
+def solve_case(name, size, accuracy=1e-6):
+    '''
+    Расчет схемы до заданной точности от нулевых расходов
+        Выход:
+            dict - {'Q': суммарный расход, 'nozzles': {имя ствола: [расход, напор на входе]}}
+    '''
+    _, roots = GENERATORS[name](size)
+    model = build_model(roots)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model.drop_q()
+        model.calc(accuracy=accuracy, fixStates=False, incremental=False)
+    return {'Q': model.summaryQ(),
+            'nozzles': {elmnt.name: [elmnt.q, elmnt.H_in] for elmnt in model.elmnts_out}}
+
+
+def update_reference(path=REFERENCE_PATH):
+    '''
+    Пересчет и сохранение эталонных результатов
+        Выход:
+            dict - эталонные результаты {'генератор:размер': результат solve_case}
+    '''
+    reference = {f'{name}:{size}': solve_case(name, size) for name, size in CASES}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(reference, f, ensure_ascii=False, indent=1)
+    return reference
+
+
+def check_reference(path=REFERENCE_PATH, tol=1e-3):
+    '''
+    Сравнение результатов расчета с эталоном
+        Вход:
+            tol=float: допустимое отклонение расходов (л/с) и напоров (м)
+        Выход:
+            list - расхождения [(схема, элемент, эталон, результат)]; пустой список - расхождений нет
+    '''
+    with open(path, encoding='utf-8') as f:
+        reference = json.load(f)
+    diffs = []
+    for key, expected in reference.items():
+        name, _, size = key.rpartition(':')
+        result = solve_case(name, int(size))
+        if abs(result['Q']-expected['Q'])>tol:
+            diffs.append((key, 'Q', expected['Q'], result['Q']))
+        for nozzle, values in expected['nozzles'].items():
+            got = result['nozzles'].get(nozzle)
+            if got is None or any(abs(a-b)>tol for a, b in zip(values, got)):
+                diffs.append((key, nozzle, values, got))
+    return diffs
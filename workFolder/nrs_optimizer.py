@@ -0,0 +1,460 @@
+'''
+Подбор рукавных линий НРС: диаметров рукавов (NRS_Data.ss) и их количества в линиях,
+при которых стволы получают требуемый расход при наименьшем напоре насоса.
+
+Перебор вариантов ведется методом ветвей и границ: решения по линиям принимаются
+по очереди, для частичного выбора оценка снизу - требуемый напор насосов при
+стволах, работающих ровно с требуемым расходом, и наименьших сопротивлениях еще
+не выбранных линий (с учетом наличия рукавов). Оценка считается без расчета
+модели, требуемые напоры ветвей запоминаются по выбору линий в ветви. Точно
+(делением отрезка [0, approved_H] пополам) рассчитываются только полные варианты,
+накопленные в пакет: все варианты пакета рассчитываются одновременно
+(NRS_Model.calc_batch), пакеты могут распределяться по процессам.
+
+Пример:
+    opt = NRS_Optimizer(model, pump='Н1',
+                        lines={'МРЛ': {'diameters': ('66', '77'), 'counts': (4, 5)},
+                               'РРЛ1': ('51', '66'), 'РРЛ2': ('51', '66')},
+                        inventory={'77': 4, '66': 6}, min_H=40)
+    best, info = opt.run()
+    opt.apply(best)
+'''
+import heapq
+import itertools
+import multiprocessing
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from nrs import NRS_Data, EType, q_out_nozzle, q_out_nozzle_by_s
+
+
+def required_heads(model, pumps, lines, s, n, nozzles, q_min, min_H=0, approved_H=120, accuracy=1e-3, tol=0.01):
+    '''
+    Наименьший напор насосов, при котором все стволы получают требуемый расход и напор,
+    для набора вариантов рукавных линий (деление отрезка [0, approved_H] пополам,
+    на каждом шаге все варианты рассчитываются одним пакетом)
+        Вход:
+            model=NRS_Model: модель НРС
+            pumps=list: имена насосов, напор которых подбирается (у всех насосов - одинаковый)
+            lines=list: имена рукавных линий
+            s, n=np.array (количество вариантов, количество линий): сопротивления и количество рукавов линий по вариантам
+            nozzles=list: имена стволов
+            q_min=list: требуемые расходы стволов, л/с
+            min_H=float: наименьший допустимый напор на стволах, м
+            approved_H=float: предельно допустимый напор (см. calc_batch)
+            accuracy=float: точность расчета (см. calc_batch)
+            tol=float: точность определения напора насосов, м
+        Выход:
+            np.array: требуемый напор насосов по вариантам (inf - требования не выполнимы)
+    '''
+    size = len(s)
+    heads = np.full(size, np.inf)
+    scenarios = {}
+    for j, line in enumerate(lines):
+        scenarios[f'{line}.s'] = s[:, j]
+        scenarios[f'{line}.n'] = n[:, j]
+
+    def satisfied(H, take):
+        '''Выполнены ли требования при напоре насосов H для вариантов take'''
+        batch = {key: val[take] for key, val in scenarios.items()}
+        for pump in pumps:
+            batch[f'{pump}.H_add'] = H
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            res, info = model.calc_batch(batch, accuracy=accuracy, approved_H=approved_H)
+        good = info['correct'].copy()
+        with np.errstate(invalid='ignore'):
+            for nozzle, q in zip(nozzles, q_min):
+                good &= res[nozzle]['q']>=q
+                if min_H:
+                    good &= res[nozzle]['H_in']>=min_H
+        return good
+
+    take = np.flatnonzero(satisfied(np.full(size, float(approved_H)), np.arange(size)))
+    if not take.size:
+        return heads
+    lo = np.zeros(take.size)
+    hi = np.full(take.size, float(approved_H))
+    while (hi-lo).max()>tol:
+        mid = (lo+hi)/2
+        good = satisfied(mid, take)
+        hi = np.where(good, mid, hi)
+        lo = np.where(good, lo, mid)
+    heads[take] = hi
+    return heads
+
+
+# Модель и параметры расчета, переданные процессу-исполнителю при его инициации (см. NRS_Optimizer.run)
+_worker_args = None
+
+def _worker_init(args):
+    '''Инициация процесса-исполнителя: модель передается один раз на процесс'''
+    global _worker_args
+    _worker_args = args
+
+def _worker_heads(chunk):
+    '''Расчет требуемых напоров части пакета вариантов в процессе-исполнителе'''
+    model, pumps, lines, nozzles, q_min, kwargs = _worker_args
+    s, n = chunk
+    return required_heads(model, pumps, lines, s, n, nozzles, q_min, **kwargs)
+
+
+class NRS_Optimizer(object):
+    '''
+    Подбор диаметров и количества рукавов в линиях НРС при наименьшем напоре насоса
+    (метод ветвей и границ, см. описание модуля)
+    '''
+
+    def __init__(self,
+                 model,
+                 pump,
+                 lines,
+                 inventory  = None,
+                 q_min      = None,
+                 min_H      = 0,
+                 approved_H = 120,
+                 accuracy   = 1e-3,
+                 tol        = 0.01):
+        '''
+            Вход:
+                `model`:NRS_Model
+                модель НРС. Параметры линий меняются только в пакетных расчетах (и при apply)
+
+                `pump`:str|list
+                имя насоса (или список имен насосов с одинаковым напором), напор которого подбирается
+
+                `lines`:dict
+                варианты рукавных линий: {имя линии: {'diameters': диаметры (ключи NRS_Data.ss),
+                'counts': количества рукавов}} или {имя линии: диаметры}.
+                По умолчанию количество рукавов - текущее n линии
+
+                `inventory`:dict=None
+                наличие рукавов {диаметр: количество}. Рукава диаметров, не указанных в inventory, не ограничены
+
+                `q_min`:dict=None
+                требуемые расходы стволов {имя ствола: расход, л/с}. По умолчанию - текущие расходы стволов
+                при напоре min_H (если min_H=0 - при напоре 40 м, как для табличных расходов стволов)
+
+                `min_H`:float=0
+                наименьший допустимый напор на стволах, м
+
+                `approved_H`:float=120
+                предельно допустимый напор (ограничение напора насосов и напоров в линиях)
+
+                `accuracy`:float=1e-3
+                точность расчета вариантов (см. calc_batch)
+
+                `tol`:float=0.01
+                точность определения требуемого напора насосов, м
+        '''
+        self.model = model
+        self.pumps = [pump] if isinstance(pump, str) else list(pump)
+        for name in self.pumps:
+            self._element(name)
+
+        # Варианты линий: (диаметр, количество рукавов, сопротивление) по возрастанию сопротивления линии
+        self.lines   = []
+        self.options = []
+        for name, spec in lines.items():
+            elmnt = self._element(name)
+            if not isinstance(spec, dict):
+                spec = {'diameters': spec}
+            counts = spec.get('counts', (elmnt.n,))
+            diameters = list(spec['diameters'])
+            options = [(d, int(k), s) for d, s in zip(diameters, NRS_Data.hose_s(diameters).tolist())
+                       for k in counts]
+            options.sort(key=lambda o: o[1]*o[2])
+            self.lines.append(name)
+            self.options.append(options)
+
+        self.inventory = dict(inventory or {})
+        self.min_H = min_H
+        self.approved_H = approved_H
+        plan = model.get_plan()
+        self.nozzles = [elmnt.name for elmnt in model.elmnts_out if id(elmnt) in plan.index]
+        if q_min is None:
+            rated_H = min_H or 40
+            q_min = {name: self._element(name).p*rated_H**0.5 for name in self.nozzles
+                     if self._element(name).type==EType.NOZZLE}
+        self.q_min = q_min
+        self.kwargs = {'min_H': min_H, 'approved_H': approved_H, 'accuracy': accuracy, 'tol': tol}
+        self.tol = tol
+
+        self.cache  = {}    # варианты (номера вариантов линий) -> требуемый напор насосов
+        self.stats  = {}
+        self._executor = None
+        self._bound_init(plan)
+
+    def _element(self, name):
+        elmnt = self.model.getElement(name)
+        if elmnt is None:
+            raise ValueError(f'Элемент {name} не найден в модели {self.model.name}')
+        return elmnt
+
+    def _bound_init(self, plan):
+        '''
+        Подготовка оценки снизу требуемого напора насосов (см. bound).
+        Расходы всех стволов не меньше требуемых, поэтому расходы и потери напора во всех линиях
+        не меньше, чем при стволах, работающих ровно с требуемым расходом. Требуемый напор 
+        на входе элемента при таких расходах - наибольший из требуемых напоров следующих элементов 
+        (для которых он ведущий) с учетом потерь, перепада высот и дополнительного напора.
+        Требуемый напор элемента зависит только от выбора линий ниже него, поэтому для элементов 
+        без выбираемых линий он рассчитывается однажды, а для остальных запоминается по выбору 
+        линий своей ветви.
+        '''
+        ne = len(plan.elmnts)
+        self._plan = plan
+        pumps = [plan.index[id(self._element(name))] for name in self.pumps]
+        # Оценка строится только для насосов-источников (напор на входе которых задан)
+        self._bounded = all(plan.prev_ptr[i]==plan.prev_ptr[i+1] for i in pumps)
+        self._pump_idx = pumps
+        self._H_in = plan.column('H_in')
+
+        # Расходы при стволах, работающих с требуемым расходом
+        q = np.zeros(ne)
+        for name, value in self.q_min.items():
+            q[plan.index[id(self._element(name))]] = value
+        for i in plan.order_q:
+            start, end = plan.prev_ptr[i], plan.prev_ptr[i+1]
+            for k in range(start, end):
+                q[plan.prev_idx[k]] += q[i]/(end-start)
+        self._q = q
+
+        # Требуемые напоры на входе стволов
+        need = np.full(ne, float(self.min_H))
+        for i in plan.out:
+            elmnt = plan.elmnts[i]
+            if q[i]>0 and elmnt.q_out is q_out_nozzle and elmnt.p>0:
+                need[i] = max(need[i], (q[i]/elmnt.p)**2)
+            elif q[i]>0 and elmnt.q_out is q_out_nozzle_by_s:
+                need[i] = max(need[i], elmnt.s*q[i]**2)
+        self._need = need
+
+        # Параметры элементов (у подбираемых насосов дополнительный напор не учитывается)
+        self._loss  = plan.column('s')*plan.column('n')*q**2
+        self._extra = plan.column('z')-plan.column('H_add')
+        self._extra[pumps] = plan.column('z')[pumps]
+        self._line_of = {plan.index[id(self._element(name))]: j for j, name in enumerate(self.lines)}
+        self._children = [[c for c in plan.next_idx[plan.next_ptr[i]:plan.next_ptr[i+1]] if plan.parent_H[c]==i]
+                          for i in range(ne)]
+
+        # Выбираемые линии в ветви каждого элемента (от стволов к источникам)
+        sub = [set() for _ in range(ne)]
+        for i in reversed(plan.order_H):
+            if i in self._line_of:
+                sub[i].add(self._line_of[i])
+            for c in self._children[i]:
+                sub[i] |= sub[c]
+        self._sub = [tuple(sorted(js)) for js in sub]
+        self._memo = {}
+        self._const = {}
+        self._required = np.zeros(ne)
+        for i in reversed(plan.order_H):
+            if not self._sub[i]:
+                self._const[i] = self._need_in(i, None)
+
+    def _need_in(self, i, choice):
+        '''Требуемый напор на входе элемента i при выборе линий choice (см. _bound_init)'''
+        if self._plan.is_out[i]:
+            return self._need[i]
+        need_out = 0.0
+        for c in self._children[i]:
+            need_out = max(need_out, self._branch(c, choice))
+        j = self._line_of.get(i)
+        loss = self._loss[i]
+        if j is not None:
+            _, count, s = self.options[j][choice[j]]
+            loss = s*count*self._q[i]**2
+        return need_out + loss + self._extra[i]
+
+    def _branch(self, i, choice):
+        '''Требуемый напор на входе элемента i (с запоминанием по выбору линий его ветви)'''
+        value = self._const.get(i)
+        if value is not None:
+            return value
+        key = (i, tuple(choice[j] for j in self._sub[i]))
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo[key] = self._need_in(i, choice)
+        else:
+            self.stats['bound_hits'] = self.stats.get('bound_hits', 0) + 1
+        return value
+
+    def bound(self, choice):
+        '''
+        Оценка снизу требуемого напора насосов для полного выбора линий
+        (inf - напор превышает approved_H, 0 - оценка не строится, если подбираемые насосы не источники)
+        '''
+        if not self._bounded:
+            return 0.0
+        head = max(self._branch(i, choice)-self._H_in[i] for i in self._pump_idx)
+        return head if head<=self.approved_H else np.inf
+
+    def _usage(self, choice):
+        '''Количество рукавов по диаметрам для (частичного) выбора'''
+        usage = {}
+        for options, k in zip(self.options, choice):
+            d, count, _ = options[k]
+            usage[d] = usage.get(d, 0) + count
+        return usage
+
+    def _fits(self, usage):
+        '''Хватает ли рукавов'''
+        return all(count<=self.inventory.get(d, count) for d, count in usage.items())
+
+    def _complete(self, choice):
+        '''
+        Дополнение частичного выбора линиями наименьшего сопротивления, каждая из которых
+        по отдельности умещается в оставшееся наличие рукавов
+            Выход:
+                tuple - полный выбор (None - для какой-то линии нет подходящего варианта)
+        '''
+        usage = self._usage(choice)
+        left = {d: self.inventory[d]-usage.get(d, 0) for d in self.inventory}
+        full = list(choice)
+        for options in self.options[len(choice):]:
+            k = next((k for k, (d, count, _) in enumerate(options) if count<=left.get(d, count)), None)
+            if k is None:
+                return None
+            full.append(k)
+        return tuple(full)
+
+    def evaluate(self, choices, workers=1):
+        '''
+        Требуемые напоры насосов для набора полных выборов (с запоминанием рассчитанных)
+            Вход:
+                choices=list: выборы - кортежи номеров вариантов линий
+                workers=int: количество процессов
+            Выход:
+                list - требуемые напоры насосов (inf - требования не выполнимы)
+        '''
+        new = list(dict.fromkeys(c for c in choices if not c in self.cache))
+        self.stats['cache_hits'] = self.stats.get('cache_hits', 0) + len(choices)-len(new)
+        if new:
+            s = np.array([[self.options[j][k][2] for j, k in enumerate(c)] for c in new])
+            n = np.array([[self.options[j][k][1] for j, k in enumerate(c)] for c in new], dtype=float)
+            if self._executor is None or len(new)<2*workers:
+                heads = required_heads(self.model, self.pumps, self.lines, s, n,
+                                       list(self.q_min), list(self.q_min.values()), **self.kwargs)
+            else:
+                bounds = np.linspace(0, len(new), workers+1).astype(int)
+                chunks = [(s[a:b], n[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if b>a]
+                heads = np.concatenate(list(self._executor.map(_worker_heads, chunks)))
+            self.cache.update(zip(new, heads.tolist()))
+            self.stats['evaluations'] = self.stats.get('evaluations', 0) + len(new)
+            self.stats['batches'] = self.stats.get('batches', 0) + 1
+        return [self.cache[c] for c in choices]
+
+    def run(self, batch=32, workers=1, max_nodes=1000000):
+        '''
+        Поиск варианта линий с наименьшим требуемым напором насосов
+            Вход:
+                batch=int: количество полных вариантов, рассчитываемых одним пакетом
+                workers=int: количество процессов для расчета пакетов (1 - в текущем процессе)
+                max_nodes=int: предельное количество рассматриваемых ветвей
+            Выход:
+                dict - лучший вариант: {'head': требуемый напор насосов, м,
+                'lines': {имя линии: {'diameter', 'n', 's'}}, 'choice': номера вариантов линий}
+                (None - допустимых вариантов нет)\n
+                dict - {'status': 'optimal' | 'infeasible' | 'max_nodes', 'nodes': рассмотрено ветвей,
+                'pruned': отсечено ветвей, 'evaluations': рассчитано вариантов, 'cache_hits': повторных расчетов 
+                вариантов, 'bound_hits': повторных оценок ветвей, 'batches': пакетных расчетов, 'time': время поиска, с}
+        '''
+        start = time.perf_counter()
+        self.stats = {'nodes': 0, 'pruned': 0, 'evaluations': 0, 'cache_hits': 0, 'bound_hits': 0, 'batches': 0}
+        self._executor = None
+        if workers>1:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            args = (self.model, self.pumps, self.lines, list(self.q_min), list(self.q_min.values()), self.kwargs)
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                 initializer=_worker_init, initargs=(args,))
+        try:
+            best, best_head, status = self._search(batch, workers, max_nodes)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+        self.stats['status'] = status
+        self.stats['time'] = time.perf_counter()-start
+        if best is None:
+            return None, self.stats
+        return self.describe(best, best_head), self.stats
+
+    def _search(self, batch, workers, max_nodes):
+        '''
+        Поиск в порядке возрастания оценки снизу: частичные выборы раскрываются по следующей линии,
+        полные выборы накапливаются и рассчитываются пакетами; ветви с оценкой не меньше
+        лучшего найденного напора отсекаются
+        '''
+        depth = len(self.lines)
+        stats = self.stats
+        best, best_head = None, np.inf
+        counter = itertools.count()
+        root = self._complete(())
+        heap = [] if root is None else [(self.bound(root), next(counter), ())]
+        status = 'optimal'
+        while heap:
+            if stats['nodes']>=max_nodes:
+                status = 'max_nodes'
+                break
+            leaves = []
+            while heap and len(leaves)<batch:
+                bound, _, choice = heapq.heappop(heap)
+                if bound>=best_head-self.tol:
+                    stats['pruned'] += 1
+                    continue
+                if len(choice)==depth:
+                    leaves.append(choice)
+                    continue
+                for k in range(len(self.options[len(choice)])):
+                    child = choice + (k,)
+                    stats['nodes'] += 1
+                    full = self._complete(child) if self._fits(self._usage(child)) else None
+                    value = np.inf if full is None else self.bound(full)
+                    if value>=best_head-self.tol or value==np.inf:
+                        stats['pruned'] += 1
+                        continue
+                    heapq.heappush(heap, (value, next(counter), child))
+            if leaves:
+                for choice, head in zip(leaves, self.evaluate(leaves, workers)):
+                    if head<best_head:
+                        best, best_head = choice, head
+
+        if best is None:
+            status = 'infeasible'
+        return best, best_head, status
+
+    def describe(self, choice, head=None):
+        '''
+        Описание выбора вариантов линий
+            Выход:
+                dict - {'head', 'lines': {имя линии: {'diameter', 'n', 's'}}, 'choice'}
+        '''
+        if head is None:
+            head = self.evaluate([choice])[0]
+        lines = {name: {'diameter': options[k][0], 'n': options[k][1], 's': options[k][2]}
+                 for name, options, k in zip(self.lines, self.options, choice)}
+        return {'head': head, 'lines': lines, 'choice': choice}
+
+    def apply(self, best, accuracy=None):
+        '''
+        Установка выбранных параметров линий и напора насосов в модели и ее расчет
+            Вход:
+                best=dict: вариант (см. run)
+                accuracy=float: точность расчета модели (по умолчанию - как при подборе)
+            Выход:
+                NRS_Model
+        '''
+        for name, line in best['lines'].items():
+            elmnt = self._element(name)
+            elmnt.s = line['s']
+            elmnt.n = line['n']
+        for name in self.pumps:
+            self._element(name).H_add = best['head']
+        self.model.calc(accuracy=accuracy or self.kwargs['accuracy'], fixStates=False)
+        return self.model
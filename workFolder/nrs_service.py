@@ -0,0 +1,629 @@
+'''
+Локальный сервис расчета НРС (HTTP/JSON поверх asyncio, без внешних зависимостей).
+
+Сервис держит загруженные заранее модели-шаблоны и принимает запросы на расчет
+шаблона с изменениями параметров элементов либо сериализованной модели (NRS_Model.to_dict).
+Одновременные запросы к одной топологии (шаблону) с одинаковыми параметрами расчета
+собираются в пакет и рассчитываются одним векторизованным расчетом (NRS_Model.calc_batch):
+пакет отправляется на расчет по истечении окна ожидания (window) или при заполнении (max_batch),
+а пока все процессы-исполнители заняты, открытые пакеты продолжают пополняться.
+Пакеты распределяются по пулу процессов, модели передаются процессам один раз.
+Модели с замкнутыми контурами рассчитываются по сценариям пакета методом Ньютона.
+Модели передаются процессам в виде массивов (NRS_Model.to_arrays),
+поэтому функции q_out элементов должны быть зарегистрированы (register_q_out).
+
+Запросы (тело и ответ - JSON):
+    GET  /health      - {'ok': true}
+    GET  /templates   - шаблоны: {имя: {'elements': количество элементов, 'cyclic': признак контура}}
+    GET  /stats       - количество запросов и пакетов, средний размер пакета, задержка p50/p99, мс
+    POST /templates   - {'name': имя, 'model': NRS_Model.to_dict()} - загрузка шаблона
+    POST /calc        - {'template': имя шаблона | 'model': NRS_Model.to_dict(),
+                         'params': {'имя элемента.параметр': значение} (см. NRS_Batch.params),
+                         'elements': [имена элементов в ответе] (по умолчанию - все),
+                         'accuracy', 'iters', 'drop_q', 'approved_H', 'max_iters' (см. calc_batch)}
+                        ответ: {'elements': {имя: {'H_in', 'h', 'q'}}, 'Q': суммарный расход стволов,
+                         'iters', 'correct', 'stable', 'feasible', 'batch': размер пакета}
+
+Пример:
+    service = NRS_Service({'Схема 1': model}, workers=4)
+    service.run(port=8765)                     # или await service.start(...) внутри цикла asyncio
+
+    python nrs_service.py serve --template "Схема 1=scheme1.nrs" --port 8765
+    python nrs_service.py bench --clients 32 --requests 2000   # задержка под нагрузкой
+'''
+import argparse
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from nrs import NRS_Model, NRS_Batch, EType
+
+
+#=======================Расчет в процессе-исполнителе===============================
+# Модели шаблонов процесса-исполнителя {ключ: NRS_Model} (не более _worker_limit)
+_worker_models = collections.OrderedDict()
+_worker_limit  = 64
+
+def _service_init(templates):
+    '''Инициация процесса-исполнителя: модели шаблонов {ключ: массивы to_arrays} передаются один раз'''
+    _worker_models.clear()
+    for key, arrays in templates.items():
+        _worker_models[key] = NRS_Model.from_arrays(arrays)
+
+def _service_model(key, arrays):
+    '''Модель шаблона процесса-исполнителя (массивы передаются для шаблонов, загруженных после запуска пула)'''
+    model = _worker_models.get(key)
+    if model is None:
+        if arrays is None:
+            raise KeyError(f'Шаблон {key} не загружен в процесс-исполнитель')
+        model = _worker_models[key] = NRS_Model.from_arrays(arrays)
+        while len(_worker_models)>_worker_limit:
+            _worker_models.popitem(last=False)
+    else:
+        _worker_models.move_to_end(key)
+    return model
+
+def _service_solve(args):
+    '''
+    Расчет пакета сценариев одного шаблона в процессе-исполнителе
+        Вход:
+            args=tuple: (ключ шаблона, массивы модели или None, сценарии {'элемент.параметр': массив},
+            количество сценариев, параметры calc_batch, имена элементов результата или None - все)
+        Выход:
+            dict - {имя элемента: {'H_in', 'h', 'q': массивы}}\n
+            dict - признаки расчета сценариев (см. calc_batch) и 'Q' - суммарный расход стволов
+    '''
+    key, arrays, scenarios, size, options, names = args
+    model = _service_model(key, arrays)
+    # НРС с замкнутыми контурами calc_batch рассчитывает по одному сценарию методом Ньютона
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        res, info = model.calc_batch({k: np.broadcast_to(v, size) for k, v in scenarios.items()}, **options)
+    if not scenarios:
+        # Запросы без изменения параметров: один расчет на весь пакет
+        res  = {name: {c: np.broadcast_to(col, size) for c, col in cols.items()} for name, cols in res.items()}
+        info = {k: np.broadcast_to(v, size) for k, v in info.items()}
+    info['Q'] = sum((res[elmnt.name]['q'] for elmnt in model.elmnts_out), np.zeros(size))
+    if names is not None:
+        res = {name: res[name] for name in names}
+    return res, info
+
+
+#=======================Сервис расчета===============================
+class _ServiceTemplate(object):
+    '''
+    Шаблон сервиса: модель (для проверки запросов и значений параметров по умолчанию)
+    и ее массивы для процессов-исполнителей.
+    Ключ шаблона в исполнителях уникален: замененный шаблон с тем же именем не смешивается с прежним
+    '''
+    __slots__ = ('name', 'key', 'model', 'arrays', 'preloaded', 'cyclic', 'names')
+    _keys = itertools.count()
+
+    def __init__(self, name, model, preloaded):
+        self.name      = name
+        self.key       = f'{name}#{next(self._keys)}'
+        self.model     = model
+        self.arrays    = model.to_arrays()
+        self.preloaded = preloaded
+        self.cyclic    = model.get_plan().cyclic
+        self.names     = set(elmnt.name for elmnt in model.elmnts)
+
+    def value(self, key):
+        '''Текущее значение параметра шаблона по ключу 'имя элемента.параметр' '''
+        name, _, attr = key.rpartition('.')
+        return float(getattr(self.model.getElement(name), attr))
+
+    def check(self, params):
+        '''
+        Проверка изменений параметров запроса
+            Выход:
+                dict - {'имя элемента.параметр': float}
+        '''
+        if not isinstance(params, dict):
+            raise ValueError('params: ожидается словарь {"имя элемента.параметр": значение}')
+        plan = self.model.get_plan()
+        checked = {}
+        for key, val in params.items():
+            name, _, attr = str(key).rpartition('.')
+            elmnt = self.model.getElement(name)
+            if elmnt is None:
+                raise ValueError(f'Элемент {name} не найден в шаблоне {self.name}')
+            if not attr in NRS_Batch.params:
+                raise ValueError(f'Параметр {attr} не может задаваться в запросе (допустимы: {", ".join(NRS_Batch.params)})')
+            if not id(elmnt) in plan.index:
+                raise ValueError(f'Элемент {name} не участвует в расчете')
+            if isinstance(val, bool) or not isinstance(val, (int, float)):
+                raise ValueError(f'{key}: ожидается число')
+            checked[str(key)] = float(val)
+        return checked
+
+
+class _ServiceBatch(object):
+    '''Открытый пакет запросов шаблона: запросы (параметры, элементы ответа, future), таймер окна ожидания'''
+    __slots__ = ('template', 'items', 'due', 'handle')
+
+    def __init__(self, template):
+        self.template = template
+        self.items  = []
+        self.due    = False
+        self.handle = None
+
+
+class NRS_Service(object):
+    '''
+    Локальный сервис расчета НРС с объединением одновременных запросов в пакеты (см. описание модуля)
+    '''
+    # Параметры расчета, допустимые в запросе (см. calc_batch), и их типы
+    options = {'accuracy': float, 'iters': int, 'drop_q': bool, 'approved_H': float, 'max_iters': int}
+    # Допустимые ключи запроса на расчет
+    request_keys = ('template', 'model', 'params', 'elements') + tuple(options)
+
+    def __init__(self, templates=None, workers=None, window=0.002, max_batch=256, max_models=32):
+        '''
+        Вход:
+            templates=dict: шаблоны {имя: NRS_Model | путь к файлу модели (NRS_Model.load) | словарь to_dict}
+            workers=int: количество процессов-исполнителей (по умолчанию - количество процессоров);
+                0 - расчет в отдельном потоке текущего процесса
+            window=float: окно ожидания запросов для объединения в пакет, с
+            max_batch=int: наибольшее количество запросов в пакете
+            max_models=int: наибольшее количество сериализованных моделей из запросов, хранимых сервисом
+        '''
+        self.templates  = collections.OrderedDict()
+        self.workers    = (os.cpu_count() or 1) if workers is None else workers
+        self.window     = window
+        self.max_batch  = max_batch
+        self.max_models = max_models
+        self.executor   = None
+        self.servers    = []
+        self.connections = {}                                # открытые подключения {writer: задача обработки}
+        self.latency    = collections.deque(maxlen=100000)   # задержки ответов на запросы расчета, с
+        self.counters   = collections.Counter()
+        self._open    = {}                        # открытые пакеты {(ключ шаблона, параметры расчета): _ServiceBatch}
+        self._full    = collections.deque()       # заполненные пакеты, ожидающие исполнителя
+        self._running = 0                         # количество пакетов в расчете
+        for name, model in (templates or {}).items():
+            self.add_template(name, model)
+
+    def add_template(self, name, model):
+        '''
+        Загрузка шаблона (после запуска сервиса массивы модели передаются исполнителям вместе с пакетами)
+            Вход:
+                name=str: имя шаблона
+                model: NRS_Model | путь к файлу модели | словарь (NRS_Model.to_dict)
+            Выход:
+                NRS_Service: ссылка на текущий сервис
+        '''
+        if isinstance(model, str):
+            model = NRS_Model.load(model)
+        elif isinstance(model, dict):
+            model = NRS_Model.from_dict(model)
+        self.templates[name] = _ServiceTemplate(name, model, preloaded=self.executor is None)
+        return self
+
+    def _model_template(self, data):
+        '''Шаблон для сериализованной модели из запроса (одинаковые модели разделяют шаблон и пакеты)'''
+        key = 'model:' + hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+        template = self.templates.get(key)
+        if template is None:
+            try:
+                model = NRS_Model.from_dict(data)
+            except (KeyError, TypeError) as e:
+                raise ValueError(f'Некорректная модель: {e}') from None
+            template = self.templates[key] = _ServiceTemplate(key, model, preloaded=False)
+            stored = [k for k in self.templates if k.startswith('model:')]
+            for k in stored[:max(len(stored)-self.max_models, 0)]:
+                del self.templates[k]
+        else:
+            self.templates.move_to_end(key)
+        return template
+
+    #-----------------------Исполнители и пакеты-----------------------
+    def _start_executor(self):
+        '''Запуск пула исполнителей: шаблоны, загруженные до запуска, передаются процессам при инициации'''
+        preloaded = {t.key: t.arrays for t in self.templates.values() if t.preloaded}
+        if self.workers==0:
+            _service_init(preloaded)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                initializer=_service_init, initargs=(preloaded,))
+
+    async def calc(self, request):
+        '''
+        Расчет по запросу (без HTTP): запрос ставится в открытый пакет своего шаблона
+            Вход:
+                request=dict: запрос (см. POST /calc в описании модуля)
+            Выход:
+                dict - ответ
+        '''
+        if not isinstance(request, dict):
+            raise ValueError('Запрос должен быть объектом JSON')
+        unknown = [key for key in request if not key in self.request_keys]
+        if unknown:
+            raise ValueError(f'Неизвестные ключи запроса: {", ".join(map(str, unknown))}')
+        if 'model' in request:
+            template = self._model_template(request['model'])
+        else:
+            template = self.templates.get(request.get('template'))
+            if template is None:
+                raise ValueError(f'Шаблон {request.get("template")} не загружен')
+        params = template.check(request.get('params', {}))
+        names = request.get('elements')
+        if names is not None:
+            missing = [name for name in names if not name in template.names]
+            if missing:
+                raise ValueError(f'Элементы не найдены в шаблоне: {", ".join(map(str, missing))}')
+        options = {}
+        for key, kind in self.options.items():
+            if request.get(key) is not None:
+                options[key] = kind(request[key])
+
+        if self.executor is None:
+            self._start_executor()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = (template.key, tuple(sorted(options.items())))
+        batch = self._open.get(group)
+        if batch is None:
+            batch = self._open[group] = _ServiceBatch(template)
+            batch.handle = loop.call_later(self.window, self._due, group, batch)
+        batch.items.append((params, names, future))
+        if len(batch.items)>=self.max_batch:
+            batch.handle.cancel()
+            del self._open[group]
+            self._full.append((group, batch))
+        self._dispatch()
+        return await future
+
+    def _due(self, group, batch):
+        '''Окно ожидания пакета истекло: пакет отправляется первому освободившемуся исполнителю'''
+        batch.due = True
+        self._dispatch()
+
+    def _dispatch(self):
+        '''Отправка пакетов свободным исполнителям: сначала заполненные, затем - с истекшим окном ожидания'''
+        limit = max(self.workers, 1)
+        while self._running<limit:
+            if self._full:
+                group, batch = self._full.popleft()
+            else:
+                group = next((g for g, b in self._open.items() if b.due), None)
+                if group is None:
+                    break
+                batch = self._open.pop(group)
+            self._running += 1
+            asyncio.ensure_future(self._solve(group, batch))
+
+    async def _solve(self, group, batch):
+        '''Расчет пакета запросов в исполнителе и разбор результатов по запросам'''
+        key, options = group
+        template, items = batch.template, batch.items
+        try:
+            size = len(items)
+            keys = list(dict.fromkeys(k for params, _, _ in items for k in params))
+            scenarios = {k: np.array([params.get(k, np.nan) for params, _, _ in items]) for k in keys}
+            for k, col in scenarios.items():
+                col[np.isnan(col)] = template.value(k)
+            names = None
+            if all(n is not None for _, n, _ in items):
+                names = list(dict.fromkeys(name for _, n, _ in items for name in n))
+            args = (key, None if template.preloaded else template.arrays, scenarios, size, dict(options), names)
+            res, info = await asyncio.get_running_loop().run_in_executor(self.executor, _service_solve, args)
+
+            self.counters['batches'] += 1
+            self.counters['scenarios'] += size
+            res  = {name: {c: _plain(col) for c, col in cols.items()} for name, cols in res.items()}
+            info = {k: _plain(v) for k, v in info.items() if k!='QD2'}
+            for j, (_, n, future) in enumerate(items):
+                if future.done():
+                    continue
+                answer = {'elements': {name: {c: col[j] for c, col in res[name].items()} for name in (n or res)},
+                          'batch': size}
+                answer.update({k: v[j] for k, v in info.items()})
+                future.set_result(answer)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    #-----------------------HTTP-----------------------
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        '''
+        Запуск сервиса в текущем цикле asyncio
+            Вход:
+                host=str, port=int: адрес HTTP (по умолчанию - только локальные подключения)
+                path=str: путь к сокету Unix (если указан - вместо TCP)
+            Выход:
+                NRS_Service: ссылка на текущий сервис
+        '''
+        if self.executor is None:
+            self._start_executor()
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        self.servers.append(server)
+        return self
+
+    @property
+    def port(self):
+        '''Порт первого запущенного сервера TCP (при port=0 выбирается системой)'''
+        for server in self.servers:
+            for sock in server.sockets:
+                if sock.family!=getattr(socket, 'AF_UNIX', None):
+                    return sock.getsockname()[1]
+        return None
+
+    async def stop(self):
+        '''Остановка серверов и исполнителей'''
+        for server in self.servers:
+            server.close()
+        # Подключения keep-alive закрываются, их обработчики завершаются по концу потока
+        tasks = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def run(self, host='127.0.0.1', port=8765, path=None):
+        '''Запуск сервиса до прерывания (Ctrl+C)'''
+        async def main():
+            await self.start(host, port, path)
+            try:
+                await asyncio.gather(*(server.serve_forever() for server in self.servers))
+            finally:
+                await self.stop()
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle(self, reader, writer):
+        '''Обработка подключения: последовательные запросы HTTP/1.1 (с поддержкой keep-alive)'''
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                start = time.perf_counter()
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self._route(method, target.split('?')[0], body)
+                if method=='POST' and target.startswith('/calc'):
+                    self.latency.append(time.perf_counter()-start)
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                keep = version=='HTTP/1.1' and headers.get('connection', '').lower()!='close'
+                writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+                             f'Content-Type: application/json; charset=utf-8\r\n'
+                             f'Content-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def _route(self, method, target, body):
+        '''
+        Выполнение запроса HTTP
+            Выход:
+                int - код ответа\n
+                dict - ответ
+        '''
+        try:
+            if method=='GET' and target=='/health':
+                return 200, {'ok': True}
+            if method=='GET' and target=='/stats':
+                return 200, self.stats()
+            if method=='GET' and target=='/templates':
+                return 200, {name: {'elements': len(t.model.elmnts), 'cyclic': t.cyclic}
+                             for name, t in self.templates.items() if not name.startswith('model:')}
+            request = json.loads(body or b'{}')
+            if method=='POST' and target=='/templates':
+                self.add_template(request['name'], request['model'])
+                return 200, {'ok': True}
+            if method=='POST' and target=='/calc':
+                self.counters['requests'] += 1
+                return 200, await self.calc(request)
+            return 404, {'error': f'Неизвестный запрос {method} {target}'}
+        except (ValueError, KeyError, TypeError) as e:
+            self.counters['errors'] += 1
+            return 400, {'error': str(e)}
+        except Exception as e:
+            self.counters['errors'] += 1
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    def stats(self):
+        '''
+        Показатели сервиса
+            Выход:
+                dict - {'requests', 'errors', 'batches', 'scenarios', 'mean_batch': средний размер пакета,
+                'p50', 'p99', 'max': задержка ответа на запрос расчета, мс (по последним запросам)}
+        '''
+        stats = {key: self.counters[key] for key in ('requests', 'errors', 'batches', 'scenarios')}
+        stats['mean_batch'] = stats['scenarios']/stats['batches'] if stats['batches'] else 0
+        stats.update(_percentiles(self.latency))
+        return stats
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+def _plain(values):
+    '''Массив -> список значений для JSON (NaN -> None)'''
+    values = np.asarray(values)
+    if values.dtype.kind=='f':
+        return [None if v!=v else v for v in values.tolist()]
+    return values.tolist()
+
+def _percentiles(latency):
+    '''Задержки p50, p99 и наибольшая, мс'''
+    if not len(latency):
+        return {'p50': None, 'p99': None, 'max': None}
+    values = np.asarray(latency)*1000
+    p50, p99 = np.percentile(values, [50, 99])
+    return {'p50': float(p50), 'p99': float(p99), 'max': float(values.max())}
+
+
+#=======================Нагрузочное измерение===============================
+async def request(reader, writer, method, target, payload=None):
+    '''
+    Запрос HTTP к сервису по открытому подключению (keep-alive)
+        Выход:
+            int - код ответа\n
+            dict - ответ
+    '''
+    data = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        if name.strip().lower()=='content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def load_test(payloads, host='127.0.0.1', port=8765, path=None, clients=16, requests=1000):
+    '''
+    Нагрузочное измерение: clients клиентов одновременно отправляют запросы POST /calc
+        Вход:
+            payloads=callable(k) | list: запрос с номером k (список - по кругу)
+            host, port, path: адрес сервиса (см. NRS_Service.start)
+            clients=int: количество одновременных подключений
+            requests=int: общее количество запросов
+        Выход:
+            dict - {'requests', 'errors', 'time': время, с, 'throughput': запросов в секунду,
+            'p50', 'p99', 'max': задержка, мс (со стороны клиента)}
+    '''
+    make = payloads if callable(payloads) else lambda k: payloads[k % len(payloads)]
+    counter = iter(range(requests))
+    latency, errors = [], [0]
+
+    async def client():
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for k in counter:
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, 'POST', '/calc', make(k))
+                latency.append(time.perf_counter()-start)
+                errors[0] += status!=200
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter()-start
+    result = {'requests': len(latency), 'errors': errors[0], 'time': elapsed,
+              'throughput': len(latency)/elapsed if elapsed else 0}
+    result.update(_percentiles(latency))
+    return result
+
+
+async def _bench(args):
+    '''Измерение задержки сервиса на синтетической схеме (nrs_bench) с пакетами и без'''
+    from nrs_bench.generators import GENERATORS, build_model
+    _, roots = GENERATORS[args.case](args.size)
+    model = build_model(roots)
+    # Напоры всех насосов меняются в запросах на общий множитель - расходы всех стволов зависят от запроса
+    pumps = [elmnt for elmnt in model.elmnts_in if elmnt.type==EType.PUMP]
+    nozzles = [elmnt.name for elmnt in model.elmnts_out]
+    rng = np.random.default_rng(0)
+    factors = rng.uniform(0.9, 1.1, args.requests)
+
+    def payload(k):
+        return {'template': 'bench', 'params': {f'{pump.name}.H_add': pump.H_add*float(factors[k]) for pump in pumps},
+                'elements': nozzles[:5], 'accuracy': 0.01}
+
+    rows = []
+    for label, max_batch in (('batched', args.max_batch), ('single', 1)):
+        service = NRS_Service({'bench': model}, workers=args.workers, window=args.window, max_batch=max_batch)
+        await service.start(port=0)
+        try:
+            result = await load_test(payload, port=service.port, clients=args.clients, requests=args.requests)
+        finally:
+            await service.stop()
+        result['mode'] = label
+        result['mean_batch'] = service.stats()['mean_batch']
+        rows.append(result)
+    print(f'Схема {args.case}:{args.size}, элементов: {len(model.elmnts)}, клиентов: {args.clients}, '
+          f'исполнителей: {args.workers}')
+    print(f'{"mode":>8} {"requests":>9} {"errors":>7} {"req/s":>9} {"batch":>7} {"p50, мс":>9} {"p99, мс":>9}')
+    for row in rows:
+        print(f'{row["mode"]:>8} {row["requests"]:>9} {row["errors"]:>7} {row["throughput"]:>9.1f} '
+              f'{row["mean_batch"]:>7.1f} {row["p50"]:>9.2f} {row["p99"]:>9.2f}')
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nrs_service', description='Локальный сервис расчета НРС')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='запуск сервиса')
+    serve.add_argument('--template', action='append', default=[], metavar='ИМЯ=ПУТЬ',
+                       help='шаблон: имя и путь к файлу модели (NRS_Model.save)')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--socket', help='путь к сокету Unix (вместо TCP)')
+    bench = commands.add_parser('bench', help='измерение задержки под нагрузкой')
+    bench.add_argument('--case', default='dag', help='генератор схемы nrs_bench')
+    bench.add_argument('--size', type=int, default=300, help='размер схемы')
+    bench.add_argument('--clients', type=int, default=32, help='количество одновременных клиентов')
+    bench.add_argument('--requests', type=int, default=2000, help='количество запросов')
+    bench.add_argument('--max-batch', type=int, default=256, help='наибольший размер пакета')
+    for sub in (serve, bench):
+        sub.add_argument('--workers', type=int, default=None, help='количество процессов-исполнителей')
+        sub.add_argument('--window', type=float, default=0.002, help='окно ожидания пакета, с')
+    args = parser.parse_args(argv)
+
+    if args.command=='bench':
+        args.workers = (os.cpu_count() or 1) if args.workers is None else args.workers
+        asyncio.run(_bench(args))
+        return 0
+    templates = dict(spec.split('=', 1) for spec in args.template)
+    service = NRS_Service(templates, workers=args.workers, window=args.window)
+    print(f'Сервис НРС: {args.socket or f"http://{args.host}:{args.port}"}, шаблоны: {", ".join(templates) or "-"}')
+    service.run(args.host, args.port, args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
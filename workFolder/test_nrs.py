@@ -0,0 +1,563 @@
+'''
+Проверки расчета НРС: сверка с эталоном, метод Ньютона и ускорение итераций, контуры,
+сохранение модели, кэш решений, оптимизатор, сервис расчета, пакетное создание модели,
+проверка и очистка модели, обратная задача, продолжение по параметру, перебор, расчет во времени,
+запись результатов, наблюдатели и табличные данные.
+Запуск: python -m pytest -q (из каталога workFolder), без долгих проверок: -m "not slow"
+'''
+import asyncio
+import itertools
+import pickle
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+from nrs import *
+from nrs_bench import GENERATORS, build_model, check_reference, ring_main
+from nrs_optimizer import NRS_Optimizer
+from nrs_service import NRS_Service
+
+
+@pytest.fixture(autouse=True)
+def _quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def bench_model(name, size):
+    '''Модель синтетической схемы nrs_bench'''
+    return build_model(GENERATORS[name](size)[1])
+
+
+def parallel_lines():
+    '''Насос -> разветвление -> две параллельные линии разного диаметра -> водосборник -> ствол'''
+    pump = Element('Н', EType.PUMP, H_add=80)
+    splitter = Element('Р', EType.CONNECTOR, ro=2)
+    line_1 = Element('Л1', EType.CONNECTOR, s=NRS_Data.ss['77'], n=2, l=20)
+    line_2 = Element('Л2', EType.CONNECTOR, s=NRS_Data.ss['51'], n=4, l=20)
+    joiner = Element('ВС', EType.CONNECTOR, ri=2)
+    nozzle = Element('Ств', EType.NOZZLE, p=3.6, q_out=q_out_nozzle)
+    pump.append(splitter)
+    splitter.append(line_1).append(joiner)
+    splitter.append(line_2).append(joiner)
+    joiner.append(nozzle)
+    model = NRS_Model('Параллельные линии')
+    model.build(pump)
+    return model
+
+
+def standard(H_add=80):
+    '''Насос -> магистральная линия -> разветвление -> две рабочие линии со стволами'''
+    pump = Element('Н', EType.PUMP, H_add=H_add)
+    hose = Element('МРЛ', EType.CONNECTOR, s=NRS_Data.ss['77'], n=4, l=20)
+    splitter = Element('Р', EType.CONNECTOR, ro=2)
+    pump.append(hose).append(splitter)
+    for k in range(2):
+        line = Element(f'РРЛ{k}', EType.CONNECTOR, s=NRS_Data.ss['51'], n=2)
+        line.append(Element(f'Ств{k}', EType.NOZZLE, p=NRS_Revision.calc_p(3.7, 40), q_out=q_out_nozzle))
+        splitter.append(line)
+    model = NRS_Model('Типовая')
+    model.build(pump)
+    return model, pump, hose
+
+
+#=======================Итерационный расчет и метод Ньютона===============================
+def test_reference():
+    assert check_reference()==[]
+
+
+@pytest.mark.parametrize('name, size', [('relay', 10), ('tree', 3)])
+def test_newton_matches_iter(name, size):
+    model = bench_model(name, size)
+    model.drop_q()
+    model.calc(accuracy=1e-9, fixStates=False, incremental=False)
+    expected = [elmnt.q for elmnt in model.elmnts]
+    model.drop_q()
+    _, result = model.calc(method='newton', accuracy=1e-9, fixStates=False)
+    assert result['correct']
+    assert np.allclose([elmnt.q for elmnt in model.elmnts], expected, atol=1e-5)
+
+
+def test_newton_default_converges():
+    model = bench_model('relay', 10)
+    model.drop_q()
+    _, result = model.calc(method='newton', fixStates=False)
+    assert result['stop']=='converged' and result['correct'] and result['iters']>1
+    assert result['QD2']<=NRS_Newton.accuracy
+
+
+def test_newton_fixed_steps_judged_by_residual():
+    model = bench_model('relay', 10)
+    model.drop_q()
+    _, result = model.calc(method='newton', iters=2, fixStates=False)
+    assert result['iters']==2 and not result['correct']
+    _, result = model.calc(method='newton', iters=20, fixStates=False)
+    assert result['correct']
+
+
+def test_residuals():
+    model = bench_model('relay', 10)
+    model.drop_q()
+    _, result = model.calc(iters=3, fixStates=False)
+    assert np.abs(result.residuals()['q']).max()>1e-3
+    _, result = model.calc(accuracy=1e-9, fixStates=False, incremental=False)
+    assert np.abs(result.residuals()['q']).max()<1e-6
+
+
+def monitor_line(H_add=100, q=20):
+    '''Насос -> рукавная линия 66 мм x5 -> лафетный ствол (при большом расходе проходы без ускорения дают отрицательный напор)'''
+    pump = Element('Н', EType.PUMP, H_add=H_add)
+    hose = Element('РЛ', EType.CONNECTOR, s=NRS_Data.ss['66'], n=5)
+    nozzle = Element('ЛС', EType.NOZZLE, p=NRS_Revision.calc_p(q, 40), q_out=q_out_nozzle)
+    pump.append(hose).append(nozzle)
+    return NRS_Model('Лафетный ствол').build(pump), nozzle
+
+
+@pytest.mark.parametrize('accelerate', ['relax', 'aitken', 'anderson'])
+def test_accelerate_where_passes_fail(accelerate):
+    model, nozzle = monitor_line()
+    model.drop_q()
+    with pytest.raises(ValueError, match='меньше 0'):
+        model.calc(accuracy=1e-3, fixStates=False)
+    model.drop_q()
+    model.calc(method='newton', accuracy=1e-9, fixStates=False)
+    expected = nozzle.q
+    model.drop_q()
+    _, result = model.calc(accuracy=1e-3, fixStates=False, accelerate=accelerate)
+    assert result['correct'] and nozzle.q==pytest.approx(expected, abs=1e-2)
+
+
+def _pick(model, e_type, k):
+    return [elmnt for elmnt in model.elmnts if elmnt.type==e_type][k]
+
+
+@pytest.mark.parametrize('name, size', [('relay', 10), ('tree', 3), ('joiner', 5)])
+@pytest.mark.parametrize('edit', [
+    lambda model: _pick(model, EType.PUMP, 0).set_H_add(_pick(model, EType.PUMP, 0).H_add+10),
+    lambda model: setattr(_pick(model, EType.CONNECTOR, -1), 'n', _pick(model, EType.CONNECTOR, -1).n+3),
+    lambda model: setattr(_pick(model, EType.NOZZLE, 0), 'p', 0),
+    lambda model: setattr(_pick(model, EType.CONNECTOR, 1), 'z', 3),
+    lambda model: setattr(_pick(model, EType.CONNECTOR, 0), 's', _pick(model, EType.CONNECTOR, 0).s/2),
+], ids=['H_add', 'n', 'p=0', 'z', 's'])
+def test_incremental_matches_full(name, size, edit):
+    accuracy = 1e-6
+    model = bench_model(name, size)
+    model.calc(accuracy=accuracy, fixStates=False)
+    full = pickle.loads(pickle.dumps(model))
+    edit(model)
+    edit(full)
+    model.calc(accuracy=accuracy, fixStates=False, incremental=True)
+    full.calc(accuracy=accuracy, fixStates=False, incremental=False)
+    for elmnt, expected in zip(model.elmnts, full.elmnts):
+        assert elmnt.q==pytest.approx(expected.q, abs=10*accuracy)
+        assert elmnt.H_in==pytest.approx(expected.H_in, abs=1e-3)
+
+
+#=======================Замкнутые контуры===============================
+def test_parallel_lines_loop():
+    model = parallel_lines()
+    assert model.get_plan().cyclic
+    assert {elmnt.name for elmnt in model.find_cycle()}=={'Р', 'Л1', 'Л2', 'ВС'}
+    _, result = model.calc()
+    assert result['correct'] and result['stop']=='converged'
+    line_1, line_2 = model.getElement('Л1'), model.getElement('Л2')
+    # Напоры на входе водосборника совпадают, расход делится по сопротивлениям линий
+    assert line_1.H_out==pytest.approx(line_2.H_out, abs=1e-6)
+    assert line_1.q>2*line_2.q
+    assert line_1.q+line_2.q==pytest.approx(model.summaryQ(), abs=1e-6)
+
+
+def test_parallel_lines_batch():
+    model = parallel_lines()
+    res, info = model.calc_batch({'Н.H_add': [70.0, 90.0]}, accuracy=1e-6)
+    assert info['correct'].all()
+    for k, H_add in enumerate((70.0, 90.0)):
+        model.getElement('Н').H_add = H_add
+        model.calc(accuracy=1e-6, fixStates=False)
+        assert res['Л1']['q'][k]==pytest.approx(model.getElement('Л1').q, abs=1e-6)
+
+
+def test_parallel_lines_explicit_iter():
+    model = parallel_lines()
+    model.getElement('Ств').p = 1.0
+    _, result = model.calc(method='iter', accuracy=1e-6)
+    assert result['stop']=='converged'
+    # Проходы делят расход поровну между параллельными линиями
+    assert model.getElement('Л1').q==pytest.approx(model.getElement('Л2').q)
+
+
+def test_parallel_lines_custom_q_out():
+    model = parallel_lines()
+    nozzle = model.getElement('Ств')
+    nozzle.p = 1.0
+    nozzle.q_out = lambda elmnt: elmnt.p*elmnt.H_in**0.5
+    with pytest.warns(Warning, match='не поддерживает функцию расхода элемента Ств'):
+        _, result = model.calc(accuracy=1e-6)
+    assert result['stop']=='converged' and model.summaryQ()>0
+    res, info = model.calc_batch({'Н.H_add': [70.0, 90.0]})
+    assert info['correct'].all()
+
+
+def test_ring_rejects_iter():
+    model = build_model(ring_main(10)[1])
+    with pytest.raises(ValueError, match='замкнутый контур'):
+        model.calc(method='iter')
+    _, result = model.calc(fixStates=False)
+    assert result['correct']
+
+
+def test_bench_generators_acyclic():
+    for name, size in [('relay', 10), ('tree', 3), ('joiner', 5), ('dag', 300)]:
+        assert not bench_model(name, size).get_plan().cyclic
+    assert bench_model('ring', 10).get_plan().cyclic
+
+
+@pytest.mark.slow
+def test_long_chain_without_recursion():
+    '''Цепочка из 100 тыс. элементов: построение, расчет, распространение по графу и удаление'''
+    limit = sys.getrecursionlimit()
+    assert limit==1000
+    size = 100_000
+    pump = Element('Н', EType.PUMP, H_add=80)
+    last = pump
+    for k in range(size):
+        last = last.append(Element(f'РЛ{k}', EType.CONNECTOR, s=1e-7))
+    nozzle = last.append(Element('Ств', EType.NOZZLE, p=NRS_Revision.calc_p(3.7, 40), q_out=q_out_nozzle))
+    model = NRS_Model('Цепочка').build(pump)
+    assert len(model.elmnts)==size+2
+    _, result = model.calc(accuracy=1e-6, fixStates=False)
+    assert result['correct'] and nozzle.H_in==pytest.approx(80-nozzle.q**2*1e-7*size, abs=1e-3)
+    pump.set_H_in(5)
+    assert nozzle.H_in==pytest.approx(85-nozzle.q**2*1e-7*size, abs=1e-3)
+    nozzle.set_q_zero()
+    assert pump.q==0
+    model.delElement(model.getElement(f'РЛ{size//2}'), fire_dead_elements=False)
+    assert len(model.elmnts)==size+1
+    assert len(model.prune()['removed'])==size+1 and not model.elmnts
+    assert sys.getrecursionlimit()==limit
+
+
+#=======================Сохранение и кэш===============================
+@pytest.mark.parametrize('suffix', ['json', 'npz'])
+def test_save_load_roundtrip(tmp_path, suffix):
+    model = bench_model('dag', 300)
+    model.drop_q()
+    model.calc(accuracy=1e-6, fixStates=False)
+    path = str(tmp_path/f'model.{suffix}')
+    model.save(path)
+    loaded = NRS_Model.load(path)
+    assert [elmnt.name for elmnt in loaded.elmnts]==[elmnt.name for elmnt in model.elmnts]
+    for a, b in zip(model.elmnts, loaded.elmnts):
+        assert [e.name for e in a.elements_next]==[e.name for e in b.elements_next]
+        assert a.q==pytest.approx(b.q) and a.H_in==pytest.approx(b.H_in)
+    model.drop_q()
+    loaded.drop_q()
+    model.calc(accuracy=1e-6, fixStates=False)
+    loaded.calc(accuracy=1e-6, fixStates=False)
+    assert loaded.summaryQ()==pytest.approx(model.summaryQ(), abs=1e-9)
+
+
+def test_cache_invalidation():
+    model, pump, hose = standard()
+    cache = model.cache_solutions(4)
+    _, result = model.calc(accuracy=1e-4)
+    assert not result['cached']
+    Q = model.summaryQ()
+    model.drop_q()
+    _, result = model.calc(accuracy=1e-4)
+    assert result['cached'] and model.summaryQ()==pytest.approx(Q)
+    signature = model.signature()
+    hose.n = 5
+    assert model.signature()!=signature
+    _, result = model.calc(accuracy=1e-4)
+    assert not result['cached'] and model.summaryQ()<Q
+    hose.n = 4
+    assert model.signature()==signature
+    assert cache.stats()['hits']==1
+
+
+#=======================Оптимизатор===============================
+def test_optimizer_matches_brute_force():
+    P_B, P_A = NRS_Revision.calc_p(3.7, 40), NRS_Revision.calc_p(7.4, 40)
+    pump = Element('Н1', EType.PUMP, H_add=80)
+    r1 = Element('Р1', EType.CONNECTOR, ro=2)
+    r2 = Element('Р2', EType.CONNECTOR, ro=3)
+    r3 = Element('Р3', EType.CONNECTOR, ro=2)
+    pump.append(Element('МРЛ1', EType.CONNECTOR, s=NRS_Data.ss['77'], n=4)).append(r1)
+    r1.append(Element('МРЛ2', EType.CONNECTOR, s=NRS_Data.ss['77'], n=3)).append(r2)
+    r1.append(Element('МРЛ3', EType.CONNECTOR, s=NRS_Data.ss['77'], n=5)).append(r3)
+    k = 0
+    for splitter, count, p in ((r2, 3, P_B), (r3, 2, P_A)):
+        for _ in range(count):
+            k += 1
+            line = splitter.append(Element(f'РРЛ{k}', EType.CONNECTOR, s=NRS_Data.ss['51'], n=2))
+            line.append(Element(f'Ств{k}', EType.NOZZLE, p=p, q_out=q_out_nozzle))
+    model = NRS_Model('Оптимизация')
+    model.build(pump)
+    lines = {f'МРЛ{k}': ('66', '77', '89') for k in range(1, 4)}
+    lines.update({f'РРЛ{k}': ('51', '66') for k in range(1, 6)})
+    inventory = {'89': 6, '77': 7, '66': 12}
+
+    best, _ = NRS_Optimizer(model, 'Н1', lines, inventory=inventory, min_H=40).run()
+    brute = NRS_Optimizer(model, 'Н1', lines, inventory=inventory, min_H=40)
+    choices = [c for c in itertools.product(*[range(len(o)) for o in brute.options])
+               if brute._fits(brute._usage(c))]
+    assert best['head']==pytest.approx(min(brute.evaluate(choices)), abs=1e-6)
+    assert best['head']==pytest.approx(69.836, abs=1e-3)
+
+
+#=======================Сервис расчета===============================
+def test_service_coalescing():
+    model = bench_model('dag', 300)
+    pumps = [elmnt.name for elmnt in model.elmnts_in if elmnt.type==EType.PUMP]
+    nozzle = model.elmnts_out[0].name
+    heads = [70.0, 90.0]
+    expected, _ = model.calc_batch({f'{name}.H_add': heads for name in pumps}, accuracy=0.01)
+
+    async def run():
+        service = NRS_Service({'dag': model}, workers=0)
+        await service.start(port=0)
+        try:
+            return await asyncio.gather(*(
+                service.calc({'template': 'dag', 'params': {f'{name}.H_add': H for name in pumps},
+                              'elements': [nozzle], 'accuracy': 0.01})
+                for H in heads*10))
+        finally:
+            await service.stop()
+
+    answers = asyncio.run(run())
+    assert max(answer['batch'] for answer in answers)>1
+    for k, answer in enumerate(answers):
+        assert answer['elements'][nozzle]['q']==pytest.approx(expected[nozzle]['q'][k%2])
+
+
+def test_service_loop_template():
+    model = parallel_lines()
+
+    async def run():
+        service = NRS_Service({'par': model}, workers=0)
+        await service.start(port=0)
+        try:
+            return await service.calc({'template': 'par', 'accuracy': 1e-6})
+        finally:
+            await service.stop()
+
+    answer = asyncio.run(run())
+    model.calc(fixStates=False)
+    assert answer['correct'] and answer['Q']==pytest.approx(model.summaryQ(), abs=1e-4)
+
+
+#=======================Пакетное создание модели===============================
+def test_from_edges_roundtrip():
+    model = bench_model('joiner', 5)
+    model.drop_q()
+    model.calc(accuracy=1e-6, fixStates=False)
+    nodes, edges = model.to_edges()
+    built = NRS_Model.from_edges(nodes, edges)
+    built.calc(accuracy=1e-6, fixStates=False)
+    assert [elmnt.name for elmnt in built.elmnts]==[elmnt.name for elmnt in model.elmnts]
+    assert built.summaryQ()==pytest.approx(model.summaryQ(), abs=1e-6)
+
+
+def test_from_edges_names():
+    with pytest.raises(ValueError, match='столбец name'):
+        NRS_Model.from_edges({'type': ['PUMP', 'NOZZLE']}, [])
+    with pytest.raises(ValueError, match='нет имен в строках: 0'):
+        NRS_Model.from_edges([{'type': 'PUMP'}, {'name': 'b', 'type': 'NOZZLE'}], [])
+    with pytest.raises(ValueError, match='не уникальны: a'):
+        NRS_Model.from_edges([{'name': 'a', 'type': 'PUMP'}, {'name': 'a', 'type': 'NOZZLE'}], [])
+
+
+#=======================Хранилище элементов===============================
+def test_element_copy_does_not_share_slot():
+    import copy
+    import gc
+    elmnt = Element('А', EType.PUMP, H_add=5)
+    duplicate = copy.copy(elmnt)
+    duplicate.H_add = 7
+    assert elmnt.H_add==5 and duplicate.name=='А'
+    del duplicate
+    gc.collect()
+    other = Element('Б', EType.PUMP, H_add=3)
+    elmnt.H_add = 1
+    assert other.H_add==3
+
+
+class PlainElement:
+    '''Элемент стороннего класса с обычными атрибутами (без хранилища и ссылки на модель)'''
+    def __init__(self, name, e_type, s=0, H_add=0, p=1, n=1, q_out=q_out_simple):
+        self.name, self.type = name, e_type
+        self.q, self.s, self.H_in, self.h, self.H_add, self.z, self.p, self.n, self.l = 3.7, s, 0, 0, H_add, 0, p, n, 0
+        self.q_out, self.observer, self.ri, self.ro = q_out, None, 1, 1
+        self.elements_next, self.elements_previous = [], []
+
+    def append(self, elmnt):
+        self.elements_next.append(elmnt)
+        elmnt.elements_previous.append(self)
+        return elmnt
+
+    def get_h(self):
+        self.h = self.s*self.n*self.q**2
+        return self.h
+
+    def get_H_out(self, approved_H=120):
+        self.H_out = self.H_in + self.H_add - self.get_h() - self.z
+        return self.H_out
+
+    def get_q_out(self):
+        return self.q_out(self)
+
+    def fixState(self):
+        return self
+
+    def observerInit(self):
+        return self
+
+
+@pytest.mark.parametrize('cls', [Element, PlainElement])
+def test_foreign_elements(cls):
+    p = NRS_Revision.calc_p(3.7, 40)
+    pump = cls('Н', EType.PUMP, H_add=60)
+    hose = cls('РЛ', EType.CONNECTOR, s=NRS_Data.ss['51'], n=5)
+    nozzle = cls('Ств', EType.NOZZLE, p=p, q_out=q_out_nozzle)
+    pump.append(hose).append(nozzle)
+    model = NRS_Model('Сторонние элементы').build(pump)
+    assert len(model.elmnts)==3 and model._contains(hose)
+    model.calc(accuracy=1e-6, fixStates=False)
+    assert nozzle.q==pytest.approx(p*nozzle.H_in**0.5, abs=1e-4)
+    model.delElement(nozzle)
+    assert not model._contains(nozzle) and not model.elmnts
+
+
+#=======================Проверка и очистка модели===============================
+def test_validate_and_prune():
+    pump = Element('Н', EType.PUMP)
+    hose = Element('А', EType.CONNECTOR)
+    nozzle = Element('С', EType.NOZZLE)
+    pump.append(hose).append(nozzle)
+    dead = Element('X', EType.CONNECTOR)
+    pump_2 = Element('Н2', EType.PUMP)
+    loop_1 = Element('К1', EType.CONNECTOR, ri=2)
+    loop_2 = Element('К2', EType.CONNECTOR)
+    pump_2.append(loop_1).append(loop_2).append(loop_1)
+    extra = Element('D', EType.CONNECTOR)
+    hose.elements_next.append(extra)
+    extra.elements_previous.append(hose)
+    model = NRS_Model('Проверка')
+    model.addElements([pump, hose, nozzle, dead, pump_2, loop_1, loop_2, extra], interpretate=False)
+    report = model.validate()
+    assert not report['ok']
+    assert sorted(report['dead'])==['D', 'X'] and report['overloaded']==[('А', 'ro', 2, 1)]
+    assert [sorted(cycle) for cycle in report['cycles']]==[['К1', 'К2']]
+    result = model.prune(components='inactive', overloaded=True)
+    assert sorted(result['removed'])==['D', 'X', 'К1', 'К2', 'Н2'] and result['unlinked']==1
+    assert [elmnt.name for elmnt in model.elmnts]==['Н', 'А', 'С'] and model.validate()['ok']
+
+
+#=======================Обратная задача, продолжение по параметру и перебор===============================
+def test_solve_inverse():
+    model, pump, _ = standard(H_add=50)
+    nozzle = model.getElement('Ств0')
+    heads, info = model.solve_inverse({'Ств0': 3.7})
+    assert info['status']=='ok' and info['correct']
+    assert nozzle.q==pytest.approx(3.7, abs=0.01) and pump.H_add==heads['Н']
+    _, info = model.solve_inverse({'Ств0': {'H_in': 60}})
+    assert info['correct'] and nozzle.H_in==pytest.approx(60, abs=0.01)
+    heads, info = model.solve_inverse({'Ств0': 20})
+    assert info['status']=='bounds' and not info['correct'] and heads['Н']==120
+
+
+def test_continuation_boundary():
+    pump = Element('Н1', EType.PUMP, H_add=80)
+    hose = Element('МРЛ', EType.CONNECTOR, s=0.09, n=3)
+    splitter = Element('Р1', EType.CONNECTOR, ro=2)
+    pump.append(hose).append(splitter)
+    for k, q in enumerate((2, 8)):
+        line = Element(f'РРЛ{k}', EType.CONNECTOR, s=0.09)
+        line.append(Element(f'С{k}', EType.NOZZLE, p=NRS_Revision.calc_p(q, 40), q_out=q_out_nozzle))
+        splitter.append(line)
+    model = NRS_Model('Продолжение').build(pump)
+    res, info = model.continuation('МРЛ.n', np.arange(1, 30))
+    assert [(b['status'], b['value']>b['last']) for b in info['boundary']]==[('unstable', True), ('infeasible', True)]
+    status = list(info['status'])
+    first_bad = status.index(info['boundary'][0]['status'])
+    assert set(status[:first_bad])=={'ok'} and status[-1]=='infeasible'
+    assert np.isnan(res['С0']['q'][-1]) and not np.isnan(res['С0']['q'][0])
+
+
+def test_sweep_workers():
+    model, _, _ = standard()
+    grid = {'Н.H_add': np.linspace(40, 90, 30), 'РРЛ0.n': [1, 2, 3]}
+    single, info = model.sweep(grid, workers=1, chunk=20, accuracy=0.001)
+    parallel, info_parallel = model.sweep(grid, workers=3, chunk=20, accuracy=0.001)
+    assert len(info['correct'])==90 and info['correct'].all()
+    for name in single:
+        assert np.array_equal(single[name]['q'], parallel[name]['q'], equal_nan=True)
+    assert np.array_equal(info['iters'], info_parallel['iters'])
+
+
+#=======================Расчет во времени и запись результатов===============================
+def _schedule():
+    return {'Н.H_add': [(0, 60), (30, 90)], 'Ств1.p': lambda x: 0 if x>=40 else NRS_Revision.calc_p(3.7, 40)}
+
+
+def test_simulate():
+    model, _, _ = standard()
+    t = np.arange(50)
+    res, info = model.simulate(_schedule(), t, accuracy=0.001)
+    assert set(info['status'])=={'ok'}
+    assert res['Ств1']['q'][45]==0 and res['Ств1']['q'][0]>0
+    reference, _, _ = standard()
+    for k in (0, 20, 45):
+        reference.getElement('Н').H_add = np.interp(t[k], [0, 30], [60, 90])
+        reference.getElement('Ств1').p = 0 if t[k]>=40 else NRS_Revision.calc_p(3.7, 40)
+        reference.drop_q()
+        reference.calc(accuracy=0.001, fixStates=False, incremental=False)
+        for elmnt in reference.elmnts:
+            assert res[elmnt.name]['q'][k]==pytest.approx(elmnt.q, abs=0.01)
+
+
+@pytest.mark.parametrize('path', ['sim.csv', 'sim_npy', 'sim.npz'])
+def test_result_sink(tmp_path, path):
+    t = np.arange(50)
+    model, _, _ = standard()
+    expected, _ = model.simulate(_schedule(), t, accuracy=0.001)
+    model, _, _ = standard()
+    path = str(tmp_path/path)
+    with NRS_ResultSink(path, model, columns=('q', 'H_in'), fields=('t', 'correct'), chunk=16) as sink:
+        model.simulate(_schedule(), t, accuracy=0.001, sink=sink)
+    loaded = NRS_ResultSink.load(path)
+    assert loaded.fmt==('npy' if path.endswith('npy') else path.rsplit('.', 1)[1])
+    assert len(loaded)==len(t) and loaded.fields==('t', 'correct')
+    assert np.array_equal(loaded['t'], t) and loaded['correct'].all()
+    assert np.allclose(loaded['Ств1.q'], expected['Ств1']['q'])
+    assert loaded['q'].shape==(len(t), len(model.elmnts))
+    assert sum(len(chunk['t']) for chunk in loaded.chunks(20))==len(t)
+
+
+#=======================Наблюдатели===============================
+def test_ring_observer_wraparound():
+    elmnt = Element('Н', EType.PUMP)
+    observer = NRS_Observer_Ring(elmnt, ['H_add', 'q'], maxlen=4, stride=2)
+    for k in range(11):
+        elmnt.H_add = k
+        observer.fix()
+    # зафиксированы состояния 0, 2, ..., 10, в истории - последние 4 по порядку
+    assert list(elmnt.history()['H_add'])==[4, 6, 8, 10]
+    assert len(elmnt.history()['q'])==4
+    observer.par_dict_init()
+    assert len(elmnt.history()['H_add'])==0
+
+
+#=======================Табличные данные===============================
+def test_calc_h_calc_p_arrays():
+    assert NRS_Revision.calc_p(3.7, 40)==pytest.approx(0.58502137)
+    assert np.allclose(NRS_Revision.calc_p([3.7, 7.4], 40), [0.58502137, 1.17004273])
+    assert np.allclose(NRS_Revision.calc_p(3.7, [40, 10]), 3.7/np.sqrt([40, 10]))
+    assert NRS_Revision.calc_h(6, 0.13, 7.4)==pytest.approx(42.7128)
+    assert NRS_Revision.calc_h(6, '51', 7.4)==pytest.approx(42.7128)
+    assert np.allclose(NRS_Revision.calc_h([6, 4], ['51', '77'], 7.4), [42.7128, 3.2856])
+    assert np.allclose(NRS_Revision.calc_h(2, NRS_Data.ss['77'], np.array([1, 2, 3])), 2*0.015*np.array([1, 4, 9]))